@@ -13,4 +13,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PrjRecept.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после инициализации Django
+from django.conf import settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from recept import events, warmup  # noqa: E402
+
+EVENTS_PATH = reverse('events')
+
+# Прогрев только в процессе сервера: ready() выполняется и для migrate, test и прочих команд
+if settings.WARMUP_ON_START:
+    warmup.run(database=False)
+
+
+async def application(scope, receive, send):
+    # Поток уведомлений обслуживается без обработчика Django (см. recept/events.py)
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        return await events.asgi_app(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -25,6 +25,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'recept.middleware.MetricsMiddleware',
+    'recept.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -32,13 +34,73 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'recept.middleware.QueryInspectorMiddleware',
 ]
 
+# Поиск N+1: по умолчанию работает только при DEBUG
+QUERY_INSPECTOR_ENABLED = DEBUG
+QUERY_INSPECTOR_REPEAT_THRESHOLD = 5
+
+# Server-Timing: доля запросов с замерами (0 - выключено, 1 - все запросы)
+SERVER_TIMING_SAMPLE_RATE = 1.0 if DEBUG else 0.01
+SERVER_TIMING_HEADER = True
+
+# Метрики Prometheus: /metrics/ доступен только с этих адресов.
+# Для gunicorn/uwsgi с несколькими воркерами задайте METRICS_DIR (общий каталог снимков).
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Очередь модерации: размер пачки и срок аренды рецептов модератором
+MODERATION_BATCH_SIZE = 20
+MODERATION_LEASE_MINUTES = 15
+
+# Отзывы: не больше N записей отзыва одним пользователем за окно в секундах
+REVIEW_THROTTLE_RATE = (5, 60)
+
+# Поток уведомлений /events/ (ASGI): период опроса таблицы уведомлений и keepalive, в секундах
+EVENTS_POLL_INTERVAL = 2.0
+EVENTS_KEEPALIVE = 20.0
+
+# Кеш результатов поиска в каталоге (в памяти процесса): число запросов, суммарное число id
+# и срок жизни записи в секундах
+SEARCH_CACHE_ENTRIES = 512
+SEARCH_CACHE_IDS = 1_000_000
+SEARCH_CACHE_TTL = 300
+
+# Кеш страниц для анонимов: сколько секунд копия свежая и сколько ещё отдаётся устаревшей,
+# и сколько секунд запрос без копии ждёт рендеринга, начатого другим запросом
+PAGE_CACHE_TTL = 60
+PAGE_CACHE_STALE = 3600
+PAGE_CACHE_WAIT = 2.0
+
+# Журнал медленных запросов с EXPLAIN (None - выключен)
+SLOW_QUERY_THRESHOLD_MS = 100
+
+# Django admin: начиная с этого размера таблицы списки показывают оценку числа строк
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+
+# Фоновые задачи (manage.py run_worker): период постановки в секундах и число попыток
+PERIODIC_TASKS = {
+    'stats.rollup': 300,
+    'homefeed.build': 600,
+}
+TASK_MAX_ATTEMPTS = 3
+# Задача без отметки воркера (захват, report_progress) дольше этого срока возвращается в очередь
+TASK_LEASE_SECONDS = 900
+
+# Фоновое удаление пользователей и рецептов: строк в одной транзакции
+DELETION_CHUNK_SIZE = 500
+
+# Прогрев при загрузке wsgi.py/asgi.py (recept/warmup.py): шаблоны, маршруты, формы, метаданные моделей.
+# Шаг с базой выполняет хук post_worker_init в gunicorn.conf.py
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START') == '1'
+
 ROOT_URLCONF = 'PrjRecept.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'recept.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
         'APP_DIRS': True,
@@ -98,6 +160,30 @@ AUTH_USER_MODEL = 'recept.User'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'recept.instrumentation.TimedFileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'recept.queries': {'handlers': ['console'], 'level': 'WARNING'},
+        'recept.slowlog': {'handlers': ['console'], 'level': 'WARNING'},
+        'recept.tasks': {'handlers': ['console'], 'level': 'WARNING'},
+        # Структурные логи замеров включаются через SERVER_TIMING_LOG_LEVEL=INFO
+        'recept.timing': {'handlers': ['console'], 'level': os.environ.get('SERVER_TIMING_LOG_LEVEL', 'WARNING')},
+    },
+}
+
 AUTH_USER_MODEL = 'recept.User'
 
 
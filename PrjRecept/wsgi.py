@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PrjRecept.settings')
 
 application = get_wsgi_application()
+
+# Прогрев только в процессе сервера: ready() выполняется и для migrate, test и прочих команд
+from django.conf import settings  # noqa: E402
+
+if settings.WARMUP_ON_START:
+    from recept import warmup
+    warmup.run(database=False)
@@ -0,0 +1,25 @@
+"""
+Настройки gunicorn: gunicorn -c gunicorn.conf.py PrjRecept.wsgi
+
+С preload_app приложение загружается в мастере, и шаги прогрева без базы
+(WARMUP_ON_START=1, см. PrjRecept/wsgi.py) выполняются один раз до fork.
+
+Шаг caches намеренно выполняется в каждом воркере (post_worker_init), а не в мастере:
+ему нужна база, а соединение, открытое до fork, воркеры унаследовали бы все вместе
+с одним сокетом. Само соединение воркера (подключение, функции SQLite из
+connection_created) - тоже часть прогрева, и у каждого воркера оно своё. Блоки
+главной шаг строит, только если их ещё нет; при одновременном старте воркеров
+повторная сборка безвредна - она идёт в транзакции.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+preload_app = True
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+    from recept import warmup
+    # Шаги без базы при WARMUP_ON_START уже выполнены в мастере до fork
+    warmup.run(offline=not settings.WARMUP_ON_START)
@@ -1,15 +1,67 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
 from .models import (
     User, Recipe, RecipeStep, RecipeIngredient, Review, Favorite,
     Genre, ListIngredient
 )
 
+
+def estimated_count(model, using='default'):
+    """
+    Примерное число строк таблицы без полного COUNT(*):
+    PostgreSQL - статистика планировщика, SQLite - максимальный rowid (по индексу).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для списков админки: для таблицы без фильтров и поиска берёт оценку
+    числа строк, если таблица больше ADMIN_ESTIMATED_COUNT_THRESHOLD; иначе обычный COUNT.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        # Менеджер модели может сам фильтровать (Recipe.objects - без удалённых):
+        # без фильтров админки условие совпадает с условием базового queryset
+        if queryset.query.where == queryset.model._default_manager.all().query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate and estimate >= getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000):
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Не считать всю таблицу второй раз ради «N из M» при фильтрации
+    show_full_result_count = False
+
+
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     model = User
     ordering = ['email']
     list_display = ['email', 'full_name', 'phone_num', 'is_staff']
+    list_filter = ('is_staff', 'is_superuser', 'is_active')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         ('Персональная информация', {'fields': ('full_name', 'phone_num', 'birth_date', 'avatar')}),
@@ -22,35 +74,100 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('email', 'full_name', 'phone_num', 'password', 'password2'),
         }),
     )
-    search_fields = ('email', 'full_name', 'phone_num')
+    # Поиск по началу строки (LIKE без учёта регистра) индексы в SQLite не использует;
+    # поиск по индексам - в списке пользователей сайта (AdminUserFilterForm)
+    search_fields = ('^email', '^full_name', '^phone_num')
+
+
+class PreloadedAutocompleteSelect(AutocompleteSelect):
+    """
+    Автодополнение, которое берёт подпись выбранного значения из уже загруженного
+    объекта (preloaded = {pk: подпись}), а не отдельным запросом на каждую строку инлайна.
+    """
+    preloaded = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = [str(v) for v in value if str(v) not in self.choices.field.empty_values]
+        if not self.preloaded or not all(v in self.preloaded for v in selected):
+            return super().optgroups(name, value, attr)
+        default = (None, [], 0)
+        if not self.is_required:
+            default[1].append(self.create_option(name, '', '', False, 0))
+        for v in selected:
+            default[1].append(self.create_option(name, v, self.preloaded[v], set(selected), len(default[1])))
+        return [default]
+
+
+class RecipeIngredientFormSet(BaseInlineFormSet):
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        ingredient = form.instance.ingredient if form.instance.ingredient_id else None
+        widget = form.fields['ingredient'].widget
+        widget = getattr(widget, 'widget', widget)  # RelatedFieldWidgetWrapper
+        if ingredient and isinstance(widget, PreloadedAutocompleteSelect):
+            widget.preloaded = {str(ingredient.pk): str(ingredient)}
+        return form
 
 
 class RecipeStepInline(admin.TabularInline):
     model = RecipeStep
-    extra = 1 
+    extra = 0
+
+    def get_queryset(self, request):
+        # __str__ шага обращается к рецепту
+        return super().get_queryset(request).select_related('recipe')
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
-    extra = 1
+    formset = RecipeIngredientFormSet
+    extra = 0
+    # Вместо выпадающего списка всех ингредиентов в каждой строке
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'ingredient':
+            kwargs['widget'] = PreloadedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'created_at', 'is_public')
-    list_filter = ('is_public', 'genres', 'user')
-    search_fields = ('title', 'description')
-    inlines = [RecipeStepInline, RecipeIngredientInline] 
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ('title', 'user', 'status', 'created_at', 'is_public')
+    list_select_related = ('user',)
+    list_filter = ('status', 'is_public', 'genres')
+    search_fields = ('title',)
+    autocomplete_fields = ('user', 'genres')
+    raw_id_fields = ('claimed_by',)
+    inlines = [RecipeStepInline, RecipeIngredientInline]
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdmin):
     list_display = ('recipe', 'user', 'rating', 'created_at')
+    list_select_related = ('recipe', 'user')
     list_filter = ('rating',)
+    autocomplete_fields = ('recipe', 'user')
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe', 'added_at')
-    search_fields = ('user__email', 'recipe__title')
+    list_select_related = ('user', 'recipe')
+    # Поиск по началу email/названия: без LIKE '%...%' по двум присоединённым таблицам
+    search_fields = ('^user__email', '^recipe__title')
+    autocomplete_fields = ('user', 'recipe')
+
+
+@admin.register(Genre)
+class GenreAdmin(admin.ModelAdmin):
+    search_fields = ('name',)
+    ordering = ('name',)
 
 
-admin.site.register(Genre)
-admin.site.register(ListIngredient)
+@admin.register(ListIngredient)
+class ListIngredientAdmin(LargeTableAdmin):
+    list_display = ('name', 'calories', 'price', 'piece_weight', 'density')
+    search_fields = ('^name',)
+    ordering = ('name',)
@@ -0,0 +1,307 @@
+"""
+Версионированный API только для чтения (/api/v1/...) для мобильного клиента.
+
+Ответы собираются из values(), без создания экземпляров моделей:
+- ?fields=id,title - только перечисленные поля;
+- ?include=ingredients,steps,genres - связанные данные, ровно один запрос на связь;
+- списки листаются курсором (?cursor=), без OFFSET и COUNT;
+- каждый ответ несёт ETag, при совпадении If-None-Match возвращается 304.
+"""
+import base64
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.http import HttpResponse, HttpResponseNotModified
+from django.views.decorators.http import require_GET
+
+from . import portions, snapshots
+from .models import User, Recipe, RecipeStep, RecipeIngredient, Review, Genre
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Имя поля в ответе -> путь для values()
+RECIPE_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'cover_image': 'cover_image',
+    'video_file': 'video_file',
+    'portions': 'portions',
+    'calories': 'calories',
+    'estimated_cost': 'estimated_cost',
+    'author_id': 'user_id',
+    'author_name': 'user__full_name',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+RECIPE_LIST_DEFAULT = ['id', 'title', 'cover_image', 'portions', 'calories', 'author_id', 'author_name', 'created_at']
+
+REVIEW_FIELDS = {
+    'id': 'id',
+    'rating': 'rating',
+    'comment': 'comment',
+    'author_id': 'user_id',
+    'author_name': 'user__full_name',
+    'created_at': 'created_at',
+}
+
+USER_FIELDS = {
+    'id': 'id',
+    'full_name': 'full_name',
+    'avatar': 'avatar',
+    'date_joined': 'date_joined',
+    'recipes_count': 'recipes_count',
+}
+
+FILE_FIELDS = {'cover_image', 'video_file', 'avatar', 'image'}
+
+
+class ApiError(Exception):
+    pass
+
+
+def json_response(request, data, status=200):
+    """Компактный JSON с ETag по содержимому; 304, если у клиента та же версия."""
+    body = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    if status == 200 and etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, status=status, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+def error_response(request, message, status=400):
+    return json_response(request, {'error': message}, status=status)
+
+
+def api_view(view):
+    """GET-only; ApiError превращается в ответ 400."""
+    @require_GET
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as e:
+            return error_response(request, str(e))
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
+
+
+def selected_fields(request, available, default=None):
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(default or available)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+    # id нужен для курсора и связей
+    return fields if 'id' in fields else ['id'] + fields
+
+
+def selected_includes(request, available, default=()):
+    raw = request.GET.get('include')
+    if raw is None:
+        return list(default)
+    includes = [i.strip() for i in raw.split(',') if i.strip()]
+    unknown = [i for i in includes if i not in available]
+    if unknown:
+        raise ApiError(f'Неизвестные связи: {", ".join(unknown)}')
+    return includes
+
+
+def limit_param(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def id_param(request, name):
+    """Необязательный числовой id из строки запроса."""
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f'{name} должен быть числом')
+
+
+def media_url(name):
+    # Через хранилище: S3 и подобные отдают свои адреса, имена с пробелами экранируются
+    return default_storage.url(name) if name else None
+
+
+def rows(queryset, fields, mapping):
+    """values() с переименованием полей и ссылками на файлы вместо имён."""
+    paths = [mapping[f] for f in fields]
+    result = []
+    for values in queryset.values_list(*paths):
+        row = dict(zip(fields, values))
+        for f in FILE_FIELDS.intersection(fields):
+            row[f] = media_url(row[f])
+        result.append(row)
+    return result
+
+
+# Курсор: непрозрачная строка из (created_at, id) последнего элемента страницы
+
+def encode_cursor(created_at, pk):
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError('Некорректный курсор')
+
+
+def keyset_page(request, queryset, fields, mapping):
+    """Страница по убыванию (created_at, id) и курсор следующей страницы."""
+    limit = limit_param(request)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    queryset = queryset.order_by('-created_at', '-pk')
+    # created_at выбирается всегда, даже если клиент его не просил
+    extra = [] if 'created_at' in fields else ['created_at']
+    items = rows(queryset[:limit + 1], fields + extra, mapping)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]['created_at'], items[-1]['id'])
+    for item in items:
+        for f in extra:
+            del item[f]
+    return items, next_cursor
+
+
+# Связанные данные рецептов: по одному запросу на связь для всей страницы
+
+def include_ingredients(recipe_ids):
+    grouped = defaultdict(list)
+    for recipe_id, ingredient_id, name, quantity, unit in (
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .order_by('pk').values_list('recipe_id', 'ingredient_id', 'ingredient__name', 'quantity', 'unit')
+    ):
+        grouped[recipe_id].append({
+            'ingredient_id': ingredient_id, 'name': name,
+            'quantity': quantity, 'unit': unit, 'unit_display': snapshots.UNITS.get(unit, unit),
+        })
+    return grouped
+
+
+def include_steps(recipe_ids):
+    grouped = defaultdict(list)
+    for recipe_id, order, description, image in (
+        RecipeStep.objects.filter(recipe_id__in=recipe_ids)
+        .order_by('recipe_id', 'order').values_list('recipe_id', 'order', 'description', 'image')
+    ):
+        grouped[recipe_id].append({'order': order, 'description': description, 'image': media_url(image)})
+    return grouped
+
+
+def include_genres(recipe_ids):
+    grouped = defaultdict(list)
+    for recipe_id, genre_id, name in (
+        Recipe.genres.through.objects.filter(recipe_id__in=recipe_ids)
+        .order_by('genre__name').values_list('recipe_id', 'genre_id', 'genre__name')
+    ):
+        grouped[recipe_id].append({'id': genre_id, 'name': name})
+    return grouped
+
+
+RECIPE_INCLUDES = {
+    'ingredients': include_ingredients,
+    'steps': include_steps,
+    'genres': include_genres,
+}
+
+
+def attach_includes(items, includes):
+    ids = [item['id'] for item in items]
+    if not ids:
+        return
+    for name in includes:
+        grouped = RECIPE_INCLUDES[name](ids)
+        for item in items:
+            item[name] = grouped.get(item['id'], [])
+
+
+def published_recipes():
+    return Recipe.objects.filter(status='published')
+
+
+@api_view
+def recipe_list(request):
+    recipes = published_recipes()
+    genre_id, author_id = id_param(request, 'genre'), id_param(request, 'author')
+    if genre_id is not None:
+        recipes = recipes.filter(genres__id=genre_id)
+    if author_id is not None:
+        recipes = recipes.filter(user_id=author_id)
+
+    fields = selected_fields(request, RECIPE_FIELDS, RECIPE_LIST_DEFAULT)
+    includes = selected_includes(request, RECIPE_INCLUDES)
+    items, next_cursor = keyset_page(request, recipes, fields, RECIPE_FIELDS)
+    attach_includes(items, includes)
+    return json_response(request, {'results': items, 'next_cursor': next_cursor})
+
+
+@api_view
+def recipe_detail(request, pk):
+    fields = selected_fields(request, RECIPE_FIELDS)
+    includes = selected_includes(request, RECIPE_INCLUDES, default=RECIPE_INCLUDES)
+    # Документ опубликованного рецепта уже содержит все связи (см. recept/snapshots.py)
+    found = snapshots.fetch(pk)
+    if not found:
+        return error_response(request, 'Рецепт не найден', status=404)
+    document = found[0]
+    item = {key: document[key] for key in fields + includes}
+    # ?portions=N&units=metric|mass - пересчёт ингредиентов (см. recept/portions.py)
+    portions_count = portions.parse_portions(request.GET.get('portions'), document['portions'] or 1)
+    system = portions.parse_system(request.GET.get('units'))
+    if 'ingredients' in item:
+        item['ingredients'] = portions.scaled_ingredients(document, portions_count, system)
+        item['portions'] = portions_count
+    return json_response(request, item)
+
+
+@api_view
+def recipe_reviews(request, pk):
+    # Отзывы только к опубликованным рецептам; проверка - подзапрос в том же запросе
+    reviews = Review.objects.filter(recipe__in=published_recipes().filter(pk=pk).values('pk'))
+    fields = selected_fields(request, REVIEW_FIELDS)
+    items, next_cursor = keyset_page(request, reviews, fields, REVIEW_FIELDS)
+    return json_response(request, {'results': items, 'next_cursor': next_cursor})
+
+
+@api_view
+def genre_list(request):
+    genres = Genre.objects.order_by('name').values('id', 'name')
+    return json_response(request, {'results': list(genres)})
+
+
+@api_view
+def user_detail(request, pk):
+    # Счётчик на User поддерживается в recept/profiles.py
+    users = User.objects.filter(pk=pk, is_active=True, deleted_at__isnull=True).annotate(recipes_count=F('published_recipes_count'))
+    items = rows(users, selected_fields(request, USER_FIELDS), USER_FIELDS)
+    if not items:
+        return error_response(request, 'Пользователь не найден', status=404)
+    return json_response(request, items[0])
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ReceptConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recept'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import search, slowlog
+        # Регистрация обработчиков сигналов и фоновых задач
+        from . import deletion, homefeed, nutrition, profiles, signals, stats  # noqa: F401
+
+        connection_created.connect(slowlog.install, dispatch_uid='recept_slow_query_log')
+        connection_created.connect(search.install, dispatch_uid='recept_search_casefold')
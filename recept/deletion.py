@@ -0,0 +1,135 @@
+"""
+Удаление пользователей и рецептов в фоне.
+
+Объект сразу помечается удалённым (deleted_at) и пропадает из выдачи, а задача
+воркера удаляет зависимые строки пачками по DELETION_CHUNK_SIZE в коротких
+транзакциях (не блокируя надолго запись в SQLite), убирает загруженные файлы
+и сообщает прогресс через Task.progress/Task.total.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import pagecache, profiles, search, tasks
+from .models import User, Recipe, RecipeSnapshot, RecipeStep, RecipeIngredient, Review, Favorite
+
+logger = logging.getLogger('recept.tasks')
+
+
+def chunk_size():
+    return getattr(settings, 'DELETION_CHUNK_SIZE', 500)
+
+
+def schedule_recipe(recipe):
+    with transaction.atomic():
+        Recipe.all_objects.filter(pk=recipe.pk).update(deleted_at=timezone.now())
+        RecipeSnapshot.objects.filter(recipe=recipe).delete()
+        profiles.refresh_for_recipes(Recipe.all_objects.filter(pk=recipe.pk))
+        search.catalogue_changed()
+        pagecache.invalidate('catalogue', f'recipe:{recipe.pk}', f'user:{recipe.user_id}')
+    return tasks.enqueue('deletion.recipe', recipe_id=recipe.pk)
+
+
+def schedule_user(user):
+    now = timezone.now()
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False, deleted_at=now)
+        Recipe.all_objects.filter(user=user, deleted_at__isnull=True).update(deleted_at=now)
+        RecipeSnapshot.objects.filter(recipe__user=user).delete()
+        # Рецепты пропали из избранного и отзывов других пользователей
+        profiles.refresh_for_recipes(Recipe.all_objects.filter(user=user, deleted_at=now))
+        search.catalogue_changed()
+        # Страницы рецептов автора помечены его тегом
+        pagecache.invalidate('catalogue', f'user:{user.pk}')
+    return tasks.enqueue('deletion.user', user_id=user.pk)
+
+
+def recipe_steps(recipes):
+    """
+    План удаления рецептов: (queryset, файловые поля, изменения).
+    Изменения None - строки удаляются, иначе обновляются (SET_NULL).
+    """
+    in_recipes = {'recipe__in': recipes.values('pk')}
+    return [
+        (RecipeStep.objects.filter(**in_recipes), ('image',), None),
+        (RecipeIngredient.objects.filter(**in_recipes), (), None),
+        (Review.objects.filter(**in_recipes), (), None),
+        (Favorite.objects.filter(**in_recipes), (), None),
+        (recipes, ('cover_image', 'video_file'), None),
+    ]
+
+
+def user_steps(user_id):
+    return recipe_steps(Recipe.all_objects.filter(user_id=user_id)) + [
+        (Review.objects.filter(user_id=user_id), (), {'user': None}),
+        (Favorite.objects.filter(user_id=user_id), (), None),
+        (Recipe.all_objects.filter(claimed_by_id=user_id), (), {'claimed_by': None, 'claimed_until': None}),
+        (User.objects.filter(pk=user_id), ('avatar',), None),
+    ]
+
+
+def remove_files(model, file_fields, rows):
+    for row in rows:
+        for field_name, name in zip(file_fields, row[1:]):
+            if not name:
+                continue
+            storage = model._meta.get_field(field_name).storage
+            try:
+                storage.delete(name)
+            except OSError:
+                logger.warning('Не удалось удалить файл %s', name)
+
+
+def process_in_chunks(queryset, file_fields=(), changes=None, on_chunk=None):
+    """
+    Удаляет (или обновляет на changes) строки queryset пачками, каждая в своей
+    транзакции. Файлы удаляются после фиксации пачки. Возвращает число строк.
+    """
+    model = queryset.model
+    size = chunk_size()
+    done = 0
+    while True:
+        rows = list(queryset.order_by('pk').values_list('pk', *file_fields)[:size])
+        if not rows:
+            return done
+        ids = [row[0] for row in rows]
+        with transaction.atomic():
+            chunk = model._base_manager.filter(pk__in=ids)
+            if changes is None:
+                chunk.delete()
+            else:
+                chunk.update(**changes)
+        remove_files(model, file_fields, rows)
+        done += len(rows)
+        if on_chunk:
+            on_chunk(len(rows))
+
+
+def run_steps(task_obj, steps):
+    total = sum(queryset.count() for queryset, _, _ in steps)
+    progress = 0
+    tasks.report_progress(task_obj, 0, total=total)
+
+    def on_chunk(n):
+        nonlocal progress
+        progress += n
+        tasks.report_progress(task_obj, progress)
+
+    for queryset, file_fields, changes in steps:
+        process_in_chunks(queryset, file_fields, changes, on_chunk)
+    # Оценка total могла учесть одну строку дважды (например, отзыв на собственный рецепт)
+    tasks.report_progress(task_obj, total)
+
+
+@tasks.task('deletion.recipe')
+def delete_recipe(task_obj, recipe_id):
+    run_steps(task_obj, recipe_steps(Recipe.all_objects.filter(pk=recipe_id, deleted_at__isnull=False)))
+
+
+@tasks.task('deletion.user')
+def delete_user(task_obj, user_id):
+    if not User.objects.filter(pk=user_id, deleted_at__isnull=False).exists():
+        return
+    run_steps(task_obj, user_steps(user_id))
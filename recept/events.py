@@ -0,0 +1,289 @@
+"""
+Уведомления пользователей и их доставка потоком Server-Sent Events (/events/).
+
+Событие сначала записывается в таблицу Notification в той же транзакции, что и
+само действие (решение модератора, новый отзыв). Доставку делает один брокер на
+процесс ASGI: фоновая asyncio-задача раз в EVENTS_POLL_INTERVAL секунд одним
+запросом забирает новые строки и раскладывает их по очередям подключённых
+пользователей. Запись в этом же процессе будит брокер сразу после коммита, записи
+других процессов (воркер, другие экземпляры) приходят с ближайшим опросом.
+
+id выдаются при INSERT, а видны строки после коммита, и параллельные транзакции
+фиксируются не по порядку id: строка с меньшим id может появиться после уже
+прочитанной с большим. Поэтому опрос каждый раз захватывает REPOLL_WINDOW id позади
+последнего прочитанного, а уже доставленные id из этого окна пропускает.
+
+Под ASGI поток обслуживает asgi_app (см. PrjRecept/asgi.py). Соединение - это
+асинхронный генератор и asyncio.Queue, без потока на клиента, поэтому один процесс
+держит тысячи простаивающих подключений; число запросов к базе от количества
+подключений не зависит. Пропущенное при переподключении догружается по заголовку
+Last-Event-ID. Под WSGI тот же адрес отвечает сразу, и браузер опрашивает его.
+"""
+import asyncio
+import json
+
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden, QueryDict
+from django.http.cookie import parse_cookie
+from django.urls import reverse
+
+from .models import Notification
+
+BACKLOG_LIMIT = 50
+POLL_BATCH = 500
+QUEUE_SIZE = 100
+# Меньше POLL_BATCH: иначе полная пачка могла бы состоять из одних уже доставленных строк
+REPOLL_WINDOW = 100
+
+
+def poll_interval():
+    return getattr(settings, 'EVENTS_POLL_INTERVAL', 2.0)
+
+
+def keepalive_interval():
+    return getattr(settings, 'EVENTS_KEEPALIVE', 20.0)
+
+
+# Запись
+
+def notify(rows):
+    """Записывает уведомления [(id пользователя, вид, payload)] одним INSERT."""
+    if not rows:
+        return
+    Notification.objects.bulk_create([
+        Notification(user_id=user_id, kind=kind, payload=payload) for user_id, kind, payload in rows
+    ])
+    transaction.on_commit(broker.wake)
+
+
+def moderation_rows(recipes, approve, notes=None):
+    """Уведомления авторам по [(id рецепта, id автора, название)]."""
+    rows = []
+    for pk, user_id, title in recipes:
+        if approve:
+            message = f'Рецепт «{title}» опубликован'
+        else:
+            message = f'Рецепт «{title}» отклонён: {notes or "причина не указана"}'
+        rows.append((user_id, 'approved' if approve else 'rejected', {
+            'recipe_id': pk, 'message': message, 'url': reverse('recipe_detail', args=[pk]),
+        }))
+    return rows
+
+
+def review_row(recipe_id, author_id, title, reviewer, rating):
+    name = reviewer.full_name or 'Пользователь'
+    return (author_id, 'review', {
+        'recipe_id': recipe_id,
+        'message': f'{name} оценил(а) рецепт «{title}» на {rating} из 5',
+        'url': reverse('recipe_reviews', args=[recipe_id]),
+    })
+
+
+# Чтение
+
+def as_event(row):
+    return {'id': row['id'], 'kind': row['kind'], 'created_at': row['created_at'], **row['payload']}
+
+
+def since(last_id, user_id=None, limit=POLL_BATCH):
+    notifications = Notification.objects.filter(pk__gt=last_id)
+    if user_id is not None:
+        notifications = notifications.filter(user_id=user_id)
+    rows = notifications.order_by('pk').values('id', 'user_id', 'kind', 'payload', 'created_at')[:limit]
+    return [(row['user_id'], as_event(row)) for row in rows]
+
+
+def recent_ids():
+    """id последних REPOLL_WINDOW уведомлений: при запуске брокера они считаются доставленными."""
+    return list(Notification.objects.order_by('-pk').values_list('pk', flat=True)[:REPOLL_WINDOW])
+
+
+class Broker:
+    """Раздача новых уведомлений подключённым в этом процессе пользователям."""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.last_id = None
+        # Доставленные id не старше окна повторного опроса
+        self.recent = set()
+        self.loop = None
+        self.task = None
+        self.wakeup = None
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.task is None or self.task.done():
+            self.loop = loop
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.subscribers.pop(user_id, None)
+
+    def wake(self):
+        """Вызывается из любого потока после коммита уведомления."""
+        loop, wakeup = self.loop, self.wakeup
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def run(self):
+        # Позиция берётся заново при каждом запуске: пока брокер стоял, подписчиков не было,
+        # и накопившееся за это время новому подключению отдавать не нужно
+        ids = await sync_to_async(recent_ids)()
+        self.last_id, self.recent = max(ids, default=0), set(ids)
+        # Опрос идёт, пока в процессе есть подключения
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), poll_interval())
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.poll()
+
+    async def poll(self):
+        rows = await sync_to_async(since)(max(self.last_id - REPOLL_WINDOW, 0))
+        for user_id, event in rows:
+            if event['id'] in self.recent:
+                continue
+            self.recent.add(event['id'])
+            self.last_id = max(self.last_id, event['id'])
+            for queue in self.subscribers.get(user_id, ()):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Клиент не успевает читать: догрузит по Last-Event-ID после переподключения
+                    pass
+        self.recent = {pk for pk in self.recent if pk > self.last_id - REPOLL_WINDOW}
+        if len(rows) == POLL_BATCH:
+            self.wakeup.set()
+
+
+broker = Broker()
+
+
+def encode(event):
+    data = json.dumps(event, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return f'id: {event["id"]}\nevent: {event["kind"]}\ndata: {data}\n\n'
+
+
+async def stream(user_id, last_event_id=None):
+    """Поток строк SSE для пользователя: пропущенное, затем новые события и keepalive."""
+    queue = broker.subscribe(user_id)
+    try:
+        yield f'retry: {int(poll_interval() * 1000)}\n\n'
+        # Брокер отдаёт каждый id один раз, повториться может только уже догруженное
+        replayed = set()
+        if last_event_id is not None:
+            for _, event in await sync_to_async(since)(last_event_id, user_id, BACKLOG_LIMIT):
+                replayed.add(event['id'])
+                yield encode(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive_interval())
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event['id'] not in replayed:
+                yield encode(event)
+    finally:
+        broker.unsubscribe(user_id, queue)
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def session_user_id(session_key):
+    """id активного пользователя по ключу сессии или None."""
+    if not session_key:
+        return None
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    user = auth.get_user(request)
+    return user.pk if user.is_authenticated else None
+
+
+async def send_forbidden(send):
+    await send({'type': 'http.response.start', 'status': 403, 'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def asgi_app(scope, receive, send):
+    """
+    ASGI-приложение потока, подключается в PrjRecept/asgi.py мимо обработчика Django:
+    тот держит для каждого незавершённого запроса собственный поток для синхронного кода,
+    а поток SSE не завершается. Здесь синхронные вызовы идут через общий поток asgiref.
+    """
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+    cookies = parse_cookie(headers.get('cookie', ''))
+    user_id = await sync_to_async(session_user_id)(cookies.get(settings.SESSION_COOKIE_NAME))
+    if user_id is None:
+        await send_forbidden(send)
+        return
+
+    query = QueryDict(scope.get('query_string', b'').decode('latin-1'))
+    last_event_id = parse_last_event_id(headers.get('last-event-id') or query.get('last_event_id'))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        # nginx не должен буферизовать поток
+        (b'x-accel-buffering', b'no'),
+    ]})
+
+    events = stream(user_id, last_event_id)
+
+    async def pump():
+        async for chunk in events:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    tasks = {asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())}
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await events.aclose()
+
+
+def events_view(request):
+    """
+    Запасной вариант для WSGI (runserver): отдаёт накопившиеся события и закрывает ответ,
+    EventSource переподключается через retry с Last-Event-ID - получается опрос.
+    Каждая открытая вкладка делает запрос к воркеру и запрос к базе раз в
+    EVENTS_POLL_INTERVAL секунд, то есть нагрузка растёт с числом подключений: для
+    разработки этого достаточно, в бою поток должен обслуживать asgi_app.
+    """
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+    last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
+    chunks = [f'retry: {int(poll_interval() * 1000)}\n\n']
+    if last_event_id is None:
+        # Только отметка позиции: следующее подключение придёт с Last-Event-ID
+        last = request.user.notifications.aggregate(last=Max('pk'))['last'] or 0
+        chunks.append(f'id: {last}\n\n')
+    else:
+        chunks += [encode(event) for _, event in since(last_event_id, request.user.pk, BACKLOG_LIMIT)]
+    response = HttpResponse(''.join(chunks), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,130 @@
+"""
+Карта сайта и Atom-лента опубликованных рецептов для поисковых систем.
+
+/sitemap.xml - индекс частей карты. Часть N (/sitemap-N.xml) содержит рецепты с
+id в диапазоне [N * SHARD_SIZE, (N + 1) * SHARD_SIZE), то есть не больше 50 000
+адресов (предел протокола sitemaps). Адрес части не зависит от того, сколько
+рецептов опубликовано до неё, а её lastmod - максимальный updated_at в диапазоне.
+Часть без опубликованных рецептов (в том числе за пределами каталога) - 404.
+/feed.atom - FEED_SIZE последних рецептов, прошедших модерацию.
+
+Ответы потоковые: строки читаются iterator() пачками и сразу отдаются клиенту,
+память не растёт с размером каталога. ETag - версия каталога (search.py), поэтому
+повторный обход краулера с If-None-Match получает 304 без запросов к базе, пока
+рецепты не публиковались, не правились и не удалялись.
+"""
+from itertools import chain
+from xml.sax.saxutils import escape, quoteattr
+
+from django.db.models import F, Max
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import Truncator
+from django.views.decorators.http import condition, require_GET
+
+from . import search
+from .models import Recipe
+
+SHARD_SIZE = 50_000
+FEED_SIZE = 50
+CHUNK_SIZE = 2000
+
+# Подставляется в reverse() вместо id: адрес строится форматированием, без reverse() на каждую строку
+PK_PLACEHOLDER = 999999999
+
+
+def catalogue_etag(request, *args, **kwargs):
+    return f'catalogue-{search.catalogue_version()}'
+
+
+def url_template(request, name):
+    return request.build_absolute_uri(reverse(name, args=[PK_PLACEHOLDER])).replace(str(PK_PLACEHOLDER), '{}')
+
+
+def published():
+    return Recipe.objects.filter(status='published').order_by()
+
+
+def xml_response(chunks, content_type):
+    return StreamingHttpResponse(chunks, content_type=f'{content_type}; charset=utf-8')
+
+
+def sitemap_index_chunks(request, shards):
+    shard_url = url_template(request, 'sitemap_shard')
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for shard, lastmod in shards:
+        yield f'<sitemap><loc>{escape(shard_url.format(shard))}</loc><lastmod>{lastmod.isoformat()}</lastmod></sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+@require_GET
+@condition(etag_func=catalogue_etag)
+def sitemap_index(request):
+    # Один сгруппированный запрос: номер части и её lastmod
+    shards = (
+        published().annotate(shard=F('pk') / SHARD_SIZE).values_list('shard')
+        .annotate(lastmod=Max('updated_at')).order_by('shard').iterator(chunk_size=CHUNK_SIZE)
+    )
+    return xml_response(sitemap_index_chunks(request, shards), 'application/xml')
+
+
+def sitemap_shard_chunks(request, rows):
+    recipe_url = url_template(request, 'recipe_detail')
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for pk, updated_at in rows:
+        yield f'<url><loc>{escape(recipe_url.format(pk))}</loc><lastmod>{updated_at.isoformat()}</lastmod></url>\n'
+    yield '</urlset>\n'
+
+
+@require_GET
+@condition(etag_func=catalogue_etag)
+def sitemap_shard(request, shard):
+    rows = (
+        published().filter(pk__gte=shard * SHARD_SIZE, pk__lt=(shard + 1) * SHARD_SIZE)
+        .order_by('pk').values_list('pk', 'updated_at').iterator(chunk_size=CHUNK_SIZE)
+    )
+    # Первая строка читается до ответа: пустая часть - 404, а не пустой urlset
+    first = next(rows, None)
+    if first is None:
+        raise Http404('Нет такой части карты сайта')
+    return xml_response(sitemap_shard_chunks(request, chain([first], rows)), 'application/xml')
+
+
+def feed_chunks(request, rows):
+    recipe_url = url_template(request, 'recipe_detail')
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+    yield '<title>EAT-HACK: новые рецепты</title>\n'
+    yield f'<id>{escape(request.build_absolute_uri(reverse("recipe_feed")))}</id>\n'
+    yield f'<link rel="self" href={quoteattr(request.build_absolute_uri(reverse("recipe_feed")))}/>\n'
+    yield f'<link href={quoteattr(request.build_absolute_uri(reverse("recipe_list")))}/>\n'
+    first = True
+    for pk, title, description, moderated_at, updated_at, full_name, email in rows:
+        if first:
+            # Лента обновлена вместе с самым новым рецептом
+            yield f'<updated>{moderated_at.isoformat()}</updated>\n'
+            first = False
+        url = recipe_url.format(pk)
+        yield (
+            f'<entry><title>{escape(title)}</title><link href={quoteattr(url)}/><id>{escape(url)}</id>'
+            f'<published>{moderated_at.isoformat()}</published><updated>{max(updated_at, moderated_at).isoformat()}</updated>'
+            f'<author><name>{escape(full_name or email)}</name></author>'
+            f'<summary>{escape(Truncator(description or "").chars(300))}</summary></entry>\n'
+        )
+    if first:
+        yield f'<updated>{timezone.now().isoformat()}</updated>\n'
+    yield '</feed>\n'
+
+
+@require_GET
+@condition(etag_func=catalogue_etag)
+def recipe_feed(request):
+    rows = (
+        published().filter(moderated_at__isnull=False).order_by('-moderated_at', '-pk')
+        .values_list('pk', 'title', 'description', 'moderated_at', 'updated_at', 'user__full_name', 'user__email')
+        [:FEED_SIZE].iterator(chunk_size=CHUNK_SIZE)
+    )
+    return xml_response(feed_chunks(request, rows), 'application/atom+xml')
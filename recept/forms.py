@@ -4,6 +4,9 @@ from .models import User, Review
 from django.forms import modelformset_factory, formset_factory, FileInput 
 from .models import Recipe, RecipeStep, RecipeIngredient, ListIngredient, Genre
 import re
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.db.models.functions import Lower
 
 class UserRegistrationForm(UserCreationForm):
     full_name = forms.CharField(max_length=150, required=True, label='ФИО')
@@ -83,9 +86,9 @@ class RecipeForm(forms.ModelForm):
                 'title': 'Название',
                 'description': 'Описание',
                 'portions': 'Количество порций',
-                'calories': 'Калорийность',
-                'estimated_cost': 'Примерная стоимость',
             }
+            # Калорийность и стоимость рассчитываются по ингредиентам (см. recept/nutrition.py);
+            # значения автора остаются, если в справочнике нет данных
             
             for field, label in required_fields.items():
                 if not cleaned_data.get(field):
@@ -129,6 +132,10 @@ class RecipeForm(forms.ModelForm):
         if status == 'pending' and recipe.moderation_notes:
             recipe.moderation_notes = None
 
+        # Время отправки на модерацию нужно для статистики времени проверки
+        if status == 'pending' and recipe.status != 'pending':
+            recipe.submitted_at = timezone.now()
+
         recipe.status = status
         
         if commit:
@@ -143,7 +150,9 @@ class RecipeStepForm(forms.ModelForm):
         fields = ['order', 'description', 'image']
         widgets = {'description': forms.Textarea(attrs={'rows': 2})}
 
+# Классы наборов форм строятся один раз при импорте, а не в каждом запросе
 RecipeStepFormSet = modelformset_factory(RecipeStep, form=RecipeStepForm, extra=1, can_delete=True)
+RecipeStepEditFormSet = modelformset_factory(RecipeStep, form=RecipeStepForm, extra=0, can_delete=True)
 
 
 class RecipeIngredientForm(forms.Form):
@@ -159,6 +168,9 @@ class RecipeIngredientForm(forms.Form):
         ('cup', 'Кружка'),
     ], label='Единица измерения')
 
+RecipeIngredientFormSet = formset_factory(RecipeIngredientForm, extra=1, can_delete=True)
+RecipeIngredientEditFormSet = formset_factory(RecipeIngredientForm, extra=0, can_delete=True)
+
 # админка
 class AdminUserEditForm(forms.ModelForm):
 
@@ -179,6 +191,50 @@ class AdminUserEditForm(forms.ModelForm):
             'is_superuser': 'Суперпользователь (Полный доступ)',
         }
 
+def prefix_range(field, prefix):
+    # LIKE в SQLite не учитывает регистр и индекс не использует, а диапазон
+    # [prefix, prefix с увеличенным последним символом) идёт по индексу
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+
+class AdminUserFilterForm(forms.Form):
+    BOOL_CHOICES = [('', 'Все'), ('1', 'Да'), ('0', 'Нет')]
+
+    email = forms.CharField(required=False, label='Email')
+    name = forms.CharField(required=False, label='ФИО')
+    phone = forms.CharField(required=False, label='Телефон')
+    is_active = forms.ChoiceField(choices=BOOL_CHOICES, required=False, label='Активен')
+    is_staff = forms.ChoiceField(choices=BOOL_CHOICES, required=False, label='Персонал')
+    joined_from = forms.DateField(required=False, label='Зарегистрирован с', widget=forms.DateInput(attrs={'type': 'date'}))
+    joined_to = forms.DateField(required=False, label='по', widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def filter(self, queryset):
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        # Поиск по началу строки диапазоном: email по индексу lower(email), телефон по индексу поля
+        email, phone, name = (data[key].strip() for key in ('email', 'phone', 'name'))
+        if email:
+            queryset = queryset.alias(email_lower=Lower('email')).filter(**prefix_range('email_lower', email.lower()))
+        if phone:
+            queryset = queryset.filter(**prefix_range('phone_num', phone))
+        # ФИО ищется по подстроке без учёта регистра: такой поиск индексом не обслуживается
+        # (lower() в SQLite не знает кириллицы), это полный просмотр таблицы пользователей
+        if name:
+            queryset = queryset.filter(full_name__icontains=name)
+        if data['is_active']:
+            queryset = queryset.filter(is_active=data['is_active'] == '1')
+        if data['is_staff']:
+            queryset = queryset.filter(is_staff=data['is_staff'] == '1')
+        # Диапазон по самому полю, а не по __date, чтобы использовался индекс
+        if data['joined_from']:
+            start = timezone.make_aware(datetime.combine(data['joined_from'], time.min))
+            queryset = queryset.filter(date_joined__gte=start)
+        if data['joined_to']:
+            end = timezone.make_aware(datetime.combine(data['joined_to'] + timedelta(days=1), time.min))
+            queryset = queryset.filter(date_joined__lt=end)
+        return queryset
+
 # отзывы
 
 class ReviewForm(forms.ModelForm):
@@ -0,0 +1,105 @@
+"""
+Блоки главной страницы: новые, лучшие по оценкам, самые популярные в избранном
+и подборки по крупнейшим жанрам.
+
+Считать их на каждый запрос - это несколько тяжёлых агрегатов (группировка
+избранного, сортировка по средней оценке, подсчёт рецептов по жанрам). Поэтому
+блоки собирает фоновая задача homefeed.build: по расписанию (PERIODIC_TASKS) и
+после публикации, правки или удаления рецептов (search.catalogue_changed).
+Результат - строки HomeSection с готовыми карточками в JSON; главная читает их
+одним запросом без агрегатов.
+"""
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+
+from . import pagecache, snapshots, tasks
+from .models import Favorite, Genre, HomeSection, Recipe
+
+SECTION_SIZE = 8
+GENRE_SECTIONS = 4
+# Рецепт попадает в «Лучшие по оценкам» не меньше чем с таким числом оценок
+MIN_RATINGS = 3
+
+
+def published():
+    return Recipe.objects.filter(status='published')
+
+
+def latest_ids():
+    return list(published().order_by('-created_at', '-pk').values_list('pk', flat=True)[:SECTION_SIZE])
+
+
+def top_rated_ids():
+    average = Cast(F('rating_sum'), FloatField()) / F('rating_count')
+    return list(
+        published().filter(rating_count__gte=MIN_RATINGS).alias(average=average)
+        .order_by('-average', '-rating_count', '-pk').values_list('pk', flat=True)[:SECTION_SIZE]
+    )
+
+
+def most_favorited_ids():
+    return list(
+        Favorite.objects.filter(recipe__status='published', recipe__deleted_at__isnull=True)
+        .values_list('recipe_id', flat=True).annotate(n=Count('pk')).order_by('-n', '-recipe_id')[:SECTION_SIZE]
+    )
+
+
+def genre_sections():
+    """[(жанр, id рецептов)] для жанров с наибольшим числом опубликованных рецептов."""
+    genres = (
+        Genre.objects.annotate(n=Count('recipes', filter=Q(recipes__status='published', recipes__deleted_at__isnull=True)))
+        .filter(n__gt=0).order_by('-n', 'name')[:GENRE_SECTIONS]
+    )
+    return [
+        (genre, list(
+            published().filter(genres=genre).order_by('-rating_count', '-created_at', '-pk')
+            .values_list('pk', flat=True)[:SECTION_SIZE]
+        ))
+        for genre in genres
+    ]
+
+
+def card(recipe):
+    return {
+        'id': recipe.pk,
+        'title': recipe.title,
+        'cover_image': snapshots.media_url(recipe.cover_image),
+        'calories': recipe.calories,
+        'portions': recipe.portions,
+        'author_name': recipe.user.full_name or recipe.user.email,
+        'rating': recipe.average_rating,
+        'rating_count': recipe.rating_count,
+    }
+
+
+def build():
+    """Пересобирает все блоки; возвращает их число."""
+    sections = [
+        ('latest', 'Новые рецепты', latest_ids()),
+        ('top_rated', 'Лучшие по оценкам', top_rated_ids()),
+        ('most_favorited', 'Чаще всего в избранном', most_favorited_ids()),
+    ] + [(f'genre:{genre.pk}', genre.name, ids) for genre, ids in genre_sections()]
+
+    wanted = {pk for _, _, ids in sections for pk in ids}
+    cards = {r.pk: card(r) for r in published().filter(pk__in=wanted).select_related('user')}
+    rows = [
+        HomeSection(key=key, title=title, position=position, items=[cards[pk] for pk in ids if pk in cards])
+        for position, (key, title, ids) in enumerate(sections)
+        if ids
+    ]
+    with transaction.atomic():
+        HomeSection.objects.all().delete()
+        HomeSection.objects.bulk_create(rows)
+        pagecache.invalidate('home')
+    return len(rows)
+
+
+def schedule():
+    """Ставит пересборку в очередь, если она ещё не ждёт."""
+    tasks.enqueue_once('homefeed.build')
+
+
+@tasks.task('homefeed.build')
+def build_task(task_obj):
+    build()
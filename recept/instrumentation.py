@@ -0,0 +1,135 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.files.storage import FileSystemStorage
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+
+# Замеры текущего запроса; None, если запрос не попал в выборку
+_current = ContextVar('recept_request_timings', default=None)
+
+
+class RequestTimings:
+    """Разбивка времени одного запроса: БД, шаблоны, кэш, медиафайлы."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {'db': 0.0, 'tpl': 0.0, 'media': 0.0}
+        self.counts = {'db': 0, 'tpl': 0, 'media': 0, 'cache_hit': 0, 'cache_miss': 0}
+
+    def add(self, kind, duration, count=1):
+        self.durations[kind] = self.durations.get(kind, 0.0) + duration
+        self.counts[kind] = self.counts.get(kind, 0) + count
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: время SQL
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('db', time.perf_counter() - start)
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        total = self.total
+        measured = sum(self.durations.values())
+        data = {f'{k}_ms': round(v * 1000, 2) for k, v in self.durations.items()}
+        data.update({
+            'total_ms': round(total * 1000, 2),
+            'app_ms': round(max(total - measured, 0) * 1000, 2),
+            'db_count': self.counts['db'],
+            'tpl_count': self.counts['tpl'],
+            'media_count': self.counts['media'],
+            'cache_hit': self.counts['cache_hit'],
+            'cache_miss': self.counts['cache_miss'],
+        })
+        return data
+
+    def server_timing(self):
+        d = self.as_dict()
+        parts = [
+            f'db;dur={d["db_ms"]};desc="SQL x{d["db_count"]}"',
+            f'tpl;dur={d["tpl_ms"]};desc="templates x{d["tpl_count"]}"',
+            f'media;dur={d["media_ms"]};desc="media x{d["media_count"]}"',
+            f'cache;desc="hit={d["cache_hit"]} miss={d["cache_miss"]}"',
+            f'app;dur={d["app_ms"]}',
+            f'total;dur={d["total_ms"]}',
+        ]
+        return ', '.join(parts)
+
+
+def current_timings():
+    return _current.get()
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(kind):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(kind, time.perf_counter() - start)
+
+
+def record_cache(hit, name='default'):
+    metrics.cache_requests.inc(cache=name, result='hit' if hit else 'miss')
+    timings = _current.get()
+    if timings is not None:
+        timings.counts['cache_hit' if hit else 'cache_miss'] += 1
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        with timed('tpl'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Обычный бэкенд шаблонов Django, который засекает время рендеринга."""
+
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return TimedTemplate(template.template, self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class TimedFileSystemStorage(FileSystemStorage):
+    """Файловое хранилище медиа с учётом времени чтения/записи/удаления."""
+
+    def _open(self, name, mode='rb'):
+        with timed('media'):
+            return super()._open(name, mode)
+
+    def _save(self, name, content):
+        with timed('media'):
+            return super()._save(name, content)
+
+    def delete(self, name):
+        with timed('media'):
+            return super().delete(name)
+
+    def exists(self, name):
+        with timed('media'):
+            return super().exists(name)
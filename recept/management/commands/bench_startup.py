@@ -0,0 +1,130 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в отдельном процессе: замеры холодного запуска невозможны в уже запущенном
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+imported = time.perf_counter()
+django.setup()
+ready = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+handler = time.perf_counter()
+warm = sys.argv[1] == 'warm'
+if warm:
+    from recept import warmup
+    warmup.run()
+warmed = time.perf_counter()
+from django.test import Client
+from django.urls import reverse
+settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+client = Client()
+first_requests = {}
+for name in sys.argv[2].split(','):
+    t = time.perf_counter()
+    status = client.get(reverse(name)).status_code
+    first_requests[name] = (time.perf_counter() - t) * 1000
+    if status >= 400:
+        sys.exit(f'{name}: {status}')
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'setup_ms': (ready - imported) * 1000,
+    'handler_ms': (handler - ready) * 1000,
+    'warmup_ms': (warmed - handler) * 1000,
+    'first_requests_ms': first_requests,
+}))
+'''
+
+PAGES = ('index', 'recipe_list', 'login', 'signup')
+
+
+class Command(BaseCommand):
+    help = 'Время запуска процесса: импорт, django.setup(), первые запросы без прогрева и с прогревом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Запусков процесса на режим')
+        parser.add_argument('--output', default=None, help='Путь к JSON с результатами')
+        parser.add_argument('--compare', default=None, help='JSON предыдущего прогона для сравнения')
+
+    def handle(self, *args, **opts):
+        results = {}
+        for mode in ('cold', 'warm'):
+            samples = [self.spawn(mode) for _ in range(opts['runs'])]
+            results[mode] = self.summarize(samples)
+            self.report(mode, results[mode])
+
+        payload = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'runs': opts['runs'],
+            'database': str(settings.DATABASES['default']['NAME']),
+            'modes': results,
+        }
+        output = opts['output'] or f'bench_startup_{datetime.now():%Y%m%d_%H%M%S}.json'
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {output}'))
+
+        if opts['compare']:
+            self.compare(opts['compare'], results)
+
+    def spawn(self, mode):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE, 'WARMUP_ON_START': '0'}
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+        started = time.perf_counter()
+        child = subprocess.run(
+            [sys.executable, '-c', CHILD, mode, ','.join(PAGES)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if child.returncode:
+            raise CommandError(f'Процесс замера завершился с ошибкой:\n{child.stderr.strip()}')
+        sample = json.loads(child.stdout.strip().splitlines()[-1])
+        sample['process_ms'] = (time.perf_counter() - started) * 1000
+        return sample
+
+    def summarize(self, samples):
+        # Медиана: единичные выбросы (дисковый кеш, планировщик) не сдвигают результат
+        def median(key):
+            return round(statistics.median(s[key] for s in samples), 1)
+        summary = {key: median(key) for key in ('import_ms', 'setup_ms', 'handler_ms', 'warmup_ms', 'process_ms')}
+        summary['first_requests_ms'] = {
+            name: round(statistics.median(s['first_requests_ms'][name] for s in samples), 1) for name in PAGES
+        }
+        summary['boot_ms'] = round(summary['import_ms'] + summary['setup_ms'] + summary['handler_ms'], 1)
+        return summary
+
+    def report(self, mode, r):
+        self.stdout.write(
+            f"{mode:5} импорт={r['import_ms']:6.1f}мс setup={r['setup_ms']:6.1f}мс обработчик={r['handler_ms']:6.1f}мс "
+            f"прогрев={r['warmup_ms']:6.1f}мс процесс={r['process_ms']:7.1f}мс"
+        )
+        self.stdout.write('      первые запросы: ' + ' '.join(f'{n}={ms:.1f}мс' for n, ms in r['first_requests_ms'].items()))
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)['modes']
+        self.stdout.write(f'Сравнение с {path}:')
+        for mode, r in results.items():
+            old = previous.get(mode)
+            if not old:
+                continue
+            deltas = []
+            for key in ('boot_ms', 'warmup_ms', 'process_ms'):
+                if old[key]:
+                    deltas.append(f'{key} {(r[key] - old[key]) / old[key] * 100:+.1f}%')
+            for name, ms in r['first_requests_ms'].items():
+                if old['first_requests_ms'].get(name):
+                    deltas.append(f'{name} {(ms - old["first_requests_ms"][name]) / old["first_requests_ms"][name] * 100:+.1f}%')
+            self.stdout.write(f'{mode:5} ' + ' '.join(deltas))
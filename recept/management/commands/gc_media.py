@@ -0,0 +1,124 @@
+import os
+import shutil
+import time
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+
+
+def file_fields_by_dir():
+    """{каталог upload_to: [(модель, имя поля)]} для всех FileField/ImageField проекта."""
+    dirs = {}
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField) and isinstance(field.upload_to, str) and field.upload_to:
+                dirs.setdefault(field.upload_to.strip('/'), []).append((model, field.name))
+    return dirs
+
+
+# Файлов каталога в одной проверке по базе (размер списка IN)
+BATCH_SIZE = 500
+
+
+def referenced(fields, names):
+    """Имена из names, на которые ссылается хотя бы одна запись."""
+    found = set()
+    for model, field in fields:
+        # _base_manager: рецепты, ожидающие фонового удаления, ещё ссылаются на свои файлы
+        found.update(model._base_manager.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+    return found
+
+
+def on_disk(root, directory):
+    """Поток (имя, DirEntry) файлов каталога в порядке scandir; подкаталоги не трогаются."""
+    path = os.path.join(root, directory)
+    if not os.path.isdir(path):
+        return
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                yield f'{directory}/{entry.name}', entry
+
+
+def orphans(files, fields):
+    """
+    Файлы без ссылок в базе. Каталог читается пачками по BATCH_SIZE, и каждая
+    пачка сверяется с базой точным сравнением имён: память не растёт с размером
+    каталога, а результат не зависит от правил сортировки (collation) базы.
+    """
+    batch = []
+    for item in files:
+        batch.append(item)
+        if len(batch) == BATCH_SIZE:
+            yield from unreferenced(batch, fields)
+            batch = []
+    if batch:
+        yield from unreferenced(batch, fields)
+
+
+def unreferenced(batch, fields):
+    found = referenced(fields, [name for name, _ in batch])
+    return [(name, entry) for name, entry in batch if name not in found]
+
+
+class Command(BaseCommand):
+    help = (
+        'Находит в MEDIA_ROOT файлы, на которые не ссылается ни одна запись. По умолчанию только '
+        'показывает их; --delete удаляет, --quarantine переносит в карантин'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Удалить найденные файлы')
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Не трогать файлы моложе этого возраста (загрузка ещё не сохранена)')
+        parser.add_argument('--quarantine', help='Переносить файлы в этот каталог вместо удаления')
+        parser.add_argument('--dir', action='append', dest='dirs', help='Проверить только этот каталог upload_to')
+
+    def handle(self, *args, **opts):
+        try:
+            root = default_storage.path('')
+        except NotImplementedError:
+            raise CommandError('Сборка мусора работает только с файловым хранилищем')
+
+        dirs = file_fields_by_dir()
+        if opts['dirs']:
+            unknown = set(opts['dirs']) - set(dirs)
+            if unknown:
+                raise CommandError(f'Нет файловых полей с каталогом: {", ".join(sorted(unknown))}')
+            dirs = {d: dirs[d] for d in opts['dirs']}
+
+        cutoff = time.time() - opts['grace_hours'] * 3600
+        scanned = found = reclaimed = 0
+        for directory, fields in sorted(dirs.items()):
+            files = self.counting(on_disk(root, directory))
+            for name, entry in orphans(files, fields):
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime > cutoff:
+                    continue
+                found += 1
+                reclaimed += stat.st_size
+                if opts['quarantine']:
+                    target = os.path.join(opts['quarantine'], name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.move(entry.path, target)
+                elif opts['delete']:
+                    os.remove(entry.path)
+                else:
+                    self.stdout.write(f'  {name} ({stat.st_size} байт)')
+            scanned += self.counted
+
+        if opts['quarantine']:
+            summary = f'перенесено в карантин {found}, освобождено {reclaimed} байт'
+        elif opts['delete']:
+            summary = f'удалено {found}, освобождено {reclaimed} байт'
+        else:
+            summary = f'найдено {found}, будет освобождено {reclaimed} байт (пробный запуск, удаляет --delete)'
+        self.stdout.write(self.style.SUCCESS(f'Проверено файлов: {scanned}; без ссылок: {summary}'))
+
+    def counting(self, files):
+        self.counted = 0
+        for item in files:
+            self.counted += 1
+            yield item
@@ -0,0 +1,116 @@
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recept import nutrition, pagecache, tasks
+from recept.models import ListIngredient
+
+# Колонка CSV (поле ListIngredient) -> название для сообщений
+COLUMNS = {
+    'calories': 'калорийность',
+    'price': 'цена',
+    'piece_weight': 'масса штуки',
+    'density': 'плотность',
+}
+
+
+def parse_decimal(value, field):
+    try:
+        number = Decimal(value.strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f'{COLUMNS[field]}: "{value}" не число')
+    # NaN и бесконечность проверяются до сравнения: NaN < 0 бросает InvalidOperation
+    if not number.is_finite():
+        raise ValueError(f'{COLUMNS[field]}: "{value}" не число')
+    if number < 0:
+        raise ValueError(f'{COLUMNS[field]}: "{value}" должно быть неотрицательным')
+    return number
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает калорийность, цены, массу штуки и плотность ингредиентов из CSV '
+        '(колонки: name и любые из calories, price, piece_weight, density) и пересчитывает рецепты'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV-файл в UTF-8 с заголовком')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--create', action='store_true', help='Создавать ингредиенты, которых нет в справочнике')
+        parser.add_argument('--background', action='store_true',
+                            help='Пересчитать рецепты фоновой задачей вместо немедленного пересчёта')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        rows, columns = self.read(opts['path'], opts['delimiter'])
+
+        # Весь справочник одним проходом; имена сравниваются без учёта регистра, как в форме рецепта
+        existing = {i.name.casefold(): i for i in ListIngredient.objects.only('pk', 'name', *COLUMNS).iterator()}
+        changed, created, unknown = {}, [], 0
+        for name, values in rows:
+            ingredient = existing.get(name.casefold())
+            if ingredient is None:
+                if not opts['create']:
+                    unknown += 1
+                    continue
+                ingredient = existing[name.casefold()] = ListIngredient(name=name)
+                created.append(ingredient)
+            if any(getattr(ingredient, f) != v for f, v in values.items()):
+                for field, value in values.items():
+                    setattr(ingredient, field, value)
+                if ingredient.pk:
+                    changed[ingredient.pk] = ingredient
+
+        with transaction.atomic():
+            ListIngredient.objects.bulk_update(changed.values(), columns, batch_size=opts['batch_size'])
+            ListIngredient.objects.bulk_create(created, batch_size=opts['batch_size'])
+            if changed:
+                # bulk_update без сигналов: пересчёт в граммы и страницы рецептов устаревают явно
+                pagecache.invalidate('ingredients')
+
+        self.stdout.write(f'Обновлено: {len(changed)}, создано: {len(created)}, не найдено в справочнике: {unknown}')
+        # Новые ингредиенты ещё не входят ни в один рецепт
+        if not changed:
+            return
+        if opts['background']:
+            task_obj = tasks.enqueue('nutrition.recompute', ingredient_ids=sorted(changed))
+            self.stdout.write(self.style.SUCCESS(f'Пересчёт рецептов поставлен в очередь (задача #{task_obj.pk})'))
+        else:
+            recipes = nutrition.recompute(ingredient_ids=changed)
+            self.stdout.write(self.style.SUCCESS(f'Пересчитано рецептов: {recipes}'))
+
+    def read(self, path, delimiter):
+        """Проверяет файл целиком до записи: [(имя, {поле: значение})] и список колонок."""
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                reader = csv.DictReader(f, delimiter=delimiter)
+                header = reader.fieldnames or []
+                if 'name' not in header:
+                    raise CommandError('В файле нет колонки name')
+                columns = [c for c in header if c in COLUMNS]
+                if not columns:
+                    raise CommandError(f'Нет ни одной колонки из: {", ".join(COLUMNS)}')
+
+                rows, errors = [], []
+                for line, row in enumerate(reader, start=2):
+                    name = (row.get('name') or '').strip()
+                    if not name:
+                        errors.append(f'строка {line}: пустое название')
+                        continue
+                    values = {}
+                    for field in columns:
+                        # Пустая ячейка - значение не меняется
+                        if (row.get(field) or '').strip():
+                            try:
+                                values[field] = parse_decimal(row[field], field)
+                            except ValueError as e:
+                                errors.append(f'строка {line}: {e}')
+                    rows.append((name, values))
+        except OSError as e:
+            raise CommandError(f'Не удалось прочитать файл: {e}')
+
+        if errors:
+            raise CommandError('Файл не загружен:\n' + '\n'.join(errors[:20]))
+        return rows, columns
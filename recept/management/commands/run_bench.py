@@ -0,0 +1,161 @@
+import json
+import random
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.middleware.csrf import CSRF_ALLOWED_CHARS
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from recept.models import User, Recipe
+from .seed_bench import EMAIL_DOMAIN, WORDS
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный прогон основных страниц: задержки p50/p95/p99, RPS и число SQL-запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+        parser.add_argument('--output', default=None, help='Путь к JSON с результатами')
+        parser.add_argument('--compare', default=None, help='JSON предыдущего прогона для сравнения')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **opts):
+        self.base_url = opts['base_url'].rstrip('/')
+        self.rng = random.Random(opts['seed'])
+
+        recipe_ids = list(Recipe.objects.filter(status='published').order_by('?').values_list('pk', flat=True)[:1000])
+        if not recipe_ids:
+            raise CommandError('Нет опубликованных рецептов. Сначала запустите seed_bench.')
+
+        user = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}', is_superuser=False).first()
+        admin, _ = User.objects.get_or_create(
+            email=f'admin@{EMAIL_DOMAIN}', defaults={'is_staff': True, 'is_superuser': True},
+        )
+        if user is None:
+            raise CommandError('Нет пользователей bench. Сначала запустите seed_bench.')
+        user_cookies = self.session_cookies(user)
+        admin_cookies = self.session_cookies(admin)
+
+        rng = self.rng
+        scenarios = {
+            'catalogue': lambda: ('GET', reverse('recipe_list'), None),
+            'search': lambda: ('GET', reverse('recipe_list') + '?' + urllib.parse.urlencode({'q': rng.choice(WORDS)}), None),
+            'detail': lambda: ('GET', reverse('recipe_detail', args=[rng.choice(recipe_ids)]), user_cookies),
+            'reviews': lambda: ('GET', reverse('recipe_reviews', args=[rng.choice(recipe_ids)]), user_cookies),
+            'favorite_toggle': lambda: ('POST', reverse('toggle_favorite', args=[rng.choice(recipe_ids)]), user_cookies),
+            'moderation_queue': lambda: ('GET', reverse('admin_moderation_list'), admin_cookies),
+        }
+
+        results = {}
+        for name, make_request in scenarios.items():
+            requests = [make_request() for _ in range(opts['requests'])]
+            results[name] = self.run_scenario(requests, opts['concurrency'])
+            self.report(name, results[name])
+
+        payload = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'base_url': self.base_url,
+            'concurrency': opts['concurrency'],
+            'requests_per_scenario': opts['requests'],
+            'database': str(settings.DATABASES['default']['NAME']),
+            'recipes': Recipe.objects.count(),
+            'scenarios': results,
+        }
+        output = opts['output'] or f'bench_{datetime.now():%Y%m%d_%H%M%S}.json'
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {output}'))
+
+        if opts['compare']:
+            self.compare(opts['compare'], results)
+
+    def session_cookies(self, user):
+        # Сессия создаётся напрямую, чтобы не проходить форму входа в каждом потоке
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        csrf = get_random_string(32, CSRF_ALLOWED_CHARS)
+        return {
+            settings.SESSION_COOKIE_NAME: session.session_key,
+            settings.CSRF_COOKIE_NAME: csrf,
+        }
+
+    def fetch(self, request):
+        method, path, cookies = request
+        req = urllib.request.Request(self.base_url + path, method=method, data=b'{}' if method == 'POST' else None)
+        if cookies:
+            req.add_header('Cookie', '; '.join(f'{k}={v}' for k, v in cookies.items()))
+            req.add_header('X-CSRFToken', cookies[settings.CSRF_COOKIE_NAME])
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req) as response:
+                response.read()
+                status, queries = response.status, response.headers.get('X-Query-Count')
+        except urllib.error.HTTPError as e:
+            status, queries = e.code, e.headers.get('X-Query-Count')
+        except urllib.error.URLError:
+            status, queries = 0, None
+        elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, status, int(queries) if queries is not None else None
+
+    def run_scenario(self, requests, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(self.fetch, requests))
+        wall = time.perf_counter() - started
+
+        latencies = sorted(s[0] for s in samples)
+        queries = [s[2] for s in samples if s[2] is not None]
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for s in samples if not 200 <= s[1] < 400),
+            'throughput_rps': round(len(samples) / wall, 2) if wall else 0,
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(latencies[-1], 2),
+            'queries_avg': round(statistics.mean(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+
+    def report(self, name, r):
+        self.stdout.write(
+            f"{name:18} p50={r['p50_ms']:8.1f}мс p95={r['p95_ms']:8.1f}мс p99={r['p99_ms']:8.1f}мс "
+            f"rps={r['throughput_rps']:7.1f} ошибки={r['errors']} SQL={r['queries_avg']}"
+        )
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)['scenarios']
+        self.stdout.write(f'Сравнение с {path}:')
+        for name, r in results.items():
+            old = previous.get(name)
+            if not old:
+                continue
+            deltas = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+                if old[key]:
+                    deltas.append(f'{key} {(r[key] - old[key]) / old[key] * 100:+.1f}%')
+            self.stdout.write(f"{name:18} " + ' '.join(deltas))
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recept import tasks
+from recept.models import Task
+
+
+class Command(BaseCommand):
+    help = 'Фоновый воркер: выполняет задачи из очереди и ставит периодические задачи (PERIODIC_TASKS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Пауза, когда очередь пуста (с)')
+
+    def handle(self, *args, **opts):
+        last_scheduled = {}
+        while True:
+            close_old_connections()
+            self.schedule_periodic(last_scheduled)
+            done = tasks.run_pending(limit=50)
+            if done:
+                self.stdout.write(f'Выполнено задач: {done}')
+            if opts['once']:
+                break
+            if not done:
+                time.sleep(opts['sleep'])
+
+    def schedule_periodic(self, last_scheduled):
+        now = time.monotonic()
+        for name, interval in getattr(settings, 'PERIODIC_TASKS', {}).items():
+            if now - last_scheduled.get(name, float('-inf')) < interval:
+                continue
+            last_scheduled[name] = now
+            if not Task.objects.filter(name=name, status__in=['queued', 'running']).exists():
+                tasks.enqueue(name)
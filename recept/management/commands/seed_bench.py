@@ -0,0 +1,171 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recept import homefeed, pagecache, profiles, search, snapshots, stats
+from recept.reviews import recount_all
+from recept.models import (
+    User, Genre, ListIngredient, Recipe, RecipeStep, RecipeIngredient, Review, Favorite,
+)
+
+EMAIL_DOMAIN = 'bench.local'
+BENCH_PASSWORD = 'bench1234'
+
+WORDS = [
+    'борщ', 'пицца', 'суп', 'салат', 'пирог', 'каша', 'паста', 'плов', 'блины', 'котлеты',
+    'курица', 'грибы', 'сыр', 'томатный', 'домашний', 'быстрый', 'острый', 'сладкий', 'овощной', 'рыбный',
+]
+UNITS = ['g', 'ml', 'pcs', 'teasp', 'tablesp', 'kg', 'cup']
+STATUSES = ['published'] * 8 + ['pending', 'draft']
+
+
+def batched(total, size):
+    for start in range(0, total, size):
+        yield start, min(start + size, total)
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетические данные для нагрузочного тестирования (bulk_create пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--genres', type=int, default=30)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--steps', type=int, default=5, help='Шагов на рецепт')
+        parser.add_argument('--recipe-ingredients', type=int, default=8, help='Ингредиентов на рецепт')
+        parser.add_argument('--reviews', type=int, default=5, help='Отзывов на рецепт')
+        parser.add_argument('--favorites', type=int, default=10, help='Избранных рецептов на пользователя')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **opts):
+        self.rng = random.Random(opts['seed'])
+        self.batch_size = opts['batch_size']
+        started = time.perf_counter()
+
+        user_ids = self.create_users(opts['users'])
+        genre_ids = self.create_named(Genre, 'Жанр', opts['genres'])
+        ingredient_ids = self.create_named(ListIngredient, 'Ингредиент', opts['ingredients'])
+        recipe_ids = self.create_recipes(opts, user_ids, genre_ids, ingredient_ids)
+        self.create_favorites(opts['favorites'], user_ids, recipe_ids)
+
+        # bulk_create не вызывает сигналы, поэтому статистику, агрегаты оценок, счётчики пользователей
+        # и блоки главной пересчитываем целиком; снимки собраны по пачкам в create_recipes
+        stats.rollup(hours=48, days=31)
+        recount_all(self.batch_size)
+        profiles.recount_all(self.batch_size)
+        homefeed.build()
+        search.bump_version()
+        pagecache.invalidate('catalogue')
+
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def log(self, label, count, started):
+        self.stdout.write(f'{label}: {count} ({time.perf_counter() - started:.1f} с)')
+
+    def create_users(self, total):
+        started = time.perf_counter()
+        # Хеш пароля считается один раз: PBKDF2 на каждого пользователя занял бы часы
+        password = make_password(BENCH_PASSWORD)
+        offset = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').count()
+        ids = []
+        for start, stop in batched(total, self.batch_size):
+            users = [
+                User(
+                    email=f'user{offset + i}@{EMAIL_DOMAIN}',
+                    full_name=f'Пользователь {offset + i}',
+                    phone_num=f'+7900{offset + i:07d}',
+                    password=password,
+                )
+                for i in range(start, stop)
+            ]
+            ids.extend(u.pk for u in User.objects.bulk_create(users))
+        self.log('Пользователи', len(ids), started)
+        return ids
+
+    def create_named(self, model, prefix, total):
+        existing = set(model.objects.filter(name__startswith=prefix).values_list('name', flat=True))
+        objs = [model(name=f'{prefix} {i}') for i in range(total) if f'{prefix} {i}' not in existing]
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        return list(model.objects.filter(name__startswith=prefix).values_list('pk', flat=True))
+
+    def create_recipes(self, opts, user_ids, genre_ids, ingredient_ids):
+        started = time.perf_counter()
+        rng = self.rng
+        recipe_ids = []
+        GenreLink = Recipe.genres.through
+        n_ingredients = min(opts['recipe_ingredients'], len(ingredient_ids))
+        n_reviews = min(opts['reviews'], len(user_ids))
+
+        for start, stop in batched(opts['recipes'], self.batch_size):
+            with transaction.atomic():
+                recipes = [
+                    Recipe(
+                        user_id=rng.choice(user_ids),
+                        title=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                        description=' '.join(rng.choices(WORDS, k=30)),
+                        status=rng.choice(STATUSES),
+                        portions=rng.randint(1, 8),
+                        calories=rng.randint(100, 900),
+                        estimated_cost=Decimal(rng.randint(5000, 200000)) / 100,
+                    )
+                    for _ in range(start, stop)
+                ]
+                # Отметки модерации как у рецептов, прошедших сайт: по ним строятся лента и очередь модерации
+                now = timezone.now()
+                for recipe in recipes:
+                    if recipe.status != 'draft':
+                        recipe.submitted_at = now
+                    if recipe.status == 'published':
+                        recipe.moderated_at = now
+                recipes = Recipe.objects.bulk_create(recipes)
+
+                links, steps, parts, reviews = [], [], [], []
+                for recipe in recipes:
+                    for genre_id in rng.sample(genre_ids, min(2, len(genre_ids))):
+                        links.append(GenreLink(recipe_id=recipe.pk, genre_id=genre_id))
+                    for order in range(1, opts['steps'] + 1):
+                        steps.append(RecipeStep(recipe_id=recipe.pk, order=order, description=f'Шаг {order}'))
+                    for ingredient_id in rng.sample(ingredient_ids, n_ingredients):
+                        parts.append(RecipeIngredient(
+                            recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                            quantity=Decimal(rng.randint(1, 500)), unit=rng.choice(UNITS),
+                        ))
+                    # Разные авторы отзывов для одного рецепта (unique_together)
+                    first = rng.randrange(len(user_ids))
+                    for j in range(n_reviews):
+                        reviews.append(Review(
+                            recipe_id=recipe.pk, user_id=user_ids[(first + j) % len(user_ids)],
+                            rating=rng.randint(1, 5), comment=' '.join(rng.choices(WORDS, k=8)),
+                        ))
+                    recipe_ids.append(recipe.pk)
+
+                GenreLink.objects.bulk_create(links, batch_size=self.batch_size)
+                RecipeStep.objects.bulk_create(steps, batch_size=self.batch_size)
+                RecipeIngredient.objects.bulk_create(parts, batch_size=self.batch_size)
+                Review.objects.bulk_create(reviews, batch_size=self.batch_size, ignore_conflicts=True)
+                snapshots.build([recipe.pk for recipe in recipes if recipe.status == 'published'])
+            self.log('Рецепты', stop, started)
+        return recipe_ids
+
+    def create_favorites(self, per_user, user_ids, recipe_ids):
+        if not recipe_ids:
+            return
+        started = time.perf_counter()
+        per_user = min(per_user, len(recipe_ids))
+        total = 0
+        for start, stop in batched(len(user_ids), self.batch_size):
+            favorites = []
+            for user_id in user_ids[start:stop]:
+                first = self.rng.randrange(len(recipe_ids))
+                for j in range(per_user):
+                    favorites.append(Favorite(user_id=user_id, recipe_id=recipe_ids[(first + j) % len(recipe_ids)]))
+            Favorite.objects.bulk_create(favorites, batch_size=self.batch_size, ignore_conflicts=True)
+            total += len(favorites)
+        self.log('Избранное', total, started)
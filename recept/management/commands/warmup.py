@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.template import TemplateSyntaxError
+
+from recept import warmup
+
+
+class Command(BaseCommand):
+    # Кеши процесса команды не переживают её завершения: воркеры прогревает gunicorn.conf.py
+    help = 'Проверка прогрева: компиляция шаблонов, маршруты, формы и метаданные моделей (см. recept/warmup.py)'
+
+    def handle(self, *args, **opts):
+        try:
+            results = warmup.run(database=False)
+        except TemplateSyntaxError as e:
+            raise CommandError(f'Шаблоны не компилируются: {e}')
+        for name, (count, seconds) in results.items():
+            self.stdout.write(f'{name:10} {count:6} за {seconds * 1000:8.1f} мс')
+        total = sum(seconds for _, seconds in results.values())
+        self.stdout.write(self.style.SUCCESS(f'Прогрев завершён за {total * 1000:.1f} мс'))
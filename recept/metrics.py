@@ -0,0 +1,259 @@
+"""
+Простой реестр метрик в формате Prometheus.
+
+Каждый процесс хранит значения у себя в памяти. Если задан METRICS_DIR,
+процесс периодически сбрасывает свой снимок в файл <pid>.json в этом каталоге,
+а эндпоинт /metrics/ складывает снимки всех воркеров (pre-fork сервер).
+
+При первом сбросе новый процесс удаляет снимки завершившихся процессов и старый
+файл со своим pid (pid переиспользуется ОС): иначе каталог растёт с каждым
+перезапуском воркера, а новый процесс до первого сброса показывал бы чужие значения.
+Счётчики завершившегося воркера при этом пропадают из суммы - Prometheus видит
+это как сброс счётчика, как при перезапуске сервера.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_lock = threading.Lock()
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def process_alive(pid):
+    if os.name == 'nt':
+        # os.kill в Windows завершает процесс; pre-fork серверы там не работают
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Процесс есть, но принадлежит другому пользователю
+        pass
+    return True
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def snapshot(self):
+        with _lock:
+            return [[list(map(list, key)), value] for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def lines(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(key)} {_format_value(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[_key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                # [счётчики по корзинам..., sum, count]
+                state = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def lines(self, values):
+        for key, state in sorted(values.items()):
+            for bound, count in zip(self.buckets, state):
+                yield f'{self.name}_bucket{_format_labels(key, [("le", _format_value(float(bound)))])} {count}'
+            yield f'{self.name}_bucket{_format_labels(key, [("le", "+Inf")])} {state[-1]}'
+            yield f'{self.name}_sum{_format_labels(key)} {_format_value(float(state[-2]))}'
+            yield f'{self.name}_count{_format_labels(key)} {state[-1]}'
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._last_flush = 0.0
+        # pid, для которого каталог уже очищен; после fork не совпадёт с os.getpid()
+        self._cleaned_for = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self.register(Gauge(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def register_collector(self, func):
+        """func() вызывается при каждом опросе /metrics/ (например, для gauge очереди задач)."""
+        self.collectors.append(func)
+        return func
+
+    # --- многопроцессный режим ---
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items() if metric.kind != 'gauge'}
+
+    def remove_stale(self, directory):
+        """Удаляет снимки завершившихся процессов и прежний файл с pid текущего."""
+        pid = os.getpid()
+        for filename in os.listdir(directory):
+            stem, ext = os.path.splitext(filename)
+            if ext != '.json' or not stem.isdigit():
+                continue
+            if int(stem) == pid or not process_alive(int(stem)):
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except FileNotFoundError:
+                    # Удалил другой воркер, стартовавший одновременно
+                    pass
+        self._cleaned_for = pid
+
+    def flush(self, force=False):
+        directory = self.directory
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0):
+            return
+        self._last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        if self._cleaned_for != os.getpid():
+            self.remove_stale(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, os.path.join(directory, f'{os.getpid()}.json'))
+
+    def _merged_values(self):
+        merged = {name: {} for name in self.metrics}
+        snapshots = []
+        directory = self.directory
+        if directory and os.path.isdir(directory):
+            own = f'{os.getpid()}.json'
+            for filename in os.listdir(directory):
+                if not filename.endswith('.json') or filename == own:
+                    continue
+                try:
+                    with open(os.path.join(directory, filename)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        # Свои значения берутся из памяти, а не из файла: они свежее
+        snapshots.append({name: metric.snapshot() for name, metric in self.metrics.items()})
+
+        for snapshot in snapshots:
+            for name, entries in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                target = merged[name]
+                for key, value in entries:
+                    key = tuple(tuple(item) for item in key)
+                    target[key] = metric.merge(target[key], value) if key in target else value
+        return merged
+
+    def render(self):
+        for collector in self.collectors:
+            collector()
+        merged = self._merged_values()
+        out = []
+        for name, metric in self.metrics.items():
+            out.append(f'# HELP {name} {metric.help}')
+            out.append(f'# TYPE {name} {metric.kind}')
+            out.extend(metric.lines(merged[name]))
+        return '\n'.join(out) + '\n'
+
+
+registry = Registry()
+
+request_latency = registry.histogram(
+    'recept_request_duration_seconds', 'Время обработки запроса по имени URL')
+responses = registry.counter(
+    'recept_responses_total', 'Ответы по имени URL, методу и коду')
+db_queries = registry.histogram(
+    'recept_db_queries_per_request', 'Число SQL-запросов на HTTP-запрос', QUERY_COUNT_BUCKETS)
+db_time = registry.histogram(
+    'recept_db_duration_seconds', 'Время SQL на HTTP-запрос')
+cache_requests = registry.counter(
+    'recept_cache_requests_total', 'Обращения к кэшам (result=hit|miss)')
+search_cache_size = registry.gauge(
+    'recept_search_cache_size', 'Заполненность кеша результатов поиска процесса (unit=entries|ids)')
+job_queue_depth = registry.gauge(
+    'recept_job_queue_depth', 'Число задач, ожидающих фонового воркера')
+recipes_published = registry.counter(
+    'recept_recipes_published_total', 'Опубликованные модератором рецепты')
+reviews_posted = registry.counter(
+    'recept_reviews_posted_total', 'Добавленные или обновлённые отзывы')
+favorites_toggled = registry.counter(
+    'recept_favorites_toggled_total', 'Переключения избранного (action=added|removed)')
@@ -0,0 +1,151 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+from . import instrumentation, metrics
+
+logger = logging.getLogger('recept.queries')
+timing_logger = logging.getLogger('recept.timing')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    # "Форма" запроса: без литералов и с одинаковыми IN (...) для любого количества элементов
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _SPACES_RE.sub(' ', shape).strip()
+
+
+class QueryRecorder:
+    """Записывает все SQL-запросы внутри блока через execute_wrapper."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated_shapes(self, threshold):
+        shapes = Counter(normalize_sql(sql) for sql, _ in self.queries)
+        return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+
+class QueryInspectorMiddleware:
+    """
+    Отладочный middleware: считает SQL-запросы каждого запроса и ищет N+1
+    (один и тот же по форме запрос, повторенный много раз).
+    Включается настройкой QUERY_INSPECTOR_ENABLED (без неё - по DEBUG); настройка
+    читается один раз при загрузке middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_INSPECTOR_ENABLED', settings.DEBUG)
+        self.threshold = getattr(settings, 'QUERY_INSPECTOR_REPEAT_THRESHOLD', 5)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = str(recorder.count)
+        repeated = recorder.repeated_shapes(self.threshold)
+        if repeated:
+            response['X-Query-Repeated'] = str(len(repeated))
+            for shape, n in repeated:
+                logger.warning('Возможный N+1 на %s: %d одинаковых запросов: %s', request.path, n, shape)
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    Разбивает время запроса на SQL, шаблоны, кэш и медиафайлы.
+    Результат отдаётся в заголовке Server-Timing и пишется в лог recept.timing
+    одной JSON-строкой. В выборку попадает доля запросов SERVER_TIMING_SAMPLE_RATE,
+    остальные обрабатываются без обёрток.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 0.0)
+        self.header = getattr(settings, 'SERVER_TIMING_HEADER', True)
+
+    def __call__(self, request):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timings, token = instrumentation.start_request()
+        try:
+            with connection.execute_wrapper(timings):
+                response = self.get_response(request)
+        finally:
+            instrumentation.finish_request(token)
+
+        if self.header:
+            response['Server-Timing'] = timings.server_timing()
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            **timings.as_dict(),
+        }
+        timing_logger.info(json.dumps(record, ensure_ascii=False))
+        return response
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса (время, коды ответов, SQL) по имени URL для /metrics/."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        metrics.request_latency.observe(elapsed, view=view)
+        metrics.responses.inc(view=view, method=request.method, status=response.status_code)
+        metrics.db_queries.observe(recorder.count, view=view)
+        metrics.db_time.observe(recorder.total_time, view=view)
+        metrics.registry.flush()
+        return response
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0004_recipe_moderation_notes_alter_recipe_calories_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('shape', models.TextField(help_text='Нормализованный SQL без литералов')),
+                ('last_sql', models.TextField()),
+                ('last_params_fingerprint', models.CharField(blank=True, max_length=12)),
+                ('last_view', models.CharField(blank=True, help_text='Код проекта, вызвавший запрос', max_length=255)),
+                ('explain', models.TextField(blank=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
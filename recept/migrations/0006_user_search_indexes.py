@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('recept', '0005_slowquery'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='full_name',
+            field=models.CharField(blank=True, db_index=True, max_length=150, null=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='phone_num',
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined'], name='recept_user_date_jo_be8ff2_idx'),
+        ),
+    ]
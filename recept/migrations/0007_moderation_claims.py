@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0006_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_recipes', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='recept_reci_status_86fc33_idx'),
+        ),
+    ]
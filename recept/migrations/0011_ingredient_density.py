@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0010_recipe_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingredient',
+            name='density',
+            field=models.DecimalField(blank=True, decimal_places=3, help_text='Плотность, г/мл', max_digits=6, null=True),
+        ),
+    ]
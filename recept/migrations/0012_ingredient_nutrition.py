@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0011_ingredient_density'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingredient',
+            name='calories',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Калорийность, ккал на 100 г', max_digits=7, null=True),
+        ),
+        migrations.AddField(
+            model_name='listingredient',
+            name='piece_weight',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Масса одной штуки, г', max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='listingredient',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Цена за 1 кг', max_digits=10, null=True),
+        ),
+    ]
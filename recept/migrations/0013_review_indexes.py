@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0012_ingredient_nutrition'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['recipe', 'created_at', 'id'], name='recept_revi_recipe__85e4bf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['recipe', 'rating'], name='recept_revi_recipe__a25486_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:11
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_aggregates(apps, schema_editor):
+    Recipe = apps.get_model('recept', 'Recipe')
+    Review = apps.get_model('recept', 'Review')
+    totals = (
+        Review.objects.filter(rating__gte=1, rating__lte=5).order_by()
+        .values_list('recipe_id').annotate(n=Count('pk'), total=Sum('rating'))
+    )
+    recipes = [Recipe(pk=pk, rating_count=n, rating_sum=total) for pk, n, total in totals]
+    Recipe.objects.bulk_update(recipes, ['rating_count', 'rating_sum'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0013_review_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, help_text='Число оценок 1-5'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, help_text='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_aggregates, migrations.RunPython.noop),
+    ]
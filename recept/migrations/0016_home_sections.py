@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:29
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0015_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HomeSection',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=150)),
+                ('position', models.PositiveSmallIntegerField()),
+                ('items', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:35
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('recept', 'User')
+    Recipe = apps.get_model('recept', 'Recipe')
+    Favorite = apps.get_model('recept', 'Favorite')
+    Review = apps.get_model('recept', 'Review')
+    sources = {
+        'published_recipes_count': Recipe.objects.filter(deleted_at__isnull=True, status='published'),
+        'draft_recipes_count': Recipe.objects.filter(deleted_at__isnull=True, status='draft'),
+        'favorite_recipes_count': Favorite.objects.filter(recipe__deleted_at__isnull=True),
+        'written_reviews_count': Review.objects.filter(recipe__deleted_at__isnull=True, user__isnull=False),
+    }
+    totals = {}
+    for field, rows in sources.items():
+        for user_id, n in rows.order_by().values_list('user_id').annotate(n=Count('pk')):
+            totals.setdefault(user_id, {})[field] = n
+    users = [User(pk=pk, **values) for pk, values in totals.items()]
+    User.objects.bulk_update(users, list(sources), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0016_home_sections'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='draft_recipes_count',
+            field=models.PositiveIntegerField(default=0, help_text='Черновики'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='favorite_recipes_count',
+            field=models.PositiveIntegerField(default=0, help_text='Рецепты в избранном'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='published_recipes_count',
+            field=models.PositiveIntegerField(default=0, help_text='Опубликованные рецепты'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='written_reviews_count',
+            field=models.PositiveIntegerField(default=0, help_text='Написанные отзывы'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', 'added_at', 'id'], name='recept_favo_user_id_6821cf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='recept_reci_user_id_6842cc_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:50
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_heartbeat(apps, schema_editor):
+    # Задачи, зависшие до появления аренды, отсчитываются от начала выполнения
+    Task = apps.get_model('recept', 'Task')
+    Task.objects.filter(status='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0017_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_heartbeat, migrations.RunPython.noop),
+    ]
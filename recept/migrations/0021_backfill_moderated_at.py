@@ -0,0 +1,19 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def fill_moderated_at(apps, schema_editor):
+    # Рецепты, опубликованные до появления поля, попадают в ленту по времени последней правки
+    Recipe = apps.get_model('recept', 'Recipe')
+    Recipe.objects.filter(status='published', moderated_at__isnull=True).update(moderated_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0020_catalogue_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_moderated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def recount_unpublished(apps, schema_editor):
+    # Раньше в счётчик попадали только черновики, рецепты на модерации и отклонённые терялись
+    Recipe = apps.get_model('recept', 'Recipe')
+    User = apps.get_model('recept', 'User')
+    unpublished = Recipe.objects.filter(
+        user_id=OuterRef('pk'), status__in=('draft', 'pending', 'rejected'), deleted_at__isnull=True,
+    ).order_by().values('user_id').annotate(n=Count('pk')).values('n')
+    User.objects.update(draft_recipes_count=Coalesce(Subquery(unpublished), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recept', '0021_backfill_moderated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='draft_recipes_count',
+            field=models.PositiveIntegerField(default=0, help_text='Неопубликованные рецепты: черновики, на модерации, отклонённые'),
+        ),
+        migrations.RunPython(recount_unpublished, migrations.RunPython.noop),
+    ]
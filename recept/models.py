@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Lower
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 class UserManager(BaseUserManager):
@@ -26,20 +29,50 @@ class UserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+    def with_activity_counts(self):
+        # Счётчики рецептов/отзывов/избранного коррелированными подзапросами:
+        # один SQL-запрос без размножения строк от JOIN
+        def count_of(model, field):
+            subquery = (
+                model.objects.filter(**{field: OuterRef('pk')})
+                .order_by().values(field).annotate(n=Count('pk')).values('n')
+            )
+            return Coalesce(Subquery(subquery), 0)
+
+        return self.get_queryset().annotate(
+            recipes_count=count_of(Recipe, 'user'),
+            reviews_count=count_of(Review, 'user'),
+            favorites_count=count_of(Favorite, 'user'),
+        )
+
 
 class User(AbstractUser):
     username = None
     email = models.EmailField(_('email address'), unique=True)
-    phone_num = models.CharField(max_length=20, blank=True, null=True)
+    phone_num = models.CharField(max_length=20, blank=True, null=True, db_index=True)
     full_name = models.CharField(max_length=150, blank=True, null=True)
     birth_date = models.DateField(blank=True, null=True)
     avatar = models.ImageField(upload_to='user_avatars/', blank=True, null=True, help_text='Аватар пользователя')
+    # Пользователь помечен на удаление; данные удаляются фоновой задачей (recept/deletion.py)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Счётчики для шапок профилей, поддерживаются в recept/profiles.py
+    published_recipes_count = models.PositiveIntegerField(default=0, help_text='Опубликованные рецепты')
+    draft_recipes_count = models.PositiveIntegerField(default=0, help_text='Неопубликованные рецепты: черновики, на модерации, отклонённые')
+    favorite_recipes_count = models.PositiveIntegerField(default=0, help_text='Рецепты в избранном')
+    written_reviews_count = models.PositiveIntegerField(default=0, help_text='Написанные отзывы')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['date_joined']),
+            # Поиск по началу email без учёта регистра в админке пользователей
+            models.Index(Lower('email'), name='recept_user_email_lower_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -53,11 +86,24 @@ class Genre(models.Model):
 
 class ListIngredient(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    # Для пересчёта объёма в массу (см. recept/portions.py)
+    density = models.DecimalField(max_digits=6, decimal_places=3, blank=True, null=True, help_text='Плотность, г/мл')
+    # Для расчёта калорийности и стоимости рецептов (см. recept/nutrition.py)
+    calories = models.DecimalField(max_digits=7, decimal_places=2, blank=True, null=True, help_text='Калорийность, ккал на 100 г')
+    price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, help_text='Цена за 1 кг')
+    piece_weight = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True, help_text='Масса одной штуки, г')
 
     def __str__(self):
         return self.name
 
 
+class RecipeManager(models.Manager):
+    """Рецепты без помеченных на удаление (см. recept/deletion.py)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Recipe(models.Model):
     STATUS_CHOICES = [
         ('draft', 'Черновик'),
@@ -85,18 +131,63 @@ class Recipe(models.Model):
         null=True, 
         help_text='Комментарии администратора при отклонении'
         )
+    # Аренда рецепта модератором (см. recept/moderation.py)
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_recipes')
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    submitted_at = models.DateTimeField(null=True, blank=True, db_index=True, help_text='Когда рецепт отправлен на модерацию')
+    moderated_at = models.DateTimeField(null=True, blank=True, db_index=True, help_text='Когда модератор принял решение')
+    deleted_at = models.DateTimeField(null=True, blank=True, help_text='Когда рецепт помечен на удаление')
+    # Агрегаты оценок, обновляются в одной транзакции с отзывом (см. recept/reviews.py)
+    rating_count = models.PositiveIntegerField(default=0, help_text='Число оценок 1-5')
+    rating_sum = models.PositiveIntegerField(default=0, help_text='Сумма оценок')
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = RecipeManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Очередь модерации: keyset-пагинация по (created_at, id) внутри статуса
+            models.Index(fields=['status', 'created_at', 'id']),
+            # Рецепты автора в профиле
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения на момент загрузки: profiles.recipe_saved сравнивает их с сохранёнными
+        instance._counted_state = instance.counted_state()
+        return instance
+
+    def counted_state(self):
+        """Поля, от которых зависят счётчики пользователей (см. recept/profiles.py)."""
+        # Через __dict__: отложенное поле не загружается отдельным запросом
+        return tuple(self.__dict__.get(f) for f in ('status', 'user_id', 'deleted_at'))
+
     def get_status_display(self):
         return dict(self.STATUS_CHOICES).get(self.status, self.status)
 
+    @property
+    def average_rating(self):
+        return round(self.rating_sum / self.rating_count, 1) if self.rating_count else None
 
 
+class RecipeSnapshot(models.Model):
+    """Денормализованный документ опубликованного рецепта (см. recept/snapshots.py)."""
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    version = models.PositiveSmallIntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Снимок рецепта #{self.recipe_id} (v{self.version})'
+
 
 class RecipeStep(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='steps')
@@ -134,15 +225,146 @@ class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     rating = models.PositiveSmallIntegerField(default=0) 
     comment = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         unique_together = ('recipe', 'user')
+        indexes = [
+            # Лента отзывов рецепта: keyset-пагинация по (created_at, id) (см. recept/reviews.py)
+            models.Index(fields=['recipe', 'created_at', 'id']),
+            # Гистограмма оценок читается только из индекса
+            models.Index(fields=['recipe', 'rating']),
+        ]
 
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='favorited_by')
-    added_at = models.DateTimeField(auto_now_add=True)
+    added_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'recipe')
+        indexes = [
+            # Страница избранного: keyset-пагинация по (added_at, id)
+            models.Index(fields=['user', 'added_at', 'id']),
+        ]
+
+
+class SlowQuery(models.Model):
+    """Журнал медленных запросов, сгруппированный по форме запроса (см. recept/slowlog.py)."""
+    fingerprint = models.CharField(max_length=40, unique=True)
+    shape = models.TextField(help_text='Нормализованный SQL без литералов')
+    last_sql = models.TextField()
+    last_params_fingerprint = models.CharField(max_length=12, blank=True)
+    last_view = models.CharField(max_length=255, blank=True, help_text='Код проекта, вызвавший запрос')
+    explain = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-total_ms']
+
+    def __str__(self):
+        return self.shape[:80]
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0
+
+
+
+class Task(models.Model):
+    """Задача для фонового воркера (manage.py run_worker), см. recept/tasks.py."""
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнена'),
+        ('failed', 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Отметка живого воркера: ставится при захвате и в report_progress()
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
-        unique_together = ('user', 'recipe')
\ No newline at end of file
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
+
+
+class StatBucket(models.Model):
+    """Предрасчитанная статистика за час или день (см. recept/stats.py)."""
+    PERIOD_CHOICES = [
+        ('hour', 'Час'),
+        ('day', 'День'),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    start = models.DateTimeField()
+    metric = models.CharField(max_length=40)
+    value = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('period', 'start', 'metric')
+
+    def __str__(self):
+        return f'{self.metric} {self.period} {self.start:%Y-%m-%d %H:%M}: {self.value}'
+
+
+class Notification(models.Model):
+    """Событие для пользователя, доставляется потоком SSE (см. recept/events.py)."""
+    KIND_CHOICES = [
+        ('approved', 'Рецепт опубликован'),
+        ('rejected', 'Рецепт отклонён'),
+        ('review', 'Новый отзыв'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Догрузка пропущенного по Last-Event-ID
+            models.Index(fields=['user', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} для {self.user_id}'
+
+
+class CatalogueVersion(models.Model):
+    """Версия каталога опубликованных рецептов (см. recept/search.py): одна строка с pk=1."""
+    version = models.PositiveBigIntegerField(default=0)
+
+
+class HomeSection(models.Model):
+    """Готовый блок главной страницы: заголовок и карточки рецептов (см. recept/homefeed.py)."""
+    key = models.CharField(max_length=40, primary_key=True)
+    title = models.CharField(max_length=150)
+    position = models.PositiveSmallIntegerField()
+    items = models.JSONField(encoder=DjangoJSONEncoder)
+    built_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['position']
+
+    def __str__(self):
+        return self.title
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import events, metrics, pagecache, profiles, search, snapshots, stats
+from .models import Recipe
+
+
+def lease_duration():
+    return timedelta(minutes=getattr(settings, 'MODERATION_LEASE_MINUTES', 15))
+
+
+def available_to(moderator, now):
+    # Рецепт свободен, если его никто не взял, аренда истекла или он уже у этого модератора
+    return Q(claimed_by__isnull=True) | Q(claimed_until__lt=now) | Q(claimed_by=moderator)
+
+
+def encode_cursor(recipe):
+    return f'{recipe.created_at.isoformat()}_{recipe.pk}'
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def queue_page(after=None, limit=50):
+    """Страница очереди модерации по ключу (created_at, id), без OFFSET."""
+    recipes = Recipe.objects.filter(status='pending')
+    position = decode_cursor(after) if after else None
+    if position:
+        created_at, pk = position
+        recipes = recipes.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+    recipes = list(
+        recipes.select_related('user', 'claimed_by').prefetch_related('genres')
+        .order_by('created_at', 'pk')[:limit + 1]
+    )
+    next_cursor = encode_cursor(recipes[limit - 1]) if len(recipes) > limit else None
+    return recipes[:limit], next_cursor
+
+
+def claim_batch(moderator, size=None, attempts=3):
+    """
+    Выдаёт модератору непересекающуюся с другими пачку рецептов из начала очереди.
+    Захват делается условным UPDATE: если другой модератор успел раньше,
+    его рецепты просто не обновятся, и недостающее добирается следующей попыткой.
+    """
+    size = size or getattr(settings, 'MODERATION_BATCH_SIZE', 20)
+    now = timezone.now()
+    until = now + lease_duration()
+
+    # Продлеваем то, что уже взято этим модератором
+    Recipe.objects.filter(status='pending', claimed_by=moderator).update(claimed_until=until)
+
+    for _ in range(attempts):
+        mine = Recipe.objects.filter(status='pending', claimed_by=moderator, claimed_until__gte=now).count()
+        missing = size - mine
+        if missing <= 0:
+            break
+        candidates = list(
+            Recipe.objects.filter(status='pending')
+            .filter(Q(claimed_by__isnull=True) | Q(claimed_until__lt=now))
+            .order_by('created_at', 'pk')
+            .values_list('pk', flat=True)[:missing]
+        )
+        if not candidates:
+            break
+        Recipe.objects.filter(pk__in=candidates, status='pending').filter(
+            Q(claimed_by__isnull=True) | Q(claimed_until__lt=now)
+        ).update(claimed_by=moderator, claimed_until=until)
+
+    return (
+        Recipe.objects.filter(status='pending', claimed_by=moderator)
+        .select_related('user').prefetch_related('genres')
+        .order_by('created_at', 'pk')
+    )
+
+
+def release_claims(moderator):
+    return Recipe.objects.filter(status='pending', claimed_by=moderator).update(claimed_by=None, claimed_until=None)
+
+
+def moderate(recipe_ids, moderator, approve, notes=None):
+    """
+    Одобряет или отклоняет рецепты одним условным UPDATE ... WHERE status='pending'.
+    Рецепты, взятые в работу другим модератором, не трогаются.
+    Возвращает список id, которые действительно сменили статус.
+    """
+    now = timezone.now()
+    status = 'published' if approve else 'rejected'
+    with transaction.atomic():
+        # Проверка аренды - в самом UPDATE: модератор, взявший рецепт между чтением
+        # и записью, не будет перезаписан (select_for_update на SQLite ничего не блокирует)
+        updated = Recipe.objects.filter(pk__in=recipe_ids, status='pending').filter(available_to(moderator, now)).update(
+            status=status,
+            moderation_notes=None if approve else (notes or 'Причина не указана.'),
+            claimed_by=None,
+            claimed_until=None,
+            updated_at=now,
+            moderated_at=now,
+        )
+        if not updated:
+            return []
+        # Изменённые этим UPDATE строки помечены moderated_at=now
+        recipes = list(
+            Recipe.objects.filter(pk__in=recipe_ids, status=status, moderated_at=now)
+            .order_by('pk').values_list('pk', 'user_id', 'title')
+        )
+        ids = [pk for pk, _, _ in recipes]
+        # Авторы узнают о решении из потока /events/ (см. recept/events.py)
+        events.notify(events.moderation_rows(recipes, approve, notes))
+        pagecache.invalidate('catalogue', *(f'recipe:{pk}' for pk, _, _ in recipes), *(f'user:{u}' for _, u, _ in recipes))
+        profiles.refresh({user_id for _, user_id, _ in recipes})
+    if approve:
+        metrics.recipes_published.inc(len(ids))
+        snapshots.rebuild(ids)
+        search.catalogue_changed()
+    stats.record('recipes_published' if approve else 'recipes_rejected', len(ids), when=now)
+    return ids
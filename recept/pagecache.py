@@ -0,0 +1,207 @@
+"""
+Кеш целых страниц для анонимных посетителей.
+
+Главная, каталог, страница рецепта и профиль автора отдаются из кеша Django,
+если посетитель не вошёл и у него нет ожидающих сообщений (messages). Ключ - путь
+вместе со строкой запроса. Кешируются только ответы 200 без установки cookie.
+
+У записи есть теги ('catalogue', 'recipe:<id>', 'user:<id>', 'ingredients'). Изменение данных
+меняет версию тега (после коммита), и все записи с ним становятся устаревшими.
+Запись не удаляется: пока её перестраивает один запрос (блокировка cache.add),
+остальные посетители получают старую копию. Так популярная страница после
+правки или истечения PAGE_CACHE_TTL не приводит к лавине одинаковых рендеров.
+Устаревшая копия живёт ещё PAGE_CACHE_STALE секунд, потом страница строится заново.
+Если копии нет совсем (первый запрос, вытеснение), блокировку берёт тоже один
+запрос, а остальные до PAGE_CACHE_WAIT секунд ждут его результата и только потом
+строят страницу сами.
+
+Версии меняют обработчики сигналов моделей ниже и явные вызовы invalidate()
+там, где данные пишутся через update() и bulk_create() без сигналов.
+Для нескольких процессов нужен общий бэкенд кеша (Redis, Memcached).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+from .instrumentation import record_cache
+from .models import Genre, ListIngredient, Recipe, Review, User
+
+LOCK_TIMEOUT = 30
+WAIT_STEP = 0.05
+
+
+def ttl():
+    return getattr(settings, 'PAGE_CACHE_TTL', 60)
+
+
+def stale_ttl():
+    return getattr(settings, 'PAGE_CACHE_STALE', 3600)
+
+
+def wait_timeout():
+    return getattr(settings, 'PAGE_CACHE_WAIT', 2.0)
+
+
+def tag_key(tag):
+    return f'pagecache:tag:{tag}'
+
+
+def page_key(request):
+    return 'pagecache:page:' + hashlib.md5(request.get_full_path().encode()).hexdigest()
+
+
+# Инвалидация
+
+def bump(tags):
+    # Новая версия - время: после вытеснения ключа версия не повторит прежнюю
+    cache.set_many({tag_key(tag): time.time_ns() for tag in tags}, None)
+
+
+def invalidate(*tags):
+    """Делает устаревшими страницы с тегами; версии меняются после коммита."""
+    tags = set(tags)
+    if tags:
+        transaction.on_commit(lambda: bump(tags))
+
+
+def versions(tags):
+    found = cache.get_many([tag_key(tag) for tag in tags])
+    return {tag: found.get(tag_key(tag), 0) for tag in tags}
+
+
+@receiver([post_save, post_delete], sender=Recipe, dispatch_uid='pagecache_recipe')
+def recipe_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate('catalogue', f'recipe:{instance.pk}', f'user:{instance.user_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.genres.through, dispatch_uid='pagecache_recipe_genres')
+def recipe_genres_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate('catalogue', f'recipe:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Review, dispatch_uid='pagecache_review')
+def review_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(f'recipe:{instance.recipe_id}')
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='pagecache_user')
+def user_changed(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Вход сохраняет только last_login: страницы от него не меняются
+    if not raw and set(update_fields or ()) != {'last_login'}:
+        invalidate('catalogue', f'user:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Genre, dispatch_uid='pagecache_genre')
+def genre_changed(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate('catalogue')
+
+
+@receiver([post_save, post_delete], sender=ListIngredient, dispatch_uid='pagecache_ingredient')
+def ingredient_changed(sender, raw=False, created=False, **kwargs):
+    # Плотность меняет пересчёт в граммы (см. recept/portions.py); новый ингредиент ещё ни в одном рецепте
+    if not raw and not created:
+        invalidate('ingredients')
+
+
+# Кеширование
+
+def add_tags(request, *tags):
+    """Добавляет теги к странице, которые представление узнаёт только из данных."""
+    if hasattr(request, 'page_cache_tags'):
+        request.page_cache_tags.update(tags)
+
+
+def anonymous_visitor(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # len() не помечает сообщения прочитанными
+    return not len(get_messages(request))
+
+
+def stored(response, tag_versions):
+    return {
+        'status': response.status_code,
+        'headers': list(response.items()),
+        'content': response.content,
+        'created': time.time(),
+        'versions': tag_versions,
+    }
+
+
+def restored(entry, state):
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for name, value in entry['headers']:
+        response[name] = value
+    response['X-Page-Cache'] = state
+    return response
+
+
+def wait_for(key):
+    """Ждёт копию, которую строит запрос с блокировкой; None, если она не появилась."""
+    deadline = time.monotonic() + wait_timeout()
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def cache_page(*tags):
+    """
+    Кеширует страницу для анонимов. Теги - шаблоны с аргументами представления,
+    например 'recipe:{pk}'.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not anonymous_visitor(request):
+                return view(request, *args, **kwargs)
+
+            key = page_key(request)
+            entry = cache.get(key)
+            if entry is not None and time.time() - entry['created'] < ttl() and versions(entry['versions']) == entry['versions']:
+                record_cache(True, name='page')
+                return restored(entry, 'hit')
+            # Строит страницу один запрос
+            lock = key + ':lock'
+            if not cache.add(lock, 1, LOCK_TIMEOUT):
+                lock = None
+                if entry is not None:
+                    # Остальные получают устаревшую копию
+                    record_cache(True, name='page')
+                    return restored(entry, 'stale')
+                # Копии нет: ждём строящий запрос, не дождались - строим сами без блокировки
+                entry = wait_for(key)
+                if entry is not None:
+                    record_cache(True, name='page')
+                    return restored(entry, 'hit')
+            record_cache(False, name='page')
+
+            try:
+                request.page_cache_tags = {tag.format(**kwargs) for tag in tags}
+                # Версии до рендеринга: правка во время рендеринга сделает копию устаревшей
+                tag_versions = versions(request.page_cache_tags)
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming and not response.cookies:
+                    tag_versions.update(versions(request.page_cache_tags - set(tag_versions)))
+                    cache.set(key, stored(response, tag_versions), ttl() + stale_ttl())
+                response['X-Page-Cache'] = 'miss'
+                return response
+            finally:
+                if lock:
+                    cache.delete(lock)
+        return wrapper
+    return decorator
@@ -0,0 +1,170 @@
+"""
+Пересчёт ингредиентов рецепта на другое число порций и в другую систему единиц.
+
+Все вычисления в Decimal над всем списком ингредиентов сразу: количества
+приводятся к базовой единице (г, мл, шт), умножаются на общий коэффициент
+порций и переводятся в единицы выбранной системы:
+- original - единицы, указанные автором;
+- metric - граммы/килограммы и миллилитры (ложки и кружки переводятся в мл);
+- mass - по возможности всё в граммах, объём пересчитывается через плотность.
+Результат кешируется по (рецепт, версия рецепта, порции, система); для mass в ключ
+входит ещё версия справочника ингредиентов (тег 'ingredients' в recept/pagecache.py).
+"""
+import hashlib
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+
+from . import pagecache
+from .instrumentation import record_cache
+from .models import ListIngredient, RecipeIngredient
+
+UNITS = dict(RecipeIngredient._meta.get_field('unit').choices)
+
+# единица -> (величина, множитель к базовой единице)
+UNIT_BASE = {
+    'g': ('mass', Decimal('1')),
+    'kg': ('mass', Decimal('1000')),
+    'ml': ('volume', Decimal('1')),
+    'teasp': ('volume', Decimal('5')),
+    'tablesp': ('volume', Decimal('15')),
+    'cup': ('volume', Decimal('250')),
+    'pcs': ('count', Decimal('1')),
+}
+BASE_UNIT = {'mass': 'g', 'volume': 'ml', 'count': 'pcs'}
+
+SYSTEMS = {
+    'original': 'Как у автора',
+    'metric': 'Граммы и миллилитры',
+    'mass': 'Всё в граммах',
+}
+
+# Плотность (г/мл) распространённых ингредиентов, если в справочнике она не указана
+DEFAULT_DENSITIES = {
+    'вода': Decimal('1.000'),
+    'молоко': Decimal('1.030'),
+    'кефир': Decimal('1.030'),
+    'сливки': Decimal('1.010'),
+    'масло растительное': Decimal('0.920'),
+    'подсолнечное масло': Decimal('0.920'),
+    'оливковое масло': Decimal('0.910'),
+    'мука': Decimal('0.530'),
+    'сахар': Decimal('0.850'),
+    'соль': Decimal('1.200'),
+    'мёд': Decimal('1.420'),
+    'мед': Decimal('1.420'),
+    'рис': Decimal('0.850'),
+    'сметана': Decimal('1.000'),
+}
+
+MAX_PORTIONS = 100
+CACHE_TIMEOUT = 60 * 60
+CENT = Decimal('0.01')
+
+
+def parse_portions(value, default):
+    try:
+        portions = int(value)
+    except (TypeError, ValueError):
+        return default
+    return portions if 1 <= portions <= MAX_PORTIONS else default
+
+
+def parse_system(value):
+    return value if value in SYSTEMS else 'original'
+
+
+def density(name, value):
+    """Плотность из справочника или табличная по названию ингредиента."""
+    return value or DEFAULT_DENSITIES.get(name.strip().casefold())
+
+
+def densities_for(ingredient_ids):
+    """{id ингредиента: плотность} одним запросом, с подстановкой табличных значений."""
+    result = {}
+    for pk, name, value in ListIngredient.objects.filter(pk__in=ingredient_ids).values_list('pk', 'name', 'density'):
+        value = density(name, value)
+        if value:
+            result[pk] = value
+    return result
+
+
+def to_base(quantities, units):
+    """Векторы количеств и единиц -> (величины, количества в базовых единицах)."""
+    kinds = [UNIT_BASE[u][0] for u in units]
+    base = [Decimal(q) * UNIT_BASE[u][1] for q, u in zip(quantities, units)]
+    return kinds, base
+
+
+def to_mass(kinds, base, densities):
+    """Объёмы с известной плотностью -> граммы; возвращает новые (величины, количества)."""
+    converted = [
+        ('mass', b * density) if kind == 'volume' and density else (kind, b)
+        for kind, b, density in zip(kinds, base, densities)
+    ]
+    return [k for k, _ in converted], [b for _, b in converted]
+
+
+def metric_units(kinds, base):
+    """Количества в базовых единицах -> (количества, единицы): г/кг, мл, шт."""
+    out_units = [
+        'kg' if kind == 'mass' and b >= 1000 else BASE_UNIT[kind]
+        for kind, b in zip(kinds, base)
+    ]
+    return [b / UNIT_BASE[u][1] for b, u in zip(base, out_units)], out_units
+
+
+def from_base(kinds, base, units, densities, system):
+    """Перевод из базовых единиц в единицы системы; возвращает (количества, единицы)."""
+    if system == 'original':
+        return [b / UNIT_BASE[u][1] for b, u in zip(base, units)], list(units)
+    if system == 'mass':
+        kinds, base = to_mass(kinds, base, densities)
+    return metric_units(kinds, base)
+
+
+def convert(ingredients, factor, system, densities=None):
+    """
+    Пересчитывает список ингредиентов ({'quantity', 'unit', 'ingredient_id', ...})
+    с коэффициентом factor в систему system. Возвращает новые словари.
+    """
+    if not ingredients:
+        return []
+    densities = densities or {}
+    units = [i['unit'] for i in ingredients]
+    kinds, base = to_base([i['quantity'] for i in ingredients], units)
+    factor = Decimal(factor)
+    base = [b * factor for b in base]
+    row_densities = [densities.get(i.get('ingredient_id')) for i in ingredients]
+    quantities, out_units = from_base(kinds, base, units, row_densities, system)
+    return [
+        dict(ingredient, quantity=q.quantize(CENT, ROUND_HALF_UP), unit=u, unit_display=UNITS.get(u, u))
+        for ingredient, q, u in zip(ingredients, quantities, out_units)
+    ]
+
+
+def scaled_ingredients(document, portions, system):
+    """
+    Ингредиенты документа рецепта (см. recept/snapshots.py) на portions порций в системе
+    system. Без изменений возвращает исходный список; иначе результат берётся из кеша.
+    """
+    original = document['portions'] or 1
+    if portions == original and system == 'original':
+        return document['ingredients']
+
+    version = hashlib.md5(str(document['updated_at']).encode()).hexdigest()[:12]
+    if system == 'mass':
+        # Плотности берутся из справочника, а не из рецепта: их правка рецепт не меняет
+        version += f":{pagecache.versions(['ingredients'])['ingredients']}"
+    key = f"portions:{document['id']}:{version}:{portions}:{system}"
+    cached = cache.get(key)
+    record_cache(cached is not None, name='portions')
+    if cached is not None:
+        return cached
+
+    densities = {}
+    if system == 'mass':
+        densities = densities_for({i['ingredient_id'] for i in document['ingredients']})
+    result = convert(document['ingredients'], Decimal(portions) / Decimal(original), system, densities)
+    cache.set(key, result, CACHE_TIMEOUT)
+    return result
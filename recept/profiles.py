@@ -0,0 +1,126 @@
+"""
+Счётчики пользователя и постраничный вывод профилей и избранного.
+
+На User хранятся числа опубликованных и неопубликованных (черновики, на модерации,
+отклонённые) рецептов, избранного и написанных отзывов - шапки профилей показывают их без COUNT. Учитываются только
+рецепты, не помеченные на удаление: удаление рецепта сразу меняет счётчики тех,
+кто добавил его в избранное или оставил отзыв, а не после очистки в фоне.
+
+Где изменение известно заранее (избранное, новый отзыв), счётчик сдвигается
+UPDATE ... SET n = n + 1. Статусы рецептов меняются пачками через update()
+(модерация, удаление), там счётчики затронутых пользователей пересчитываются
+одним UPDATE с подзапросами, как агрегаты оценок в reviews.py.
+
+Списки листаются по ключу (created_at, id) или (added_at, id) без OFFSET.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import moderation
+from .models import Favorite, Recipe, Review, User
+
+PAGE_SIZE = 24
+
+# Поле счётчика -> (модель, фильтр по строкам пользователя)
+COUNTERS = {
+    'published_recipes_count': (Recipe, {'status': 'published'}),
+    # Все неопубликованные: иначе рецепт на модерации или отклонённый не попадал ни в один счётчик
+    'draft_recipes_count': (Recipe, {'status__in': ('draft', 'pending', 'rejected')}),
+    'favorite_recipes_count': (Favorite, {'recipe__deleted_at__isnull': True}),
+    'written_reviews_count': (Review, {'recipe__deleted_at__isnull': True}),
+}
+
+
+def counted(field):
+    model, conditions = COUNTERS[field]
+    # Recipe.objects уже без удалённых
+    return model.objects.filter(**conditions).order_by().values('user_id')
+
+
+def adjust(user_id, **deltas):
+    """Сдвигает счётчики пользователя: adjust(id, favorite_recipes_count=1)."""
+    # Не ниже нуля: строки, записанные в обход приложения (админка, импорт), не роняют запрос
+    User.objects.filter(pk=user_id).update(**{field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()})
+
+
+def refresh(users):
+    """Пересчитывает счётчики пользователей (queryset или список id) одним UPDATE."""
+    User.objects.filter(pk__in=users).update(**{
+        field: Coalesce(Subquery(
+            counted(field).filter(user_id=OuterRef('pk')).annotate(n=Count('pk')).values('n')
+        ), 0)
+        for field in COUNTERS
+    })
+
+
+def refresh_for_recipes(recipes):
+    """Пересчёт для авторов рецептов и всех, у кого они в избранном или с отзывом."""
+    in_recipes = {'recipe__in': recipes.values('pk')}
+    refresh(User.objects.filter(
+        Q(pk__in=recipes.values('user_id'))
+        | Q(pk__in=Favorite.objects.filter(**in_recipes).values('user_id'))
+        | Q(pk__in=Review.objects.filter(**in_recipes).values('user_id'))
+    ).values('pk'))
+
+
+def recount_all(batch_size=2000):
+    """Пересчитывает счётчики всех пользователей, например после bulk_create."""
+    totals = {}
+    for field in COUNTERS:
+        for user_id, n in counted(field).annotate(n=Count('pk')).values_list('user_id', 'n'):
+            if user_id is not None:
+                totals.setdefault(user_id, {})[field] = n
+    users = [User(pk=pk, **values) for pk, values in totals.items()]
+    with transaction.atomic():
+        User.objects.update(**{field: 0 for field in COUNTERS})
+        User.objects.bulk_update(users, list(COUNTERS), batch_size=batch_size)
+
+
+@receiver([post_save, post_delete], sender=Recipe, dispatch_uid='profiles_recipe')
+def recipe_saved(sender, instance, signal, raw=False, created=False, **kwargs):
+    # Правка названия, описания, фото счётчиков не меняет: пересчёт только при смене
+    # статуса, автора или отметки удаления, а также при создании и удалении
+    if raw:
+        return
+    previous = getattr(instance, '_counted_state', None)
+    current = instance.counted_state()
+    instance._counted_state = current
+    if signal is post_save and not created and previous == current:
+        return
+    users = {instance.user_id}
+    if previous and previous[1]:
+        # При смене автора счётчики меняются и у прежнего
+        users.add(previous[1])
+    refresh(users)
+
+
+# Постраничный вывод
+
+def favorite_cursor(favorite):
+    return f'{favorite.added_at.isoformat()}_{favorite.pk}'
+
+
+def recipes_page(recipes, after=None, limit=PAGE_SIZE):
+    """Страница рецептов от новых к старым и курсор следующей страницы."""
+    position = moderation.decode_cursor(after) if after else None
+    if position:
+        created_at, pk = position
+        recipes = recipes.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    recipes = list(recipes.order_by('-created_at', '-pk')[:limit + 1])
+    next_cursor = moderation.encode_cursor(recipes[limit - 1]) if len(recipes) > limit else None
+    return recipes[:limit], next_cursor
+
+
+def favorites_page(user, after=None, limit=PAGE_SIZE):
+    """Страница избранных рецептов от недавно добавленных и курсор следующей страницы."""
+    favorites = Favorite.objects.filter(user=user, recipe__deleted_at__isnull=True)
+    position = moderation.decode_cursor(after) if after else None
+    if position:
+        added_at, pk = position
+        favorites = favorites.filter(Q(added_at__lt=added_at) | Q(added_at=added_at, pk__lt=pk))
+    favorites = list(favorites.select_related('recipe', 'recipe__user').order_by('-added_at', '-pk')[:limit + 1])
+    next_cursor = favorite_cursor(favorites[limit - 1]) if len(favorites) > limit else None
+    return [favorite.recipe for favorite in favorites[:limit]], next_cursor
@@ -0,0 +1,153 @@
+"""
+Отзывы к рецепту: запись, страницы по ключу и распределение оценок.
+
+Запись отзыва - одна транзакция: блокировка строки рецепта, один
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING по уникальной паре (recipe, user),
+затем пересчёт агрегатов Recipe.rating_count/rating_sum по индексу (recipe, rating).
+Новизну отзыва (счётчики, уведомление автору) сообщает сам этот оператор, а не
+проверка перед записью: из двух одновременных отправок новой считается ровно одна,
+даже если запись идёт в обход блокировки рецепта (админка). Отправки не падают на
+unique_together, а агрегаты не расходятся с отзывами. Частота записи ограничена на пользователя (REVIEW_THROTTLE_RATE).
+
+Лента отзывов листается по (created_at, id) в обратном порядке без OFFSET и COUNT,
+поэтому страница популярного рецепта с тысячами отзывов стоит столько же, сколько
+страница нового. Гистограмма 1-5 звёзд, общее число и средняя оценка считаются
+одним сгруппированным запросом по индексу (recipe, rating).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import events, pagecache, profiles, stats
+from .moderation import decode_cursor, encode_cursor
+from .models import Recipe, Review
+
+PAGE_SIZE = 20
+STARS = (5, 4, 3, 2, 1)
+
+
+def throttled(user):
+    """
+    True, если пользователь исчерпал лимит записей в текущем окне.
+    Счётчик в кеше: для нескольких процессов нужен общий кеш (Redis, Memcached).
+    """
+    limit, window = getattr(settings, 'REVIEW_THROTTLE_RATE', (5, 60))
+    key = f'throttle:review:{user.pk}:{int(time.time() // window)}'
+    cache.add(key, 0, window)
+    try:
+        return cache.incr(key) > limit
+    except ValueError:
+        # ключ истёк между add и incr
+        return False
+
+
+def rated(recipe_id):
+    return Review.objects.filter(recipe_id=recipe_id, rating__gte=1, rating__lte=5).order_by().values('recipe_id')
+
+
+def refresh_aggregates(recipe_id):
+    """Пересчитывает агрегаты оценок рецепта одним UPDATE с подзапросами."""
+    Recipe.all_objects.filter(pk=recipe_id).update(
+        rating_count=Coalesce(Subquery(rated(recipe_id).annotate(n=Count('pk')).values('n')), 0),
+        rating_sum=Coalesce(Subquery(rated(recipe_id).annotate(total=Sum('rating')).values('total')), 0),
+    )
+
+
+def recount_all(batch_size=2000):
+    """Пересчитывает агрегаты всех рецептов, например после bulk_create отзывов."""
+    totals = (
+        Review.objects.filter(rating__gte=1, rating__lte=5).order_by()
+        .values_list('recipe_id').annotate(n=Count('pk'), total=Sum('rating'))
+    )
+    recipes = [Recipe(pk=pk, rating_count=n, rating_sum=total) for pk, n, total in totals]
+    with transaction.atomic():
+        Recipe.all_objects.update(rating_count=0, rating_sum=0)
+        Recipe.all_objects.bulk_update(recipes, ['rating_count', 'rating_sum'], batch_size=batch_size)
+
+
+def upsert(recipe_id, user_id, rating, comment):
+    """
+    Записывает отзыв одним INSERT ... ON CONFLICT DO UPDATE; True, если строка вставлена.
+    created_at задаётся явно: у обновлённой строки остаётся прежний, и RETURNING сравнивает
+    их (xmax, как в PostgreSQL, в SQLite нет).
+    """
+    opts = Review._meta
+    quote = connection.ops.quote_name
+    columns = [opts.get_field(name) for name in ('recipe', 'user', 'rating', 'comment', 'created_at')]
+    recipe_column, user_column, rating_column, comment_column, created_column = [quote(c.column) for c in columns]
+    created_at = columns[-1].get_db_prep_value(timezone.now(), connection)
+    sql = (
+        f'INSERT INTO {quote(opts.db_table)} ({recipe_column}, {user_column}, {rating_column}, {comment_column}, {created_column}) '
+        f'VALUES (%s, %s, %s, %s, %s) '
+        f'ON CONFLICT ({recipe_column}, {user_column}) DO UPDATE '
+        f'SET {rating_column} = excluded.{rating_column}, {comment_column} = excluded.{comment_column} '
+        f'RETURNING {created_column} = %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [recipe_id, user_id, rating, comment, created_at, created_at])
+        return bool(cursor.fetchone()[0])
+
+
+def submit(recipe_id, user, rating, comment):
+    """Создаёт или обновляет отзыв пользователя; возвращает True, если отзыв новый."""
+    with transaction.atomic():
+        # Блокировка рецепта упорядочивает запись отзывов к нему (на SQLite запись и так последовательна)
+        author_id, title = Recipe.all_objects.select_for_update().filter(pk=recipe_id).values_list('user_id', 'title').get()
+        created = upsert(recipe_id, user.pk, rating, comment)
+        refresh_aggregates(recipe_id)
+        pagecache.invalidate(f'recipe:{recipe_id}')
+        # Запись мимо ORM не вызывает post_save, поэтому статистика отмечается здесь
+        if created:
+            stats.record('reviews')
+            profiles.adjust(user.pk, written_reviews_count=1)
+            if author_id != user.pk:
+                events.notify([events.review_row(recipe_id, author_id, title, user, rating)])
+    return created
+
+
+def page(recipe_id, after=None, limit=PAGE_SIZE):
+    """Страница отзывов от новых к старым и курсор следующей страницы."""
+    reviews = Review.objects.filter(recipe_id=recipe_id)
+    position = decode_cursor(after) if after else None
+    if position:
+        created_at, pk = position
+        reviews = reviews.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    reviews = list(reviews.select_related('user').order_by('-created_at', '-pk')[:limit + 1])
+    next_cursor = encode_cursor(reviews[limit - 1]) if len(reviews) > limit else None
+    return reviews[:limit], next_cursor
+
+
+def histogram(recipe_id):
+    """
+    {'rows': [(звёзды, число, процент)] от 5 к 1, 'total', 'average'}.
+    Оценки вне 1-5 (старые отзывы с rating=0) учитываются только в total.
+    """
+    counts = dict(
+        Review.objects.filter(recipe_id=recipe_id).order_by()
+        .values_list('rating').annotate(n=Count('pk'))
+    )
+    total = sum(counts.values())
+    rated = sum(counts.get(star, 0) for star in STARS)
+    average = sum(star * counts.get(star, 0) for star in STARS) / rated if rated else None
+    return {
+        'rows': [(star, counts.get(star, 0), round(100 * counts.get(star, 0) / rated) if rated else 0) for star in STARS],
+        'total': total,
+        'average': average,
+    }
+
+
+def with_own_review(recipes, user):
+    """Добавляет к запросу рецептов поля отзыва пользователя: без отдельного запроса за ним."""
+    if not user.is_authenticated:
+        return recipes
+    own = Review.objects.filter(recipe=OuterRef('pk'), user=user)
+    return recipes.annotate(
+        own_review_id=Subquery(own.values('pk')[:1]),
+        own_rating=Subquery(own.values('rating')[:1]),
+        own_comment=Subquery(own.values('comment')[:1]),
+    )
@@ -0,0 +1,181 @@
+"""
+Поиск по каталогу рецептов и кеш его результатов.
+
+Запрос нормализуется: регистр сворачивается (casefold), слова сортируются, повторы
+убираются, поэтому «Пицца Маргарита» и «маргарита  пицца» - один и тот же ключ.
+Рецепт подходит, если каждое слово есть в его названии или описании.
+
+Результат - id опубликованных рецептов в порядке выдачи (array, 8 байт на id) -
+хранится в памяти процесса в LRU-кеше. Размер ограничен числом записей
+(SEARCH_CACHE_ENTRIES) и суммарным числом id (SEARCH_CACHE_IDS); результат больше
+четверти лимита не кешируется. В ключ входит версия каталога: после коммита
+публикации, редактирования или удаления рецепта она увеличивается, и записи со
+старой версией больше не читаются и вытесняются как самые давние. Версия - строка
+CatalogueVersion в базе, а не кеш Django: LocMemCache у каждого воркера свой, и
+смену версии в одном воркере остальные не увидели бы. Чтение версии - один запрос
+по первичному ключу. Изменения в обход catalogue_changed() (shell, update())
+ограничены сроком жизни записи SEARCH_CACHE_TTL, а страница каталога ещё раз
+отбирает опубликованные рецепты при загрузке строк.
+
+Попадания и промахи пишутся в recept_cache_requests_total{cache="search"} (доля
+попаданий - отношение result="hit" к сумме), заполненность кеша процесса - в
+recept_search_cache_size{unit="entries"|"ids"}: по ним подбираются лимиты.
+"""
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Func, Q, TextField
+
+from . import homefeed, metrics
+from .instrumentation import record_cache
+from .models import CatalogueVersion, Recipe
+
+
+def normalize(query):
+    return ' '.join(sorted(set((query or '').casefold().split())))
+
+
+def parse_genre(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+# Версия каталога
+
+def catalogue_version():
+    return CatalogueVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def bump_version():
+    if not CatalogueVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        CatalogueVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+def catalogue_changed():
+    """
+    Отмечает изменение опубликованных рецептов: меняет версию каталога и ставит
+    пересборку блоков главной. Всё после коммита: иначе параллельный запрос успел
+    бы закешировать старые данные под новой версией.
+    """
+    transaction.on_commit(bump_version)
+    transaction.on_commit(homefeed.schedule)
+
+
+# Сопоставление без учёта регистра
+
+def casefold(value):
+    return value.casefold() if value is not None else None
+
+
+class CaseFold(Func):
+    """Текст в свёрнутом регистре; встроенный lower() SQLite понимает только ASCII."""
+    function = 'LOWER'
+    output_field = TextField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='py_casefold', **extra_context)
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created: регистрирует py_casefold в SQLite."""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('py_casefold', 1, casefold, deterministic=True)
+
+
+def matching_ids(words, genre_id=None):
+    recipes = Recipe.objects.filter(status='published')
+    if genre_id is not None:
+        recipes = recipes.filter(genres__id=genre_id)
+    if words:
+        recipes = recipes.alias(title_cf=CaseFold('title'), description_cf=CaseFold('description'))
+        for word in words:
+            recipes = recipes.filter(Q(title_cf__contains=word) | Q(description_cf__contains=word))
+    return array('q', recipes.order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+
+# Кеш результатов
+
+class ResultCache:
+    """LRU-кеш списков id с ограничением числа записей, суммарного числа id и сроком жизни."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'SEARCH_CACHE_ENTRIES', 512)
+
+    @property
+    def max_ids(self):
+        return getattr(settings, 'SEARCH_CACHE_IDS', 1_000_000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'SEARCH_CACHE_TTL', 300)
+
+    def get(self, key):
+        ids = None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, found = entry
+                if expires > time.monotonic():
+                    ids = found
+                    self.entries.move_to_end(key)
+                else:
+                    del self.entries[key]
+                    self.size -= len(found)
+        record_cache(ids is not None, name='search')
+        return ids
+
+    def set(self, key, ids):
+        if len(ids) > self.max_ids // 4:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[key] = (time.monotonic() + self.ttl, ids)
+            self.size += len(ids)
+            while len(self.entries) > self.max_entries or self.size > self.max_ids:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+results = ResultCache()
+
+
+@metrics.registry.register_collector
+def report_size():
+    metrics.search_cache_size.set(len(results.entries), unit='entries')
+    metrics.search_cache_size.set(results.size, unit='ids')
+
+
+def recipe_ids(query, genre_id=None):
+    """id опубликованных рецептов по запросу и жанру, от новых к старым."""
+    words = normalize(query)
+    key = (catalogue_version(), words, genre_id)
+    ids = results.get(key)
+    if ids is None:
+        ids = matching_ids(words.split(), genre_id)
+        results.set(key, ids)
+    return ids
+
+
+def in_order(queryset, ids):
+    """Объекты queryset с pk из ids в порядке ids."""
+    objects = queryset.in_bulk(list(ids))
+    return [objects[pk] for pk in ids if pk in objects]
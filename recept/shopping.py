@@ -0,0 +1,93 @@
+"""
+Список покупок по избранным рецептам.
+
+Строки RecipeIngredient выбранных рецептов читаются одним запросом values_list(),
+после чего весь список обрабатывается векторно (см. recept/portions.py): количества
+приводятся к базовым единицам, умножаются на коэффициент порций своего рецепта
+и за один проход суммируются по (ингредиент, величина). Разные единицы одного
+ингредиента (ложки и миллилитры, граммы и килограммы) складываются; объём и масса
+складываются только в системе mass, если известна плотность.
+"""
+import csv
+import io
+from decimal import Decimal, ROUND_HALF_UP
+
+from . import portions
+from .models import RecipeIngredient
+
+SYSTEMS = {key: portions.SYSTEMS[key] for key in ('metric', 'mass')}
+
+
+def parse_system(value):
+    return value if value in SYSTEMS else 'metric'
+
+
+def fetch_rows(recipe_ids):
+    """Все ингредиенты рецептов одним запросом, без создания экземпляров моделей."""
+    return list(
+        RecipeIngredient.objects.filter(recipe_id__in=list(recipe_ids)).order_by()
+        .values_list('recipe_id', 'ingredient_id', 'ingredient__name', 'ingredient__density', 'quantity', 'unit')
+    )
+
+
+def aggregate(rows, factors, system='metric'):
+    """
+    rows - строки fetch_rows(), factors - {id рецепта: коэффициент порций}.
+    Возвращает список {'ingredient_id', 'name', 'quantity', 'unit', 'unit_display', 'recipes'},
+    отсортированный по названию.
+    """
+    if not rows:
+        return []
+    recipe_ids, ingredient_ids, names, densities, quantities, units = zip(*rows)
+    kinds, base = portions.to_base(quantities, units)
+    base = [b * factors[r] for b, r in zip(base, recipe_ids)]
+    if system == 'mass':
+        kinds, base = portions.to_mass(kinds, base, [portions.density(n, d) for n, d in zip(names, densities)])
+
+    totals = {}
+    for ingredient_id, name, recipe_id, kind, amount in zip(ingredient_ids, names, recipe_ids, kinds, base):
+        total = totals.get((ingredient_id, kind))
+        if total is None:
+            totals[(ingredient_id, kind)] = [name, amount, {recipe_id}]
+        else:
+            total[1] += amount
+            total[2].add(recipe_id)
+
+    keys = sorted(totals, key=lambda key: (totals[key][0].casefold(), key[1]))
+    amounts, out_units = portions.metric_units([kind for _, kind in keys], [totals[key][1] for key in keys])
+    return [
+        {
+            'ingredient_id': ingredient_id,
+            'name': totals[(ingredient_id, kind)][0],
+            'quantity': amount.quantize(portions.CENT, ROUND_HALF_UP),
+            'unit': unit,
+            'unit_display': portions.UNITS.get(unit, unit),
+            'recipes': len(totals[(ingredient_id, kind)][2]),
+        }
+        for (ingredient_id, kind), amount, unit in zip(keys, amounts, out_units)
+    ]
+
+
+def build(targets, system='metric'):
+    """targets - {id рецепта: (порций в рецепте, нужно порций)}."""
+    factors = {pk: Decimal(wanted) / Decimal(original or 1) for pk, (original, wanted) in targets.items()}
+    return aggregate(fetch_rows(factors), factors, system)
+
+
+def quantity_text(quantity):
+    return f'{quantity.normalize():f}'
+
+
+def to_text(items):
+    lines = ['Список покупок', '']
+    lines += [f'- {item["name"]}: {quantity_text(item["quantity"])} {item["unit_display"]}' for item in items]
+    return '\n'.join(lines) + '\n'
+
+
+def to_csv(items):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['Ингредиент', 'Количество', 'Единица', 'Рецептов'])
+    for item in items:
+        writer.writerow([item['name'], quantity_text(item['quantity']), item['unit_display'], item['recipes']])
+    return out.getvalue()
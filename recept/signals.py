@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import search, snapshots, stats
+from .models import User, Review, Favorite, Recipe, RecipeIngredient, RecipeSnapshot, RecipeStep
+
+
+@receiver(post_save, sender=User, dispatch_uid='stats_new_user')
+def count_new_user(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.record('new_users', when=instance.date_joined)
+
+
+@receiver(post_save, sender=Review, dispatch_uid='stats_new_review')
+def count_new_review(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.record('reviews')
+
+
+@receiver(post_save, sender=Favorite, dispatch_uid='stats_new_favorite')
+def count_new_favorite(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.record('favorites')
+
+
+# Снимки рецептов (см. recept/snapshots.py) при записи в обход сайта: админка, инлайны, shell.
+# Сохранение формы с десятком шагов даёт десяток сигналов, поэтому id копятся, а снимки
+# пересобираются один раз после коммита.
+
+def rebuild_changed():
+    changed = snapshots.changed_recipes()
+    if not changed:
+        # Уже пересобраны предыдущим вызовом или явным snapshots.rebuild() в транзакции
+        return
+    ids = list(changed)
+    changed.clear()
+    had_snapshot = RecipeSnapshot.objects.filter(recipe_id__in=ids).exists()
+    if snapshots.rebuild(ids) or had_snapshot:
+        search.catalogue_changed()
+
+
+def recipe_touched(recipe_id):
+    snapshots.changed_recipes().add(recipe_id)
+    transaction.on_commit(rebuild_changed)
+
+
+@receiver([post_save, post_delete], sender=Recipe, dispatch_uid='snapshots_recipe')
+def recipe_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        recipe_touched(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient, dispatch_uid='snapshots_recipe_ingredient')
+@receiver([post_save, post_delete], sender=RecipeStep, dispatch_uid='snapshots_recipe_step')
+def recipe_part_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        recipe_touched(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.genres.through, dispatch_uid='snapshots_recipe_genres')
+def recipe_genres_changed(sender, instance, action, reverse=False, pk_set=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipe_touched(instance.pk)
+    else:
+        # genre.recipes.add(...): instance - жанр, pk_set - рецепты
+        for pk in pk_set or ():
+            recipe_touched(pk)
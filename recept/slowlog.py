@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .middleware import normalize_sql
+
+logger = logging.getLogger('recept.slowlog')
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Только пакеты проекта: в корне репозитория может лежать .venv с Django и библиотеками
+CODE_DIRS = tuple(os.path.join(PROJECT_DIR, name) + os.sep for name in ('recept', 'PrjRecept'))
+THIS_FILE = os.path.abspath(__file__)
+
+QUEUE_SIZE = 1000
+
+# Защита от рекурсии: EXPLAIN и запись в журнал тоже проходят через обёртку
+_state = threading.local()
+
+
+def fingerprint(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def calling_site():
+    # Первый кадр стека из кода проекта (не библиотеки и не этот модуль): view, форма, шаблонный тег...
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(CODE_DIRS) and filename != THIS_FILE:
+            module = frame.f_globals.get('__name__', '?')
+            return f'{module}.{frame.f_code.co_name}:{frame.f_lineno}'
+        frame = frame.f_back
+    return ''
+
+
+def explain(connection, sql, params):
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN не выполнен: {e}'
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return '\n'.join(str(row[-1]) for row in rows)
+    return '\n'.join(' '.join(str(col) for col in row) for row in rows)
+
+
+def record(alias, sql, params, duration_ms, site):
+    from .models import SlowQuery
+
+    connection = connections[alias]
+    shape = normalize_sql(sql)
+    key = fingerprint(shape)
+    params_key = fingerprint(repr(params))[:12]
+    plan = explain(connection, sql, params)
+    now = timezone.now()
+    try:
+        with transaction.atomic(using=connection.alias):
+            updated = SlowQuery.objects.using(connection.alias).filter(fingerprint=key).update(
+                count=F('count') + 1,
+                total_ms=F('total_ms') + duration_ms,
+                max_ms=Greatest(F('max_ms'), duration_ms),
+                last_sql=sql,
+                last_params_fingerprint=params_key,
+                last_view=site,
+                explain=plan,
+                last_seen=now,
+            )
+            if not updated:
+                SlowQuery.objects.using(connection.alias).create(
+                    fingerprint=key, shape=shape, last_sql=sql,
+                    last_params_fingerprint=params_key, last_view=site, explain=plan,
+                    count=1, total_ms=duration_ms, max_ms=duration_ms,
+                    first_seen=now, last_seen=now,
+                )
+    except DatabaseError:
+        logger.exception('Не удалось записать медленный запрос')
+
+
+class Writer:
+    """
+    Фоновый поток записи журнала. EXPLAIN и UPDATE/INSERT идут через соединение
+    этого потока: медленный SELECT не добавляет запись в транзакцию запроса и не
+    ждёт блокировок, которые держит запрос.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, *entry):
+        with self.lock:
+            # После fork (gunicorn --preload) поток мастера в воркере не работает
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='recept-slowlog', daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            logger.warning('Очередь журнала медленных запросов переполнена, запрос не записан')
+
+    def run(self):
+        # Запросы самого журнала не журналируются
+        _state.active = True
+        while True:
+            entry = self.queue.get()
+            try:
+                # Поток живёт долго: оборванное соединение заменяется, как между запросами
+                close_old_connections()
+                record(*entry)
+            except Exception:
+                logger.exception('Не удалось записать медленный запрос')
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Ждёт записи всего, что уже в очереди."""
+        self.queue.join()
+
+
+writer = Writer()
+
+
+class SlowQueryWrapper:
+    """execute_wrapper, который пишет в журнал запросы дольше SLOW_QUERY_THRESHOLD_MS."""
+
+    def __init__(self, connection):
+        self.alias = connection.alias
+
+    def __call__(self, execute, sql, params, many, context):
+        threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+        if threshold is None or getattr(_state, 'active', False):
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= threshold and not many:
+            _state.active = True
+            try:
+                site = calling_site()
+                logger.warning('Медленный запрос %.1f мс (%s): %s', duration_ms, site, sql)
+                writer.submit(self.alias, sql, params, duration_ms, site)
+            finally:
+                _state.active = False
+        return result
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created: подключает журнал к каждому новому соединению."""
+    if not any(isinstance(w, SlowQueryWrapper) for w in connection.execute_wrappers):
+        # В начало списка: соединение создаётся лениво внутри запроса, когда обёртки
+        # middleware (execute_wrapper) уже добавлены и при выходе снимут последний элемент
+        connection.execute_wrappers.insert(0, SlowQueryWrapper(connection))
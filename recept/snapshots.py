@@ -0,0 +1,151 @@
+"""
+Снимки опубликованных рецептов.
+
+Для каждого опубликованного рецепта хранится готовый документ (RecipeSnapshot.data):
+поля рецепта, автор, жанры, ингредиенты и шаги. Страница рецепта и API читают его
+одним запросом по первичному ключу. Источник истины - нормализованные таблицы:
+снимок пересобирается при одобрении, редактировании рецепта и изменении автора,
+а при снятии с публикации или удалении удаляется. Правки через save()/delete()
+в обход сайта (админка и её инлайны, shell) пересобирают снимок обработчиками
+сигналов в recept/signals.py. Изменения через update() сигналов не дают, поэтому
+fetch() отдаёт снимок, только если рецепт сейчас опубликован и не удалён.
+"""
+import threading
+
+from django.core.files.storage import default_storage
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Recipe, RecipeIngredient, RecipeSnapshot, RecipeStep, Review
+
+# Увеличивается при изменении формата документа: старые снимки пересобираются при чтении
+VERSION = 2
+
+UNITS = dict(RecipeIngredient._meta.get_field('unit').choices)
+
+_changed = threading.local()
+
+
+def changed_recipes():
+    """id рецептов потока, изменённых через save()/delete() и ждущих пересборки (см. recept/signals.py)."""
+    if not hasattr(_changed, 'ids'):
+        _changed.ids = set()
+    return _changed.ids
+
+
+def media_url(file):
+    return default_storage.url(file.name) if file else None
+
+
+def source():
+    """Рецепты со всем, что нужно для документа: 4 запроса на любую пачку."""
+    return Recipe.objects.select_related('user').prefetch_related(
+        'genres',
+        Prefetch('recipe_ingredients', RecipeIngredient.objects.select_related('ingredient').order_by('pk')),
+        Prefetch('steps', RecipeStep.objects.order_by('order')),
+    )
+
+
+def document(recipe):
+    """Документ рецепта из экземпляра, загруженного через source()."""
+    author = recipe.user
+    return {
+        'id': recipe.pk,
+        'title': recipe.title,
+        'description': recipe.description,
+        'cover_image': media_url(recipe.cover_image),
+        'video_file': media_url(recipe.video_file),
+        'portions': recipe.portions,
+        'calories': recipe.calories,
+        'estimated_cost': recipe.estimated_cost,
+        'author_id': author.pk,
+        'author_name': author.full_name,
+        'author_display': author.full_name or author.email,
+        'author_avatar': media_url(author.avatar),
+        'status': recipe.status,
+        'status_display': recipe.get_status_display(),
+        'moderation_notes': recipe.moderation_notes,
+        'created_at': recipe.created_at,
+        'updated_at': recipe.updated_at,
+        'genres': [{'id': g.pk, 'name': g.name} for g in sorted(recipe.genres.all(), key=lambda g: g.name)],
+        'ingredients': [
+            {
+                'ingredient_id': ri.ingredient_id, 'name': ri.ingredient.name,
+                'quantity': ri.quantity, 'unit': ri.unit, 'unit_display': UNITS.get(ri.unit, ri.unit),
+            }
+            for ri in recipe.recipe_ingredients.all()
+        ],
+        'steps': [
+            {'order': step.order, 'description': step.description, 'image': media_url(step.image)}
+            for step in recipe.steps.all()
+        ],
+    }
+
+
+def build(recipe_ids):
+    """Сохраняет снимки опубликованных рецептов из recipe_ids; снимки остальных не трогает."""
+    recipes = list(source().filter(pk__in=recipe_ids, status='published'))
+    if recipes:
+        RecipeSnapshot.objects.bulk_create(
+            [RecipeSnapshot(recipe=r, version=VERSION, data=document(r)) for r in recipes],
+            update_conflicts=True,
+            unique_fields=['recipe'],
+            update_fields=['version', 'data', 'built_at'],
+        )
+    return recipes
+
+
+def rebuild(recipe_ids):
+    """Пересобирает снимки: опубликованные рецепты сохраняются, у остальных снимок удаляется."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return []
+    # Эти рецепты обработчикам сигналов после коммита пересобирать уже не нужно
+    changed_recipes().difference_update(recipe_ids)
+    recipes = build(recipe_ids)
+    RecipeSnapshot.objects.filter(recipe_id__in=recipe_ids).exclude(recipe_id__in=[r.pk for r in recipes]).delete()
+    return recipes
+
+
+def rebuild_for_author(user):
+    """Имя и аватар автора входят в документ, поэтому снимки его рецептов пересобираются."""
+    rebuild(Recipe.objects.filter(user=user, status='published').values_list('pk', flat=True))
+
+
+def patched(values):
+    """Снимки с изменёнными без пересборки полями ({id рецепта: {поле: значение}}); сохраняет вызывающий."""
+    found = list(RecipeSnapshot.objects.filter(recipe_id__in=list(values)).only('recipe_id', 'data'))
+    for snapshot in found:
+        snapshot.data.update(values[snapshot.recipe_id])
+    return found
+
+
+def drop(recipe_ids):
+    RecipeSnapshot.objects.filter(recipe_id__in=list(recipe_ids)).delete()
+
+
+def reviews_count():
+    return Coalesce(Subquery(
+        Review.objects.filter(recipe=OuterRef('pk')).order_by()
+        .values('recipe').annotate(n=Count('pk')).values('n')
+    ), 0)
+
+
+def fetch(pk):
+    """
+    (документ, число отзывов) опубликованного рецепта одним запросом или None.
+    Отсутствующий или устаревший снимок опубликованного рецепта пересобирается.
+    Для черновиков, удалённых и несуществующих id чтение ничего не пишет: лишние
+    снимки удаляют пути записи и обработчики сигналов, а до того их не отдаёт
+    условие на статус рецепта в том же запросе.
+    """
+    found = (
+        RecipeSnapshot.objects.filter(pk=pk, version=VERSION, recipe__status='published', recipe__deleted_at__isnull=True)
+        .annotate(reviews_count=reviews_count())
+        .values_list('data', 'reviews_count').first()
+    )
+    if found:
+        return found
+    if not build([pk]):
+        return None
+    return fetch(pk)
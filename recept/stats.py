@@ -0,0 +1,159 @@
+"""
+Почасовая и посуточная статистика для панели администратора.
+
+События (новый пользователь, отзыв, избранное, решение модератора) сразу
+увеличивают счётчики текущих корзин через record(). Фоновая задача stats.rollup
+периодически пересчитывает последние корзины по исходным таблицам (исправляя
+возможный дрейф) и сохраняет снимки итогов: всего пользователей, рецептов по статусам.
+Панель читает только таблицу StatBucket.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import StatBucket, User, Recipe, Review, Favorite
+from .tasks import task
+
+METRIC_LABELS = {
+    'new_users': 'Новые пользователи',
+    'recipes_submitted': 'Отправлено на модерацию',
+    'recipes_published': 'Опубликовано',
+    'recipes_rejected': 'Отклонено',
+    'reviews': 'Отзывы',
+    'favorites': 'Добавления в избранное',
+    'moderation_turnaround': 'Среднее время модерации, ч',
+}
+
+# Снимки итогов на момент последнего пересчёта
+TOTAL_METRICS = ['users_total'] + [f'recipes_{status}_total' for status, _ in Recipe.STATUS_CHOICES]
+
+TRUNC = {'hour': TruncHour, 'day': TruncDay}
+
+
+def bucket_start(moment, period):
+    moment = timezone.localtime(moment)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def record(metric, amount=1, when=None):
+    """Увеличивает счётчик метрики в текущих часовой и суточной корзинах."""
+    when = when or timezone.now()
+    for period in ('hour', 'day'):
+        start = bucket_start(when, period)
+        updated = StatBucket.objects.filter(period=period, start=start, metric=metric).update(value=F('value') + amount)
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                StatBucket.objects.create(period=period, start=start, metric=metric, value=amount)
+        except IntegrityError:
+            # Корзину успел создать параллельный запрос
+            StatBucket.objects.filter(period=period, start=start, metric=metric).update(value=F('value') + amount)
+
+
+def store(rows):
+    """rows: [(period, start, metric, value)] -> upsert одной пачкой."""
+    StatBucket.objects.bulk_create(
+        [StatBucket(period=p, start=s, metric=m, value=v) for p, s, m, v in rows],
+        update_conflicts=True,
+        unique_fields=['period', 'start', 'metric'],
+        update_fields=['value', 'updated_at'],
+    )
+
+
+def grouped_counts(queryset, field, period, since):
+    return (
+        queryset.filter(**{f'{field}__gte': since})
+        .annotate(bucket=TRUNC[period](field))
+        .values('bucket')
+        .annotate(n=Count('pk'))
+        .values_list('bucket', 'n')
+    )
+
+
+def rollup(hours=48, days=7, now=None):
+    """Пересчитывает последние корзины по исходным таблицам (поиск по индексам дат)."""
+    now = now or timezone.now()
+    sources = {
+        'new_users': (User.objects.all(), 'date_joined'),
+        'recipes_submitted': (Recipe.objects.all(), 'submitted_at'),
+        'recipes_published': (Recipe.objects.filter(status='published'), 'moderated_at'),
+        'recipes_rejected': (Recipe.objects.filter(status='rejected'), 'moderated_at'),
+        'reviews': (Review.objects.all(), 'created_at'),
+        'favorites': (Favorite.objects.all(), 'added_at'),
+    }
+    rows = []
+    for period, back in (('hour', timedelta(hours=hours)), ('day', timedelta(days=days))):
+        since = bucket_start(now - back, period)
+        for metric, (queryset, field) in sources.items():
+            counts = dict(grouped_counts(queryset, field, period, since))
+            # Пустые корзины тоже пишутся, чтобы обнулить возможный дрейф
+            start = since
+            step = timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+            while start <= now:
+                rows.append((period, start, metric, counts.get(start, 0)))
+                start = bucket_start(start + step, period)
+
+        turnaround = (
+            Recipe.objects.filter(moderated_at__gte=since, submitted_at__isnull=False)
+            .annotate(bucket=TRUNC[period]('moderated_at'))
+            .values('bucket')
+            .annotate(avg=Avg(ExpressionWrapper(F('moderated_at') - F('submitted_at'), output_field=DurationField())))
+            .values_list('bucket', 'avg')
+        )
+        for bucket, avg in turnaround:
+            if avg is not None:
+                rows.append((period, bucket, 'moderation_turnaround', round(avg.total_seconds() / 3600, 2)))
+
+    totals = {'users_total': User.objects.count()}
+    by_status = dict(Recipe.objects.values_list('status').annotate(n=Count('pk')).order_by())
+    for status, _ in Recipe.STATUS_CHOICES:
+        totals[f'recipes_{status}_total'] = by_status.get(status, 0)
+    for period in ('hour', 'day'):
+        start = bucket_start(now, period)
+        rows.extend((period, start, metric, value) for metric, value in totals.items())
+
+    store(rows)
+    return len(rows)
+
+
+@task('stats.rollup')
+def rollup_task(task_obj, hours=48, days=7):
+    rollup(hours=hours, days=days)
+
+
+def latest_totals():
+    """Последние снимки итогов: {metric: (value, updated_at)}; один запрос."""
+    # Все итоги пишутся одним пересчётом, поэтому самый свежий день содержит их полностью
+    rows = (
+        StatBucket.objects.filter(period='day', metric__in=TOTAL_METRICS)
+        .order_by('-start', 'metric')
+        .values_list('metric', 'value', 'updated_at')[:len(TOTAL_METRICS)]
+    )
+    return {metric: (int(value), updated_at) for metric, value, updated_at in rows}
+
+
+def daily_series(days=14, now=None):
+    """Таблица трендов за последние дни: [(день, {metric: value})]; один запрос."""
+    now = now or timezone.now()
+    first = bucket_start(now - timedelta(days=days - 1), 'day')
+    values = {}
+    for start, metric, value in (
+        StatBucket.objects.filter(period='day', start__gte=first, metric__in=METRIC_LABELS)
+        .values_list('start', 'metric', 'value')
+    ):
+        values[(timezone.localtime(start).date(), metric)] = value
+
+    series = []
+    day = first
+    while day <= now:
+        date = day.date()
+        series.append((date, {metric: values.get((date, metric), 0) for metric in METRIC_LABELS}))
+        day = bucket_start(day + timedelta(days=1), 'day')
+    return series
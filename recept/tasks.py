@@ -0,0 +1,126 @@
+"""
+Минимальная очередь фоновых задач в базе данных.
+
+Задача регистрируется декоратором @task('имя'), ставится в очередь через enqueue()
+и выполняется воркером manage.py run_worker. Воркер забирает задачи условным
+UPDATE, поэтому несколько воркеров не выполнят одну задачу дважды.
+
+Выполняемая задача держит аренду: heartbeat_at обновляется при захвате и в
+report_progress(). Если воркер умер, задача без отметки дольше TASK_LEASE_SECONDS
+возвращается в очередь (или помечается failed, если попытки кончились).
+Задачи дольше аренды должны сообщать прогресс.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import Task
+
+logger = logging.getLogger('recept.tasks')
+
+_registry = {}
+
+
+def task(name):
+    def decorator(func):
+        _registry[name] = func
+        func.task_name = name
+        return func
+    return decorator
+
+
+def enqueue(name, run_after=None, **payload):
+    if name not in _registry:
+        raise ValueError(f'Неизвестная задача: {name}')
+    return Task.objects.create(name=name, payload=payload, run_after=run_after or timezone.now())
+
+
+def enqueue_once(name, **payload):
+    """Ставит задачу, только если такая же ещё не ждёт в очереди."""
+    existing = Task.objects.filter(name=name, status='queued', payload=payload).first()
+    return existing or enqueue(name, **payload)
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'TASK_LEASE_SECONDS', 900))
+
+
+def max_attempts():
+    return getattr(settings, 'TASK_MAX_ATTEMPTS', 3)
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи, воркер которых пропал; возвращает их число."""
+    now = timezone.now()
+    stale = Task.objects.filter(status='running', heartbeat_at__lt=now - lease())
+    error = 'Воркер не завершил задачу: аренда истекла'
+    failed = stale.filter(attempts__gte=max_attempts()).update(status='failed', finished_at=now, error=error)
+    requeued = stale.update(status='queued', run_after=now, error=error)
+    if failed or requeued:
+        logger.warning('Задачи с истёкшей арендой: %d в очередь, %d с ошибкой', requeued, failed)
+    return failed + requeued
+
+
+def claim_next():
+    now = timezone.now()
+    candidates = Task.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'pk')
+    for task_id in candidates.values_list('pk', flat=True)[:5]:
+        claimed = Task.objects.filter(pk=task_id, status='queued').update(
+            status='running', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Task.objects.get(pk=task_id)
+    return None
+
+
+def report_progress(task_obj, progress, total=None):
+    task_obj.progress = progress
+    fields = ['progress']
+    if total is not None:
+        task_obj.total = total
+        fields.append('total')
+    # Прогресс продлевает аренду
+    Task.objects.filter(pk=task_obj.pk).update(heartbeat_at=timezone.now(), **{f: getattr(task_obj, f) for f in fields})
+
+
+def run(task_obj):
+    func = _registry.get(task_obj.name)
+    try:
+        if func is None:
+            raise ValueError(f'Неизвестная задача: {task_obj.name}')
+        func(task_obj, **task_obj.payload)
+    except Exception:
+        retry = task_obj.attempts < max_attempts()
+        logger.exception('Задача %s (#%s) завершилась ошибкой', task_obj.name, task_obj.pk)
+        Task.objects.filter(pk=task_obj.pk).update(
+            status='queued' if retry else 'failed',
+            run_after=timezone.now() + timedelta(seconds=30 * task_obj.attempts),
+            error=traceback.format_exc(),
+            finished_at=None if retry else timezone.now(),
+        )
+        return False
+    Task.objects.filter(pk=task_obj.pk).update(status='done', finished_at=timezone.now(), error='')
+    return True
+
+
+def run_pending(limit=None):
+    """Выполняет готовые задачи по очереди; возвращает число выполненных."""
+    requeue_stale()
+    done = 0
+    while limit is None or done < limit:
+        task_obj = claim_next()
+        if task_obj is None:
+            break
+        run(task_obj)
+        done += 1
+    return done
+
+
+@metrics.registry.register_collector
+def collect_queue_depth():
+    metrics.job_queue_depth.set(Task.objects.filter(status='queued').count())
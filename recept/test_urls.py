@@ -0,0 +1,8 @@
+from django.contrib import admin
+from django.urls import include, path
+
+# Django admin не подключён в PrjRecept/urls.py; тесты админки используют этот urlconf
+urlpatterns = [
+    path('django-admin/', admin.site.urls),
+    path('', include('recept.urls')),
+]
@@ -1,3 +1,1628 @@
-from django.test import TestCase
+from array import array
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+import asyncio
+import json
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+from xml.etree import ElementTree
+
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import urls as recept_urls
+from .management.commands import gc_media
+from .forms import AdminUserFilterForm
+from .management.commands.run_bench import percentile
+from .metrics import Registry
+from .instrumentation import current_timings, record_cache
+from .middleware import QueryRecorder, normalize_sql
+from . import deletion, events, feeds, homefeed, moderation, nutrition, pagecache, portions, profiles, reviews, search, shopping, slowlog, snapshots, stats, tasks, warmup
+from .models import (
+    User, Genre, ListIngredient, Recipe, RecipeStep, RecipeIngredient, Review, Favorite, SlowQuery,
+    HomeSection, Notification, RecipeSnapshot, StatBucket, Task,
+)
+
+
+def seed(size):
+    """Наполняет базу данными: size рецептов, у каждого size ингредиентов/шагов/отзывов."""
+    author = User.objects.create_user(email=f'author{size}@test.ru', full_name='Автор')
+    admin = User.objects.create_superuser(email=f'admin{size}@test.ru')
+    readers = [
+        User.objects.create_user(email=f'reader{size}_{i}@test.ru')
+        for i in range(size)
+    ]
+    genres = [Genre.objects.create(name=f'Жанр {size}-{i}') for i in range(size)]
+    ingredients = [ListIngredient.objects.create(name=f'Ингредиент {size}-{i}') for i in range(size)]
+
+    recipes = []
+    for i in range(size):
+        status = 'pending' if i % 2 else 'published'
+        recipe = Recipe.objects.create(
+            user=author, title=f'Рецепт {i}', description='Описание', status=status,
+            portions=2, calories=300, estimated_cost=Decimal('150.00'),
+        )
+        recipe.genres.set(genres)
+        for j, ingredient in enumerate(ingredients):
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, quantity=Decimal('1.50'), unit='g')
+            RecipeStep.objects.create(recipe=recipe, order=j + 1, description=f'Шаг {j + 1}')
+        for reader in readers:
+            Review.objects.create(recipe=recipe, user=reader, rating=4, comment='Вкусно')
+            Favorite.objects.create(user=reader, recipe=recipe)
+        recipes.append(recipe)
+
+    # Опубликованные рецепты имеют снимки, как после одобрения модератором
+    snapshots.rebuild(r.pk for r in recipes if r.status == 'published')
+    profiles.recount_all()
+    published = next(r for r in recipes if r.status == 'published')
+    return {
+        'author': author,
+        'admin': admin,
+        'reader': readers[0],
+        'recipe': published,
+        'pending': next((r for r in recipes if r.status == 'pending'), published),
+    }
+
+
+# имя URL -> (метод, пользователь, функция аргументов URL, лимит запросов)
+QUERY_BUDGETS = {
+    'index': ('get', None, None, 1),
+    'signup': ('get', None, None, 0),
+    'login': ('get', None, None, 0),
+    'logout': ('get', 'reader', None, 4),
+    'profile': ('get', 'author', None, 3),
+    'profile_edit': ('get', 'author', None, 2),
+    'admin_profile': ('get', 'admin', None, 7),
+    'recipe_create': ('get', 'author', None, 3),
+    'recipe_edit': ('get', 'author', lambda d: [d['recipe'].pk], 7),
+    'recipe_detail': ('get', 'reader', lambda d: [d['recipe'].pk], 4),
+    'recipe_delete': ('post', 'author', lambda d: [d['recipe'].pk], 9),
+    'recipe_reviews': ('get', 'reader', lambda d: [d['recipe'].pk], 5),
+    'user_profile': ('get', None, lambda d: [d['author'].pk], 2),
+    'toggle_favorite': ('post', 'reader', lambda d: [d['recipe'].pk], 6),
+    'recipe_list': ('get', None, None, 4),
+    'favorite_recipes': ('get', 'reader', None, 3),
+    'shopping_list': ('get', 'reader', None, 4),
+    'admin_users_list': ('get', 'admin', None, 4),
+    'admin_recipes_list': ('get', 'admin', None, 4),
+    'admin_edit_recipe_genres': ('get', 'admin', lambda d: [d['recipe'].pk], 5),
+    'admin_add_genre': ('post', 'admin', None, 2),
+    'admin_user_detail': ('get', 'admin', lambda d: [d['reader'].pk], 3),
+    'admin_user_edit': ('get', 'admin', lambda d: [d['reader'].pk], 3),
+    'admin_user_delete': ('post', 'admin', lambda d: [d['reader'].pk], 10),
+    'admin_moderation_list': ('get', 'admin', None, 6),
+    'admin_moderation_claim': ('post', 'admin', None, 10),
+    'admin_bulk_moderation': ('post', 'admin', None, 2),
+    'admin_approve_recipe': ('post', 'admin', lambda d: [d['pending'].pk], 24),
+    'admin_reject_recipe': ('post', 'admin', lambda d: [d['pending'].pk], 18),
+    'admin_slow_queries': ('get', 'admin', None, 3),
+    'events': ('get', 'reader', None, 3),
+    'sitemap_index': ('get', None, None, 2),
+    'sitemap_shard': ('get', None, lambda d: [0], 2),
+    'recipe_feed': ('get', None, None, 2),
+    'metrics': ('get', None, None, 1),
+    'api_recipe_list': ('get', None, None, 1),
+    'api_recipe_detail': ('get', None, lambda d: [d['recipe'].pk], 1),
+    'api_recipe_reviews': ('get', None, lambda d: [d['recipe'].pk], 1),
+    'api_genre_list': ('get', None, None, 1),
+    'api_user_detail': ('get', None, lambda d: [d['author'].pk], 1),
+}
+
+SIZES = (2, 4, 10)
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+class QueryBudgetTests(TestCase):
+
+    def measure(self, name, size):
+        method, who, args, _ = QUERY_BUDGETS[name]
+        # Замер без кешей: id рецептов после отката переиспользуются
+        cache.clear()
+        search.results.clear()
+        with transaction.atomic():
+            data = seed(size)
+            if who:
+                self.client.force_login(data[who])
+            url = reverse(name, args=args(data) if args else None)
+            with CaptureQueriesContext(connection) as ctx:
+                response = getattr(self.client, method)(url)
+                # Потоковый ответ читает базу, пока отдаётся
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 500, f'{name}: {response.status_code}')
+            self.client.logout()
+            transaction.set_rollback(True)
+        return len(ctx.captured_queries)
+
+    def test_every_url_has_budget(self):
+        names = {p.name for p in recept_urls.urlpatterns if isinstance(p, URLPattern) and p.name}
+        self.assertEqual(names - set(QUERY_BUDGETS), set())
+
+    def test_query_counts_do_not_grow(self):
+        for name, (_, _, _, budget) in QUERY_BUDGETS.items():
+            with self.subTest(url=name):
+                counts = [self.measure(name, size) for size in SIZES]
+                self.assertLessEqual(max(counts), budget, f'{name}: {counts}')
+                self.assertEqual(len(set(counts)), 1, f'{name}: {counts}')
+
+
+class QueryInspectorTests(TestCase):
+
+    def test_normalize_sql_collapses_literals_and_in_lists(self):
+        a = normalize_sql('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'x\'')
+        b = normalize_sql('SELECT  *  FROM t WHERE id IN (%s) AND name = \'y\'')
+        self.assertEqual(a, b)
+
+    def test_recorder_detects_repeated_queries(self):
+        data = seed(3)
+        recipes = Recipe.objects.filter(user=data['author'])
+        with QueryRecorder() as recorder:
+            for recipe in recipes:
+                recipe.user.email
+        self.assertEqual(recorder.repeated_shapes(2)[0][1], 3)
+
+    def test_middleware_sets_query_count_header(self):
+        # Новый Client на каждую настройку: обработчик загружает middleware при первом запросе
+        for enabled in (True, False):
+            with self.subTest(enabled=enabled), self.settings(QUERY_INSPECTOR_ENABLED=enabled):
+                response = Client().get(reverse('recipe_list'))
+                self.assertEqual('X-Query-Count' in response, enabled)
+
+
+class SeedBenchTests(TestCase):
+
+    def test_seed_bench_creates_related_rows(self):
+        call_command(
+            'seed_bench', users=20, genres=3, ingredients=15, recipes=30,
+            steps=2, recipe_ingredients=4, reviews=3, favorites=5, batch_size=7, stdout=StringIO(),
+        )
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertEqual(RecipeStep.objects.count(), 60)
+        self.assertEqual(RecipeIngredient.objects.count(), 120)
+        self.assertEqual(Review.objects.count(), 90)
+        self.assertEqual(Favorite.objects.count(), 100)
+
+        # Производные данные как после работы сайта
+        published = Recipe.objects.filter(status='published')
+        self.assertFalse(published.filter(moderated_at__isnull=True).exists())
+        self.assertFalse(Recipe.objects.filter(status='pending', submitted_at__isnull=True).exists())
+        self.assertEqual(RecipeSnapshot.objects.count(), published.count())
+        self.assertTrue(HomeSection.objects.exists())
+        author = published.first().user
+        self.assertEqual(author.published_recipes_count, author.recipes.filter(status='published').count())
+
+    def test_percentile(self):
+        values = sorted(range(1, 101))
+        self.assertAlmostEqual(percentile(values, 50), 50.5)
+        self.assertEqual(percentile(values, 100), 100)
+
+
+class ServerTimingTests(TestCase):
+
+    def test_header_contains_breakdown(self):
+        search.results.clear()
+        seed(2)
+        with self.assertLogs('recept.timing', level='INFO') as logs:
+            response = self.client.get(reverse('recipe_list'))
+        header = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'media;dur=', 'cache;desc=', 'total;dur='):
+            self.assertIn(metric, header)
+        self.assertIn('SQL x4', header)
+        self.assertIn('"view": "recipe_list"', logs.output[0])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_disabled_when_not_sampled(self):
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_cache_hooks_are_noop_outside_request(self):
+        record_cache(True)
+        self.assertIsNone(current_timings())
+
+
+class MetricsTests(TestCase):
+
+    def test_endpoint_exposes_request_histogram_per_url_name(self):
+        self.client.get(reverse('recipe_list'))
+        response = self.client.get(reverse('metrics'))
+        body = response.content.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE recept_request_duration_seconds histogram', body)
+        self.assertIn('recept_request_duration_seconds_bucket{view="recipe_list",le="+Inf"}', body)
+        self.assertIn('recept_responses_total{method="GET",status="200",view="recipe_list"}', body)
+
+    def test_endpoint_is_local_only(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 403)
+
+    def test_snapshots_of_other_workers_are_merged(self):
+        registry = Registry()
+        hits = registry.counter('hits_total', 'test')
+        latency = registry.histogram('latency_seconds', 'test', buckets=(0.1, 1.0))
+        hits.inc(view='a')
+        latency.observe(0.05, view='a')
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            other = {
+                'hits_total': [[[['view', 'a']], 2]],
+                'latency_seconds': [[[['view', 'a']], [0, 1, 0.5, 1]]],
+            }
+            with open(os.path.join(directory, '99999.json'), 'w') as f:
+                json.dump(other, f)
+            body = registry.render()
+        self.assertIn('hits_total{view="a"} 3', body)
+        self.assertIn('latency_seconds_bucket{view="a",le="1.0"} 2', body)
+        self.assertIn('latency_seconds_count{view="a"} 2', body)
+
+
+    def test_first_flush_removes_snapshots_of_dead_and_reused_pids(self):
+        registry = Registry()
+        registry.counter('hits_total', 'test').inc()
+        finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+        dead_pid = int(finished.stdout)
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            stale = {'hits_total': [[[], 100]]}
+            for pid in (dead_pid, os.getpid()):
+                with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+                    json.dump(stale, f)
+            with open(os.path.join(directory, f'{os.getppid()}.json'), 'w') as f:
+                json.dump(stale, f)
+            registry.flush(force=True)
+            self.assertEqual(sorted(os.listdir(directory)), sorted([f'{os.getpid()}.json', f'{os.getppid()}.json']))
+            with open(os.path.join(directory, f'{os.getpid()}.json')) as f:
+                self.assertEqual(json.load(f)['hits_total'], [[[], 1]])
+
+
+class SlowQueryLogTests(TransactionTestCase):
+    # Журнал пишет фоновый поток своим соединением: данные теста должны быть закоммичены
+
+    def test_slow_queries_are_grouped_by_shape_with_plan(self):
+        seed(2)
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('recept.slowlog'):
+            list(Recipe.objects.filter(title__icontains='бор'))
+            list(Recipe.objects.filter(title__icontains='пиц'))
+            slowlog.writer.flush()
+        entry = SlowQuery.objects.get(shape__contains='LIKE')
+        self.assertEqual(entry.count, 2)
+        self.assertIn('SCAN', entry.explain)
+        self.assertIn('recept.tests', entry.last_view)
+
+    def test_calling_site_skips_libraries_inside_project_dir(self):
+        def wrapper():
+            return slowlog.calling_site()
+
+        # Библиотека из .venv в корне репозитория вызывает код, выполняющий запрос
+        library = os.path.join(slowlog.PROJECT_DIR, '.venv', 'lib', 'site-packages', 'lib.py')
+        namespace = {'__name__': 'lib', 'wrapper': wrapper}
+        exec(compile('def execute():\n    return wrapper()\n', library, 'exec'), namespace)
+
+        def view():
+            return namespace['execute']()
+
+        self.assertTrue(view().startswith('recept.tests.view:'))
+
+    def test_dashboard_lists_entries(self):
+        data = seed(2)
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('recept.slowlog'):
+            Recipe.objects.filter(description__icontains='x').count()
+            slowlog.writer.flush()
+        self.client.force_login(data['admin'])
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=None):
+            response = self.client.get(reverse('admin_slow_queries'))
+        self.assertContains(response, 'LIKE')
+
+    def test_wrapper_survives_connection_opened_inside_middleware_wrappers(self):
+        # Как у нового соединения потока: журнал ещё не подключён
+        saved = list(connection.execute_wrappers)
+        self.addCleanup(connection.execute_wrappers.__setitem__, slice(None), saved)
+        connection.execute_wrappers[:] = [w for w in saved if not isinstance(w, slowlog.SlowQueryWrapper)]
+        recorder = QueryRecorder()
+        with recorder:
+            # connection_created приходит уже внутри обёртки middleware (соединение открывается лениво)
+            slowlog.install(sender=None, connection=connection)
+        self.assertNotIn(recorder, connection.execute_wrappers)
+        self.assertTrue(any(isinstance(w, slowlog.SlowQueryWrapper) for w in connection.execute_wrappers))
+
+
+class AdminUsersListTests(TestCase):
+
+    def setUp(self):
+        self.data = seed(3)
+        self.client.force_login(self.data['admin'])
+
+    def test_counts_are_annotated(self):
+        response = self.client.get(reverse('admin_users_list'), {'email': 'author3'})
+        users = list(response.context['users'])
+        self.assertEqual([u.email for u in users], ['author3@test.ru'])
+        self.assertEqual(users[0].recipes_count, 3)
+
+        response = self.client.get(reverse('admin_users_list'), {'email': 'reader3_0'})
+        reader = response.context['users'][0]
+        self.assertEqual((reader.reviews_count, reader.favorites_count), (3, 3))
+
+    def test_filters(self):
+        url = reverse('admin_users_list')
+        self.assertEqual(self.client.get(url, {'is_staff': '1'}).context['page'].paginator.count, 1)
+        self.assertEqual(self.client.get(url, {'name': 'Автор'}).context['page'].paginator.count, 1)
+        self.assertEqual(self.client.get(url, {'joined_to': '2000-01-01'}).context['page'].paginator.count, 0)
+
+    def test_email_and_phone_prefix_search_uses_indexes(self):
+        User.objects.filter(email='author3@test.ru').update(phone_num='+79001234567')
+        for params, index in (({'email': 'AUTHOR3'}, 'recept_user_email_lower_idx'), ({'phone': '+7900'}, 'phone_num')):
+            form = AdminUserFilterForm(params)
+            users = form.filter(User.objects.all())
+            self.assertEqual([u.email for u in users], ['author3@test.ru'])
+            plan = users.explain()
+            self.assertIn('USING INDEX', plan)
+            self.assertIn(index, plan)
+
+
+@override_settings(MODERATION_BATCH_SIZE=3)
+class ModerationQueueTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(email='author@test.ru')
+        self.first = User.objects.create_superuser(email='mod1@test.ru')
+        self.second = User.objects.create_superuser(email='mod2@test.ru')
+        self.pending = [
+            Recipe.objects.create(user=self.author, title=f'Рецепт {i}', status='pending') for i in range(8)
+        ]
+
+    def test_claimed_batches_are_disjoint(self):
+        a = {r.pk for r in moderation.claim_batch(self.first)}
+        b = {r.pk for r in moderation.claim_batch(self.second)}
+        self.assertEqual((len(a), len(b)), (3, 3))
+        self.assertFalse(a & b)
+        # Повторный захват продлевает аренду, а не выдаёт новые рецепты
+        self.assertEqual({r.pk for r in moderation.claim_batch(self.first)}, a)
+
+    def test_bulk_moderation_skips_recipes_claimed_by_others(self):
+        theirs = [r.pk for r in moderation.claim_batch(self.second)]
+        ids = [r.pk for r in self.pending]
+        updated = moderation.moderate(ids, self.first, approve=True)
+        self.assertEqual(set(updated), set(ids) - set(theirs))
+        self.assertEqual(Recipe.objects.filter(status='published').count(), 5)
+        # Повторное одобрение ничего не меняет: условие status='pending'
+        self.assertEqual(moderation.moderate(ids, self.first, approve=True), [])
+
+    def test_lease_is_checked_by_the_update_itself(self):
+        ids = [r.pk for r in self.pending]
+        with CaptureQueriesContext(connection) as queries:
+            moderation.moderate(ids, self.first, approve=False)
+        # Первый запрос к рецептам - условный UPDATE с проверкой аренды, без чтения перед ним
+        first = next(q['sql'] for q in queries if '"recept_recipe"' in q['sql'])
+        self.assertTrue(first.startswith('UPDATE "recept_recipe"'), first)
+        self.assertIn('"claimed_until" <', first)
+
+    def test_bulk_view_rejects_with_notes(self):
+        self.client.force_login(self.first)
+        ids = [self.pending[0].pk, self.pending[1].pk]
+        self.client.post(reverse('admin_bulk_moderation'), {
+            'recipe_ids': ids, 'action': 'reject', 'moderation_notes': 'Нет фото',
+        })
+        self.assertEqual(set(Recipe.objects.filter(status='rejected').values_list('moderation_notes', flat=True)), {'Нет фото'})
+
+    def test_queue_keyset_pagination(self):
+        seen = []
+        recipes, cursor = moderation.queue_page(limit=3)
+        seen += recipes
+        while cursor:
+            recipes, cursor = moderation.queue_page(cursor, limit=3)
+            seen += recipes
+        self.assertEqual([r.pk for r in seen], [r.pk for r in self.pending])
+
+
+class StatsTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(email='author@test.ru')
+        self.admin = User.objects.create_superuser(email='admin@test.ru')
+
+    def day_value(self, metric):
+        bucket = StatBucket.objects.filter(period='day', metric=metric).order_by('-start').first()
+        return bucket.value if bucket else 0
+
+    def test_events_update_current_buckets(self):
+        recipe = Recipe.objects.create(user=self.author, title='Суп', status='published')
+        Review.objects.create(recipe=recipe, user=self.admin, rating=5)
+        Favorite.objects.create(recipe=recipe, user=self.admin)
+        self.assertEqual(self.day_value('new_users'), 2)
+        self.assertEqual(self.day_value('reviews'), 1)
+        self.assertEqual(StatBucket.objects.filter(period='hour', metric='favorites').get().value, 1)
+
+    def test_rollup_corrects_drift_and_stores_totals(self):
+        Recipe.objects.create(user=self.author, title='Суп', status='pending')
+        StatBucket.objects.filter(metric='new_users').update(value=100)
+        stats.rollup()
+        self.assertEqual(self.day_value('new_users'), 2)
+        totals = stats.latest_totals()
+        self.assertEqual(totals['users_total'][0], 2)
+        self.assertEqual(totals['recipes_pending_total'][0], 1)
+
+    def test_moderation_records_turnaround(self):
+        recipe = Recipe.objects.create(
+            user=self.author, title='Суп', status='pending',
+            submitted_at=timezone.now() - timedelta(hours=3),
+        )
+        moderation.moderate([recipe.pk], self.admin, approve=True)
+        self.assertEqual(self.day_value('recipes_published'), 1)
+        stats.rollup()
+        self.assertAlmostEqual(self.day_value('moderation_turnaround'), 3, places=1)
+
+    def test_dashboard_reads_precomputed_stats(self):
+        self.client.force_login(self.admin)
+        # Пока пересчёта не было, панель ставит его в очередь
+        self.client.get(reverse('admin_profile'))
+        self.assertTrue(Task.objects.filter(name='stats.rollup', status='queued').exists())
+        self.assertEqual(tasks.run_pending(), 1)
+
+        response = self.client.get(reverse('admin_profile'))
+        self.assertEqual(response.context['total_users'], 2)
+        self.assertEqual(len(response.context['trend_days']), 14)
+
+
+class TaskQueueTests(TestCase):
+
+    def test_failed_task_is_retried_then_marked_failed(self):
+        calls = []
+
+        @tasks.task('test.fail')
+        def fail(task_obj):
+            calls.append(task_obj.attempts)
+            raise RuntimeError('boom')
+
+        job = tasks.enqueue('test.fail')
+        with self.assertLogs('recept.tasks', 'ERROR'):
+            for _ in range(3):
+                Task.objects.filter(pk=job.pk).update(run_after=timezone.now())
+                tasks.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(calls, [1, 2, 3])
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('boom', job.error)
+
+    def test_enqueue_once_and_progress(self):
+        @tasks.task('test.progress')
+        def progress(task_obj, total):
+            tasks.report_progress(task_obj, total, total=total)
+
+        first = tasks.enqueue_once('test.progress', total=7)
+        self.assertEqual(tasks.enqueue_once('test.progress', total=7).pk, first.pk)
+        tasks.run_pending()
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.progress, first.total), ('done', 7, 7))
+
+    def test_task_of_dead_worker_is_requeued_after_lease(self):
+        calls = []
+
+        @tasks.task('test.stuck')
+        def stuck(task_obj):
+            calls.append(task_obj.attempts)
+
+        expired = timezone.now() - tasks.lease() - timedelta(seconds=1)
+        dead = tasks.enqueue('test.stuck')
+        Task.objects.filter(pk=dead.pk).update(status='running', attempts=1, started_at=expired, heartbeat_at=expired)
+        alive = tasks.enqueue('test.stuck')
+        Task.objects.filter(pk=alive.pk).update(status='running', attempts=1, started_at=expired, heartbeat_at=timezone.now())
+        exhausted = tasks.enqueue('test.stuck')
+        Task.objects.filter(pk=exhausted.pk).update(status='running', attempts=3, started_at=expired, heartbeat_at=expired)
+
+        with self.assertLogs('recept.tasks', 'WARNING'):
+            tasks.run_pending()
+        self.assertEqual(calls, [2])
+        statuses = dict(Task.objects.values_list('pk', 'status'))
+        self.assertEqual((statuses[dead.pk], statuses[alive.pk], statuses[exhausted.pk]), ('done', 'running', 'failed'))
+
+
+@override_settings(ROOT_URLCONF='recept.test_urls', SLOW_QUERY_THRESHOLD_MS=None)
+class DjangoAdminQueryTests(TestCase):
+    # Число запросов на каждый список и форму изменения не должно зависеть от объёма данных
+    BUDGETS = {
+        'admin:recept_user_changelist': 5,
+        'admin:recept_recipe_changelist': 6,
+        'admin:recept_review_changelist': 6,
+        'admin:recept_favorite_changelist': 5,
+        'admin:recept_genre_changelist': 5,
+        'admin:recept_listingredient_changelist': 5,
+        'admin:recept_user_change': 8,
+        'admin:recept_recipe_change': 9,
+        'admin:recept_review_change': 6,
+        'admin:recept_favorite_change': 6,
+    }
+
+    def measure(self, name, size):
+        with transaction.atomic():
+            data = seed(size)
+            self.client.force_login(data['admin'])
+            args = None
+            if name.endswith('_change'):
+                model = {'user': User, 'recipe': Recipe, 'review': Review, 'favorite': Favorite}[name.split('_')[1]]
+                args = [model.objects.order_by('pk').first().pk]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse(name, args=args))
+            self.assertEqual(response.status_code, 200, name)
+            transaction.set_rollback(True)
+        return len(ctx.captured_queries)
+
+    def test_query_counts_do_not_grow(self):
+        # Кеш ContentType заполняется заранее, иначе первый замер на запрос дороже
+        ContentType.objects.get_for_models(*admin.site._registry)
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(url=name):
+                counts = [self.measure(name, size) for size in SIZES]
+                self.assertLessEqual(max(counts), budget, f'{name}: {counts}')
+                self.assertEqual(len(set(counts)), 1, f'{name}: {counts}')
+
+    def test_inline_shows_ingredient_without_dropdown(self):
+        data = seed(3)
+        ListIngredient.objects.create(name='Неиспользуемый ингредиент')
+        self.client.force_login(data['admin'])
+        response = self.client.get(reverse('admin:recept_recipe_change', args=[data['recipe'].pk]))
+        self.assertContains(response, 'Ингредиент 3-0')
+        self.assertNotContains(response, 'Неиспользуемый ингредиент')
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1)
+    def test_changelist_uses_estimated_count(self):
+        data = seed(3)
+        self.client.force_login(data['admin'])
+        Review.objects.filter(pk=Review.objects.order_by('pk').first().pk).delete()
+        response = self.client.get(reverse('admin:recept_review_changelist'))
+        # Оценка по MAX(rowid) не видит удалённую строку - это ожидаемая цена отказа от COUNT(*)
+        self.assertEqual(response.context['cl'].result_count, 9)
+        response = self.client.get(reverse('admin:recept_review_changelist'), {'rating__exact': 4})
+        self.assertEqual(response.context['cl'].result_count, 8)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1)
+    def test_estimate_applies_to_manager_filtered_recipes(self):
+        data = seed(3)
+        self.client.force_login(data['admin'])
+        # Recipe.objects сам исключает удалённые, но фильтров админки здесь нет
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:recept_recipe_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(*)' in q['sql']])
+        response = self.client.get(reverse('admin:recept_recipe_changelist'), {'status__exact': 'published'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+
+@override_settings(DELETION_CHUNK_SIZE=2)
+class BackgroundDeletionTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.data = seed(3)
+        self.recipe = self.data['recipe']
+        self.recipe.cover_image = SimpleUploadedFile('cover.jpg', b'x' * 10)
+        self.recipe.save()
+        step = self.recipe.steps.first()
+        step.image = SimpleUploadedFile('step.jpg', b'x' * 10)
+        step.save()
+        self.files = [self.recipe.cover_image.path, step.image.path]
+
+    def test_recipe_is_hidden_then_purged_in_chunks(self):
+        self.client.force_login(self.data['author'])
+        self.client.post(reverse('recipe_delete', args=[self.recipe.pk]))
+        self.assertFalse(Recipe.objects.filter(pk=self.recipe.pk).exists())
+        self.assertEqual(RecipeStep.objects.filter(recipe=self.recipe).count(), 3)
+
+        self.assertEqual(tasks.run_pending(), 1)
+        job = Task.objects.get(name='deletion.recipe')
+        self.assertEqual((job.status, job.progress, job.total), ('done', 13, 13))
+        self.assertFalse(Recipe.all_objects.filter(pk=self.recipe.pk).exists())
+        self.assertFalse(Review.objects.filter(recipe_id=self.recipe.pk).exists())
+        self.assertFalse(any(os.path.exists(path) for path in self.files))
+
+    def test_user_deletion_keeps_reviews_on_other_recipes(self):
+        other = Recipe.objects.create(user=self.data['admin'], title='Чужой', status='published')
+        review = Review.objects.create(recipe=other, user=self.data['author'], rating=5)
+        self.client.force_login(self.data['admin'])
+        self.client.post(reverse('admin_user_delete', args=[self.data['author'].pk]))
+
+        author = User.objects.get(pk=self.data['author'].pk)
+        self.assertFalse(author.is_active)
+        self.assertFalse(Recipe.objects.filter(user=author).exists())
+        self.assertEqual(self.client.get(reverse('user_profile', args=[author.pk])).status_code, 404)
+
+        tasks.run_pending()
+        self.assertFalse(User.objects.filter(pk=author.pk).exists())
+        self.assertFalse(Recipe.all_objects.filter(user_id=author.pk).exists())
+        review.refresh_from_db()
+        self.assertIsNone(review.user_id)
+        self.assertFalse(any(os.path.exists(path) for path in self.files))
+
+
+class MediaGarbageCollectorTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        author = User.objects.create_user(email='author@test.ru')
+        self.recipe = Recipe.objects.create(
+            user=author, title='Суп', cover_image=SimpleUploadedFile('kept.jpg', b'x' * 5),
+        )
+        self.kept = self.recipe.cover_image.path
+        os.makedirs(os.path.join(self.media.name, 'recipe_steps'))
+        self.orphan = os.path.join(self.media.name, 'recipe_images', 'orphan.jpg')
+        with open(self.orphan, 'wb') as f:
+            f.write(b'x' * 100)
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', '--grace-hours', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_by_default(self):
+        output = self.gc()
+        self.assertIn('recipe_images/orphan.jpg', output)
+        self.assertNotIn(self.recipe.cover_image.name, output)
+        self.assertIn('100 байт', output)
+        self.assertTrue(os.path.exists(self.orphan))
+
+    def test_deletes_only_orphans_older_than_grace_period(self):
+        call_command('gc_media', '--delete', stdout=StringIO())
+        self.assertTrue(os.path.exists(self.orphan))
+
+        self.gc('--delete')
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.kept))
+
+    def test_quarantine_moves_files(self):
+        with tempfile.TemporaryDirectory() as quarantine:
+            self.gc('--quarantine', quarantine)
+            self.assertTrue(os.path.exists(os.path.join(quarantine, 'recipe_images', 'orphan.jpg')))
+        self.assertFalse(os.path.exists(self.orphan))
+
+    def test_large_directory_is_checked_in_batches(self):
+        directory = os.path.dirname(self.orphan)
+        for i in range(gc_media.BATCH_SIZE + 5):
+            open(os.path.join(directory, f'extra{i}.jpg'), 'wb').close()
+        self.gc('--delete')
+        self.assertEqual(os.listdir(directory), [os.path.basename(self.kept)])
+
+
+class ApiTests(TestCase):
+
+    def setUp(self):
+        self.data = seed(3)
+
+    def get(self, name, args=None, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_cursor_pagination_walks_all_published_recipes(self):
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 1, 'fields': 'title'}
+            if cursor:
+                params['cursor'] = cursor
+            payload = self.get('api_recipe_list', **params).json()
+            seen += payload['results']
+            cursor = payload['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), Recipe.objects.filter(status='published').count())
+        self.assertEqual(set(seen[0]), {'id', 'title'})
+
+    def test_include_uses_one_query_per_relation(self):
+        with self.assertNumQueries(3):
+            payload = self.get('api_recipe_list', include='ingredients,steps').json()
+        recipe = payload['results'][0]
+        self.assertEqual(len(recipe['ingredients']), 3)
+        self.assertEqual([s['order'] for s in recipe['steps']], [1, 2, 3])
+
+    def test_detail_hides_unpublished_and_rejects_unknown_fields(self):
+        self.assertEqual(self.get('api_recipe_detail', [self.data['pending'].pk]).status_code, 404)
+        response = self.get('api_recipe_detail', [self.data['recipe'].pk], fields='password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_filters_reject_non_numeric_ids(self):
+        self.assertEqual(self.get('api_recipe_list', author='x').status_code, 400)
+        self.assertEqual(self.get('api_recipe_list', genre='1.5').status_code, 400)
+        payload = self.get('api_recipe_list', author=str(self.data['author'].pk)).json()
+        self.assertEqual(len(payload['results']), 2)
+
+    def test_etag_returns_not_modified(self):
+        url = reverse('api_genre_list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Genre.objects.create(name='Новый')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_user_profile_counts_published_recipes(self):
+        payload = self.get('api_user_detail', [self.data['author'].pk]).json()
+        self.assertEqual(payload['recipes_count'], 2)
+        self.assertNotIn('email', payload)
+
+    def test_file_urls_come_from_storage(self):
+        Recipe.objects.filter(pk=self.data['recipe'].pk).update(cover_image='recipe_images/суп дня.jpg')
+        payload = self.get('api_recipe_list', fields='id,cover_image').json()
+        covers = {r['id']: r['cover_image'] for r in payload['results']}
+        self.assertEqual(covers[self.data['recipe'].pk], '/media/recipe_images/%D1%81%D1%83%D0%BF%20%D0%B4%D0%BD%D1%8F.jpg')
+
+
+class RecipeSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(email='author@test.ru', full_name='Автор')
+        self.admin = User.objects.create_superuser(email='admin@test.ru')
+        self.recipe = Recipe.objects.create(user=self.author, title='Суп', status='pending')
+        RecipeStep.objects.create(recipe=self.recipe, order=1, description='Сварить')
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=ListIngredient.objects.create(name='Вода'), quantity=Decimal('1.00'), unit='ml',
+        )
+
+    def test_approval_builds_snapshot_served_by_one_query(self):
+        self.assertFalse(RecipeSnapshot.objects.exists())
+        moderation.moderate([self.recipe.pk], self.admin, approve=True)
+        data = RecipeSnapshot.objects.get(pk=self.recipe.pk).data
+        self.assertEqual(data['ingredients'], [{
+            'ingredient_id': self.recipe.recipe_ingredients.get().ingredient_id,
+            'name': 'Вода', 'quantity': '1.00', 'unit': 'ml', 'unit_display': 'Миллилитры',
+        }])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('recipe_detail', args=[self.recipe.pk]))
+        self.assertContains(response, 'Сварить')
+        self.assertContains(response, 'Отзывы (0)')
+
+    def test_unpublished_recipe_is_rendered_from_tables(self):
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('recipe_detail', args=[self.recipe.pk]))
+        self.assertContains(response, 'На модерации')
+        self.assertFalse(RecipeSnapshot.objects.exists())
+
+    def test_read_of_unpublished_recipe_does_not_write_snapshots(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIsNone(snapshots.fetch(self.recipe.pk))
+            self.assertIsNone(snapshots.fetch(self.recipe.pk + 1000))
+        writes = [q['sql'] for q in ctx.captured_queries if 'recept_recipesnapshot' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(writes, [])
+
+    def test_saves_outside_the_site_rebuild_or_drop_snapshots(self):
+        moderation.moderate([self.recipe.pk], self.admin, approve=True)
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                recipe.title = 'Новый суп'
+                recipe.save()
+                RecipeStep.objects.create(recipe=recipe, order=2, description='Посолить')
+        data = RecipeSnapshot.objects.get(pk=recipe.pk).data
+        self.assertEqual((data['title'], len(data['steps'])), ('Новый суп', 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.status = 'draft'
+            recipe.save()
+        self.assertFalse(RecipeSnapshot.objects.exists())
+
+    def test_snapshot_file_urls_come_from_storage(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(cover_image='recipe_images/суп дня.jpg')
+        moderation.moderate([self.recipe.pk], self.admin, approve=True)
+        data = RecipeSnapshot.objects.get(pk=self.recipe.pk).data
+        self.assertEqual(data['cover_image'], '/media/recipe_images/%D1%81%D1%83%D0%BF%20%D0%B4%D0%BD%D1%8F.jpg')
+        self.assertIsNone(data['video_file'])
+
+    def test_snapshot_is_not_served_after_unpublishing_by_update(self):
+        moderation.moderate([self.recipe.pk], self.admin, approve=True)
+        Recipe.objects.filter(pk=self.recipe.pk).update(status='rejected')
+        self.assertIsNone(snapshots.fetch(self.recipe.pk))
+
+    def test_author_rename_and_deletion_update_snapshots(self):
+        moderation.moderate([self.recipe.pk], self.admin, approve=True)
+        self.author.full_name = 'Новое имя'
+        self.author.save()
+        snapshots.rebuild_for_author(self.author)
+        self.assertEqual(RecipeSnapshot.objects.get(pk=self.recipe.pk).data['author_name'], 'Новое имя')
+
+        self.client.force_login(self.author)
+        self.client.post(reverse('recipe_delete', args=[self.recipe.pk]))
+        self.assertFalse(RecipeSnapshot.objects.exists())
+        self.assertEqual(self.client.get(reverse('api_recipe_detail', args=[self.recipe.pk])).status_code, 404)
+
+
+class PortionScalingTests(TestCase):
+
+    def setUp(self):
+        author = User.objects.create_user(email='author@test.ru')
+        self.recipe = Recipe.objects.create(user=author, title='Блины', status='published', portions=2)
+        self.water = ListIngredient.objects.create(name='Вода')
+        self.flour = ListIngredient.objects.create(name='Мука', density=Decimal('0.5'))
+        self.eggs = ListIngredient.objects.create(name='Яйца')
+        RecipeIngredient.objects.create(recipe=self.recipe, ingredient=self.water, quantity=Decimal('2'), unit='tablesp')
+        RecipeIngredient.objects.create(recipe=self.recipe, ingredient=self.flour, quantity=Decimal('3'), unit='cup')
+        RecipeIngredient.objects.create(recipe=self.recipe, ingredient=self.eggs, quantity=Decimal('1'), unit='pcs')
+        snapshots.rebuild([self.recipe.pk])
+
+    def quantities(self, ingredients):
+        return [(str(i['quantity']), i['unit']) for i in ingredients]
+
+    def test_convert_scales_and_normalizes_units(self):
+        document = snapshots.fetch(self.recipe.pk)[0]
+        self.assertEqual(
+            self.quantities(portions.scaled_ingredients(document, 3, 'original')),
+            [('3.00', 'tablesp'), ('4.50', 'cup'), ('1.50', 'pcs')],
+        )
+        self.assertEqual(
+            self.quantities(portions.scaled_ingredients(document, 4, 'metric')),
+            [('60.00', 'ml'), ('1500.00', 'ml'), ('2.00', 'pcs')],
+        )
+        # Вода - по таблице плотностей, мука - по значению из справочника
+        self.assertEqual(
+            self.quantities(portions.scaled_ingredients(document, 4, 'mass')),
+            [('60.00', 'g'), ('750.00', 'g'), ('2.00', 'pcs')],
+        )
+
+    def test_detail_page_scales_and_caches(self):
+        url = reverse('recipe_detail', args=[self.recipe.pk])
+        response = self.client.get(url, {'portions': 20, 'units': 'mass'})
+        flour = response.context['ingredients'][1]
+        self.assertEqual((str(flour['quantity']), flour['unit']), ('3.75', 'kg'))
+        # Та же страница для анонима целиком из кеша страниц
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'portions': 20, 'units': 'mass'})['X-Page-Cache'], 'hit')
+        # Другая строка запроса - новая страница, но пересчёт из кеша: только чтение снимка
+        with self.assertNumQueries(1):
+            self.client.get(url, {'units': 'mass', 'portions': 20})
+
+    def test_density_change_expires_mass_results_and_pages(self):
+        document = snapshots.fetch(self.recipe.pk)[0]
+        url = reverse('recipe_detail', args=[self.recipe.pk])
+        self.client.get(url, {'units': 'mass'})
+        self.assertEqual(self.quantities(portions.scaled_ingredients(document, 4, 'mass'))[1], ('750.00', 'g'))
+        self.flour.density = Decimal('0.6')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flour.save()
+        self.assertEqual(self.quantities(portions.scaled_ingredients(document, 4, 'mass'))[1], ('900.00', 'g'))
+        response = self.client.get(url, {'units': 'mass'})
+        self.assertNotEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(str(response.context['ingredients'][1]['quantity']), '450.00')
+
+    def test_api_accepts_portions(self):
+        payload = self.client.get(
+            reverse('api_recipe_detail', args=[self.recipe.pk]), {'portions': 1, 'units': 'metric', 'include': 'ingredients'},
+        ).json()
+        self.assertEqual(payload['portions'], 1)
+        self.assertEqual(payload['ingredients'][0]['quantity'], '15.00')
+
+
+class ShoppingListTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='cook@test.ru')
+        author = User.objects.create_user(email='author@test.ru')
+        self.milk = ListIngredient.objects.create(name='Молоко')
+        self.eggs = ListIngredient.objects.create(name='Яйца')
+        self.pancakes = Recipe.objects.create(user=author, title='Блины', status='published', portions=2)
+        self.omelette = Recipe.objects.create(user=author, title='Омлет', status='published', portions=1)
+        for recipe, rows in (
+            (self.pancakes, [(self.milk, '2.00', 'cup'), (self.eggs, '2.00', 'pcs')]),
+            (self.omelette, [(self.milk, '3.00', 'tablesp'), (self.eggs, '3.00', 'pcs')]),
+        ):
+            for ingredient, quantity, unit in rows:
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, quantity=Decimal(quantity), unit=unit)
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        self.client.force_login(self.user)
+
+    def items(self, **params):
+        response = self.client.get(reverse('shopping_list'), params)
+        return [(i['name'], str(i['quantity']), i['unit'], i['recipes']) for i in response.context['items']]
+
+    def test_sums_normalized_units_for_target_portions(self):
+        # Блины на 4 порции: 4 кружки = 1000 мл, 4 яйца; омлет на 2 порции: 6 ст. л. = 90 мл, 6 яиц
+        params = {f'portions_{self.pancakes.pk}': 4, f'portions_{self.omelette.pk}': 2}
+        self.assertEqual(self.items(**params), [('Молоко', '1090.00', 'ml', 2), ('Яйца', '10.00', 'pcs', 2)])
+        self.assertEqual(
+            self.items(units='mass', **params),
+            [('Молоко', '1.12', 'kg', 2), ('Яйца', '10.00', 'pcs', 2)],
+        )
+        self.assertEqual(
+            self.items(recipe=self.omelette.pk),
+            [('Молоко', '45.00', 'ml', 1), ('Яйца', '3.00', 'pcs', 1)],
+        )
+
+    def test_ingredients_are_read_in_one_query(self):
+        favorites = []
+        for i in range(50):
+            recipe = Recipe.objects.create(user=self.user, title=f'Рецепт {i}', portions=2)
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe=recipe, ingredient=self.milk, quantity=Decimal('1.00'), unit='cup'),
+                RecipeIngredient(recipe=recipe, ingredient=self.eggs, quantity=Decimal('1.00'), unit='pcs'),
+            ])
+            favorites.append(recipe.pk)
+        with self.assertNumQueries(1):
+            items = shopping.build({pk: (2, 4) for pk in favorites})
+        self.assertEqual([(i['name'], str(i['quantity']), i['unit']) for i in items], [
+            ('Молоко', '25000.00', 'ml'), ('Яйца', '100.00', 'pcs'),
+        ])
+
+    def test_exports_text_and_csv(self):
+        url = reverse('shopping_list')
+        text = self.client.get(url, {'export': 'txt'}).content.decode()
+        self.assertIn('- Молоко: 545 Миллилитры', text)
+        csv_response = self.client.get(url, {'export': 'csv'})
+        self.assertEqual(csv_response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('Яйца,5,Штуки,2', csv_response.content.decode())
+
+
+class ReviewsPageTests(TestCase):
+
+    def setUp(self):
+        author = User.objects.create_user(email='author@test.ru')
+        self.recipe = Recipe.objects.create(user=author, title='Суп', status='published')
+        self.viewer = User.objects.create_user(email='viewer@test.ru')
+        Review.objects.create(recipe=self.recipe, user=self.viewer, rating=2, comment='Пресно')
+        readers = User.objects.bulk_create([User(email=f'r{i}@test.ru') for i in range(24)])
+        Review.objects.bulk_create([
+            Review(recipe=self.recipe, user=reader, rating=5 if i % 3 else 4) for i, reader in enumerate(readers)
+        ])
+        self.url = reverse('recipe_reviews', args=[self.recipe.pk])
+        self.client.force_login(author)
+
+    def test_histogram_and_average(self):
+        rating = self.client.get(self.url).context['rating']
+        self.assertEqual(rating['total'], 25)
+        self.assertEqual([(stars, count) for stars, count, _ in rating['rows']], [(5, 16), (4, 8), (3, 0), (2, 1), (1, 0)])
+        self.assertAlmostEqual(rating['average'], (16 * 5 + 8 * 4 + 2) / 25)
+
+    def test_keyset_pages_cover_all_reviews(self):
+        first = self.client.get(self.url)
+        self.assertEqual(len(first.context['reviews']), reviews.PAGE_SIZE)
+        second = self.client.get(self.url, {'after': first.context['next_cursor']})
+        self.assertIsNone(second.context['next_cursor'])
+        ids = [r.pk for r in first.context['reviews']] + [r.pk for r in second.context['reviews']]
+        self.assertEqual(sorted(ids), sorted(Review.objects.values_list('pk', flat=True)))
+
+    def test_own_review_comes_with_recipe(self):
+        self.client.force_login(self.viewer)
+        # сессия, пользователь, рецепт с отзывом пользователя, гистограмма, страница
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        self.assertTrue(response.context['user_has_reviewed'])
+        self.assertEqual(response.context['form'].initial, {'rating': 2, 'comment': 'Пресно'})
+
+
+class ReviewSubmitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(email='author@test.ru')
+        self.recipe = Recipe.objects.create(user=author, title='Суп', status='published')
+        self.reader = User.objects.create_user(email='reader@test.ru')
+        self.url = reverse('recipe_reviews', args=[self.recipe.pk])
+        self.client.force_login(self.reader)
+
+    def test_post_upserts_review_and_aggregates(self):
+        self.client.post(self.url, {'rating': 5, 'comment': 'Отлично'})
+        self.client.post(self.url, {'rating': 3, 'comment': 'Передумал'})
+        review = Review.objects.get(recipe=self.recipe)
+        self.assertEqual((review.rating, review.comment), (3, 'Передумал'))
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.rating_count, self.recipe.rating_sum, self.recipe.average_rating), (1, 3, 3.0))
+
+    def test_submit_over_existing_review_does_not_conflict(self):
+        # Отзыв, записанный параллельным запросом, обновляется, а не падает на unique_together
+        Review.objects.create(recipe=self.recipe, user=self.reader, rating=1)
+        self.assertFalse(reviews.submit(self.recipe.pk, self.reader, 4, ''))
+        self.assertEqual(list(Review.objects.values_list('rating', flat=True)), [4])
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.rating_count, self.recipe.rating_sum), (1, 4))
+
+    def test_new_review_is_detected_by_the_write(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(reviews.submit(self.recipe.pk, self.reader, 5, ''))
+        created_at = Review.objects.get().created_at
+        self.assertFalse(reviews.submit(self.recipe.pk, self.reader, 2, 'Пересолено'))
+        review_queries = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith(('SELECT', 'INSERT INTO "recept_review"', 'UPDATE "recept_review"')) and '"recept_review"' in q['sql']
+        ]
+        # Ни проверки существования, ни UPDATE перед записью: новизну сообщает сам upsert
+        self.assertEqual(len(review_queries), 1, review_queries)
+        self.assertIn('ON CONFLICT', review_queries[0])
+        review = Review.objects.get()
+        self.assertEqual((review.rating, review.comment, review.created_at), (2, 'Пересолено', created_at))
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.written_reviews_count, 1)
+        self.assertEqual(Notification.objects.filter(kind='review').count(), 1)
+
+    @override_settings(REVIEW_THROTTLE_RATE=(2, 60))
+    def test_writes_are_throttled_per_user(self):
+        for rating in (5, 4):
+            self.assertEqual(self.client.post(self.url, {'rating': rating}).status_code, 302)
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, {'rating': 1})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Review.objects.get().rating, 4)
+
+
+class NotificationStreamTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(email='author@test.ru', full_name='Автор')
+        self.admin = User.objects.create_superuser(email='admin@test.ru')
+        self.recipe = Recipe.objects.create(user=self.author, title='Суп', status='pending')
+        # id уведомлений переиспользуются после отката транзакции теста
+        events.broker.last_id = None
+        events.broker.recent = set()
+
+    def test_moderation_and_new_reviews_notify_author(self):
+        moderation.moderate([self.recipe.pk], self.admin, approve=True)
+        reader = User.objects.create_user(email='reader@test.ru', full_name='Читатель')
+        reviews.submit(self.recipe.pk, reader, 5, '')
+        # Правка отзыва не создаёт нового уведомления
+        reviews.submit(self.recipe.pk, reader, 4, '')
+        self.assertEqual(
+            list(Notification.objects.filter(user=self.author).order_by('pk').values_list('kind', flat=True)),
+            ['approved', 'review'],
+        )
+
+    def test_anonymous_is_forbidden(self):
+        self.assertEqual(self.client.get(reverse('events')).status_code, 403)
+
+    def test_wsgi_fallback_marks_position_then_returns_new_events(self):
+        self.client.force_login(self.author)
+        old = Notification.objects.create(user=self.author, kind='review', payload={'message': 'Старое'})
+        response = self.client.get(reverse('events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        self.assertContains(response, f'id: {old.pk}\n\n')
+        self.assertNotContains(response, 'Старое')
+
+        new = Notification.objects.create(user=self.author, kind='approved', payload={'message': 'Новое'})
+        response = self.client.get(reverse('events'), headers={'Last-Event-ID': str(old.pk)})
+        self.assertContains(response, f'id: {new.pk}\nevent: approved\n')
+
+    async def test_asgi_app_checks_session(self):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'path': reverse('events'), 'query_string': b'', 'headers': [(b'cookie', b'sessionid=missing')]}
+        await events.asgi_app(scope, receive, send)
+        self.assertEqual(messages[0]['status'], 403)
+
+        await self.client.aforce_login(self.author)
+        cookie = f'sessionid={self.client.cookies["sessionid"].value}'.encode()
+        messages.clear()
+        await events.asgi_app({**scope, 'headers': [(b'cookie', cookie)]}, receive, send)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertEqual(events.broker.subscribers, {})
+        events.broker.wake()
+        await asyncio.wait_for(events.broker.task, 5)
+
+    async def test_stream_replays_missed_and_pushes_new_events(self):
+        missed = await sync_to_async(Notification.objects.create)(user=self.author, kind='review', payload={'message': 'Старое'})
+        stream = events.stream(self.author.pk, last_event_id=0)
+        self.assertTrue((await anext(stream)).startswith('retry:'))
+        self.assertIn(f'id: {missed.pk}\n', await anext(stream))
+
+        await sync_to_async(events.notify)([(self.author.pk, 'approved', {'message': 'Новое'})])
+        # В TestCase on_commit не срабатывает: будим брокер вручную
+        events.broker.wake()
+        chunk = await asyncio.wait_for(anext(stream), 5)
+        self.assertIn('event: approved', chunk)
+        self.assertIn('"message": "Новое"', chunk)
+
+        await stream.aclose()
+        self.assertEqual(events.broker.subscribers, {})
+        events.broker.wake()
+        await asyncio.wait_for(events.broker.task, 5)
+
+
+    async def test_broker_delivers_rows_committed_out_of_order(self):
+        create = sync_to_async(Notification.objects.create)
+        early = await create(user=self.author, kind='review', payload={'message': 'Закоммичено позже'})
+        late = await create(user=self.author, kind='review', payload={'message': 'Прочитано раньше'})
+        # Брокер уже прочитал строку с большим id, а строка с меньшим появилась после
+        queue = asyncio.Queue()
+        events.broker.subscribers = {self.author.pk: {queue}}
+        self.addCleanup(setattr, events.broker, 'subscribers', {})
+        events.broker.last_id, events.broker.recent = late.pk, {late.pk}
+        await events.broker.poll()
+        await events.broker.poll()
+        self.assertEqual([queue.get_nowait()['id']], [early.pk])
+        self.assertTrue(queue.empty())
+
+    async def test_restarted_broker_does_not_replay_rows_written_while_stopped(self):
+        # Позиция осталась от прошлого запуска, после неё без подписчиков записано уведомление
+        events.broker.last_id = 0
+        await sync_to_async(Notification.objects.create)(user=self.author, kind='review', payload={'message': 'Старое'})
+        queue = events.broker.subscribe(self.author.pk)
+        await asyncio.sleep(0.1)
+        await sync_to_async(Notification.objects.create)(user=self.author, kind='approved', payload={'message': 'Новое'})
+        events.broker.wake()
+        event = await asyncio.wait_for(queue.get(), 5)
+        self.assertEqual(event['message'], 'Новое')
+        events.broker.unsubscribe(self.author.pk, queue)
+        events.broker.wake()
+        await asyncio.wait_for(events.broker.task, 5)
+
+
+class SearchCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        search.results.clear()
+        self.author = User.objects.create_user(email='author@test.ru')
+        self.admin = User.objects.create_superuser(email='admin@test.ru')
+        self.soup = Recipe.objects.create(user=self.author, title='Грибной суп', status='published')
+        self.borsch = Recipe.objects.create(user=self.author, title='Борщ', description='Суп со свёклой', status='published')
+        Recipe.objects.create(user=self.author, title='Суп-черновик', status='draft')
+
+    def test_normalized_query_ignores_case_and_word_order(self):
+        self.assertEqual(search.normalize('  Суп ГРИБНОЙ суп '), 'грибной суп')
+        self.assertEqual(list(search.recipe_ids('СУП')), [self.borsch.pk, self.soup.pk])
+        self.assertEqual(list(search.recipe_ids('Грибной суп')), [self.soup.pk])
+        # Только чтение версии каталога, список id - из кеша
+        with self.assertNumQueries(1):
+            self.assertEqual(list(search.recipe_ids('суп  грибной')), [self.soup.pk])
+        self.assertEqual(search.results.size, 3)
+
+    def test_publish_bumps_catalogue_version(self):
+        search.recipe_ids('суп')
+        pending = Recipe.objects.create(user=self.author, title='Суп с фрикадельками', status='pending')
+        with self.captureOnCommitCallbacks(execute=True):
+            moderation.moderate([pending.pk], self.admin, approve=True)
+        self.assertIn(pending.pk, search.recipe_ids('суп'))
+
+    def test_version_is_shared_through_the_database_and_entries_expire(self):
+        search.recipe_ids('суп')
+        # Другой воркер: своя память процесса, общая база
+        Recipe.objects.filter(pk=self.soup.pk).update(status='draft')
+        search.bump_version()
+        self.assertEqual(list(search.recipe_ids('суп')), [self.borsch.pk])
+
+        Recipe.objects.filter(pk=self.soup.pk).update(status='published')
+        with override_settings(SEARCH_CACHE_TTL=0):
+            search.results.clear()
+            search.recipe_ids('суп')
+            self.assertEqual(list(search.recipe_ids('суп')), [self.borsch.pk, self.soup.pk])
+
+    def test_list_view_skips_recipes_unpublished_since_caching(self):
+        # Вошедший пользователь: кеш страниц для анонимов не мешает
+        self.client.force_login(self.author)
+        self.client.get(reverse('recipe_list'), {'q': 'суп'})
+        # Изменение в обход catalogue_changed(): версия та же, список id в кеше прежний
+        Recipe.objects.filter(pk=self.soup.pk).update(status='rejected')
+        response = self.client.get(reverse('recipe_list'), {'q': 'суп'})
+        self.assertEqual([r.pk for r in response.context['recipes']], [self.borsch.pk])
+
+    @override_settings(SEARCH_CACHE_ENTRIES=2, SEARCH_CACHE_IDS=8)
+    def test_lru_eviction_and_size_limit(self):
+        search.results.set('a', array('q', [1]))
+        search.results.set('b', array('q', [2]))
+        search.results.get('a')
+        search.results.set('c', array('q', [3, 4]))
+        self.assertEqual(list(search.results.entries), ['a', 'c'])
+        # Результат больше четверти лимита не кешируется
+        search.results.set('d', array('q', range(3)))
+        self.assertNotIn('d', search.results.entries)
+        self.assertEqual(search.results.size, 3)
+
+    def test_list_view_filters_by_genre_and_paginates(self):
+        genre = Genre.objects.create(name='Супы')
+        self.soup.genres.add(genre)
+        response = self.client.get(reverse('recipe_list'), {'q': 'суп', 'genre': genre.pk})
+        self.assertEqual([r.pk for r in response.context['recipes']], [self.soup.pk])
+        self.assertEqual(response.context['selected_genre_name'], 'Супы')
+        response = self.client.get(reverse('recipe_list'), {'page': 2, 'genre': 'abc'})
+        self.assertEqual(response.context['page'].paginator.count, 2)
+        self.assertIsNone(response.context['selected_genre_id'])
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(email='author@test.ru', full_name='Автор')
+        self.recipe = Recipe.objects.create(user=self.author, title='Борщ', status='published')
+        snapshots.rebuild([self.recipe.pk])
+        self.url = reverse('recipe_detail', args=[self.recipe.pk])
+
+    def test_anonymous_hit_skips_view(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Борщ')
+        # Строка запроса - отдельная запись
+        self.assertEqual(self.client.get(self.url, {'portions': 4})['X-Page-Cache'], 'miss')
+
+    def test_logged_in_visitors_bypass_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(self.author)
+        self.assertNotIn('X-Page-Cache', self.client.get(self.url))
+
+    def test_model_signal_invalidates_and_one_request_regenerates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.filter(pk=self.recipe.pk).update(title='Зелёный борщ')
+            snapshots.rebuild([self.recipe.pk])
+            self.author.full_name = 'Новый автор'
+            self.author.save()
+        # Пока страницу перестраивает другой запрос, отдаётся устаревшая копия
+        lock = pagecache.page_key(RequestFactory().get(self.url)) + ':lock'
+        cache.add(lock, 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertNotContains(response, 'Зелёный')
+
+        cache.delete(lock)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Зелёный борщ')
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'hit')
+
+    def test_cold_miss_waits_for_the_request_holding_the_lock(self):
+        self.client.get(self.url)
+        key = pagecache.page_key(RequestFactory().get(self.url))
+        entry = cache.get(key)
+        cache.delete(key)
+        cache.add(key + ':lock', 1)
+        # Пока этот запрос ждёт, рендеринг другого запроса кладёт копию в кеш
+        with mock.patch.object(pagecache.time, 'sleep', lambda seconds: cache.set(key, entry)):
+            with self.assertNumQueries(0):
+                response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Борщ')
+
+    @override_settings(PAGE_CACHE_WAIT=0)
+    def test_cold_miss_renders_itself_when_wait_runs_out(self):
+        key = pagecache.page_key(RequestFactory().get(self.url))
+        cache.add(key + ':lock', 1)
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        # Чужая блокировка не снимается
+        self.assertIsNotNone(cache.get(key + ':lock'))
+
+    def test_review_submit_invalidates_recipe_page(self):
+        self.client.get(self.url)
+        reader = User.objects.create_user(email='reader@test.ru')
+        with self.captureOnCommitCallbacks(execute=True):
+            reviews.submit(self.recipe.pk, reader, 5, '')
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+
+
+class HomeFeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(email='author@test.ru', full_name='Автор')
+        self.soups = Genre.objects.create(name='Супы')
+        self.old, self.new, self.draft = [
+            Recipe.objects.create(user=author, title=title, status=status)
+            for title, status in [('Борщ', 'published'), ('Щи', 'published'), ('Черновик', 'draft')]
+        ]
+        self.old.genres.add(self.soups)
+        Recipe.objects.filter(pk=self.old.pk).update(rating_count=3, rating_sum=14)
+        Recipe.objects.filter(pk=self.new.pk).update(rating_count=4, rating_sum=12)
+        for i in range(2):
+            Favorite.objects.create(user=User.objects.create_user(email=f'fan{i}@test.ru'), recipe=self.new)
+
+    def items(self, key):
+        return [item['id'] for item in HomeSection.objects.get(key=key).items]
+
+    def test_build_stores_sections(self):
+        self.assertEqual(homefeed.build(), 4)
+        self.assertEqual(self.items('latest'), [self.new.pk, self.old.pk])
+        self.assertEqual(self.items('top_rated'), [self.old.pk, self.new.pk])
+        self.assertEqual(self.items('most_favorited'), [self.new.pk])
+        self.assertEqual(self.items(f'genre:{self.soups.pk}'), [self.old.pk])
+        self.assertEqual(HomeSection.objects.get(key='top_rated').items[0]['rating'], 4.7)
+
+    def test_index_renders_without_aggregates(self):
+        homefeed.build()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Лучшие по оценкам')
+        self.assertContains(response, reverse('recipe_detail', args=[self.old.pk]))
+        self.assertNotContains(response, 'Черновик')
+
+    def test_publish_schedules_rebuild_once(self):
+        admin = User.objects.create_superuser(email='admin@test.ru')
+        pending = [Recipe.objects.create(user=admin, title=f'Рецепт {i}', status='pending') for i in range(2)]
+        for recipe in pending:
+            with self.captureOnCommitCallbacks(execute=True):
+                moderation.moderate([recipe.pk], admin, approve=True)
+        self.assertEqual(Task.objects.filter(name='homefeed.build', status='queued').count(), 1)
+        tasks.run_pending()
+        self.assertEqual(self.items('latest')[:2], [pending[1].pk, pending[0].pk])
+
+
+class SitemapFeedTests(TestCase):
+
+    ATOM = '{http://www.w3.org/2005/Atom}'
+    SITEMAP = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(email='author@test.ru', full_name='Автор & Ко')
+        self.recipes = [
+            Recipe.objects.create(user=author, title=f'Рецепт <{i}>', status='published', moderated_at=timezone.now())
+            for i in range(3)
+        ]
+        self.draft = Recipe.objects.create(user=author, title='Черновик', status='draft')
+
+    def xml(self, name, *args, **headers):
+        response = self.client.get(reverse(name, args=args), headers=headers)
+        return response, ElementTree.fromstring(b''.join(response.streaming_content))
+
+    def test_sitemap_is_sharded_by_id_range(self):
+        first = self.recipes[0].pk
+        with mock.patch.object(feeds, 'SHARD_SIZE', 2):
+            _, index = self.xml('sitemap_index')
+            shards = sorted({pk // 2 for pk in (r.pk for r in self.recipes)})
+            self.assertEqual(
+                [loc.text for loc in index.iter(f'{self.SITEMAP}loc')],
+                ['http://testserver' + reverse('sitemap_shard', args=[n]) for n in shards],
+            )
+            _, urlset = self.xml('sitemap_shard', first // 2)
+        locs = [loc.text for loc in urlset.iter(f'{self.SITEMAP}loc')]
+        self.assertIn('http://testserver' + reverse('recipe_detail', args=[first]), locs)
+        self.assertNotIn('http://testserver' + reverse('recipe_detail', args=[self.draft.pk]), locs)
+
+    def test_empty_or_out_of_range_shard_is_not_found(self):
+        with mock.patch.object(feeds, 'SHARD_SIZE', 2):
+            self.assertEqual(self.client.get(reverse('sitemap_shard', args=[10_000])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('sitemap_shard', args=[1])).status_code, 404)
+
+    def test_recipes_published_before_moderated_at_are_backfilled_into_feed(self):
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(moderated_at=None)
+        backfill = import_module('recept.migrations.0021_backfill_moderated_at')
+        backfill.fill_moderated_at(django_apps, None)
+        self.assertEqual(Recipe.objects.get(pk=self.recipes[0].pk).moderated_at, self.recipes[0].updated_at)
+        self.assertIsNone(Recipe.objects.get(pk=self.draft.pk).moderated_at)
+        _, feed = self.xml('recipe_feed')
+        self.assertEqual(len(list(feed.iter(f'{self.ATOM}entry'))), 3)
+
+    def test_feed_lists_newest_published_first(self):
+        response, feed = self.xml('recipe_feed')
+        self.assertEqual(response['Content-Type'], 'application/atom+xml; charset=utf-8')
+        titles = [entry.find(f'{self.ATOM}title').text for entry in feed.iter(f'{self.ATOM}entry')]
+        self.assertEqual(titles, ['Рецепт <2>', 'Рецепт <1>', 'Рецепт <0>'])
+        self.assertEqual(feed.find(f'{self.ATOM}entry/{self.ATOM}author/{self.ATOM}name').text, 'Автор & Ко')
+
+    def test_conditional_get_until_catalogue_changes(self):
+        etag = self.client.get(reverse('sitemap_index'))['ETag']
+        # Только чтение версии каталога
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('sitemap_index'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        search.bump_version()
+        self.assertEqual(self.client.get(reverse('sitemap_index'), headers={'If-None-Match': etag}).status_code, 200)
+
+
+class ProfileCountersTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(email='author@test.ru')
+        self.reader = User.objects.create_user(email='reader@test.ru')
+        self.moderator = User.objects.create_superuser(email='moderator@test.ru')
+        self.draft = Recipe.objects.create(user=self.author, title='Черновик', status='draft')
+        self.pending = Recipe.objects.create(user=self.author, title='Суп', status='pending')
+
+    def counters(self, user):
+        return User.objects.filter(pk=user.pk).values_list(*profiles.COUNTERS).get()
+
+    def test_counters_follow_writes_and_match_recount(self):
+        moderation.moderate([self.pending.pk], self.moderator, approve=True)
+        self.client.force_login(self.reader)
+        self.client.post(reverse('toggle_favorite', args=[self.pending.pk]))
+        self.client.post(reverse('toggle_favorite', args=[self.draft.pk]))
+        self.client.post(reverse('toggle_favorite', args=[self.draft.pk]))
+        reviews.submit(self.pending.pk, self.reader, 5, '')
+        reviews.submit(self.pending.pk, self.reader, 4, '')
+        self.assertEqual(self.counters(self.author), (1, 1, 0, 0))
+        self.assertEqual(self.counters(self.reader), (0, 0, 1, 1))
+
+        deletion.schedule_recipe(self.pending)
+        self.assertEqual(self.counters(self.author), (0, 1, 0, 0))
+        self.assertEqual(self.counters(self.reader), (0, 0, 0, 0))
+
+        expected = [self.counters(user) for user in (self.author, self.reader)]
+        profiles.recount_all()
+        self.assertEqual([self.counters(user) for user in (self.author, self.reader)], expected)
+
+    def test_recipe_save_recounts_only_on_counted_fields(self):
+        recipe = Recipe.objects.get(pk=self.draft.pk)
+        recipe.title = 'Новое название'
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save()
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith('UPDATE "recept_user"')])
+
+        recipe.user = self.reader
+        recipe.save()
+        # У автора остаётся рецепт на модерации
+        self.assertEqual(self.counters(self.author), (0, 1, 0, 0))
+        self.assertEqual(self.counters(self.reader), (0, 1, 0, 0))
+
+    def test_profile_header_needs_no_count(self):
+        self.client.force_login(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile'))
+        self.assertContains(response, 'Не опубликовано')
+        self.assertFalse([q['sql'] for q in queries if 'COUNT(' in q['sql']])
+
+    def test_pending_and_rejected_recipes_stay_counted(self):
+        self.assertEqual(self.counters(self.author), (0, 2, 0, 0))
+        self.assertEqual(moderation.moderate([self.pending.pk], self.moderator, approve=False, notes='Нет фото'), [self.pending.pk])
+        self.assertEqual(self.counters(self.author), (0, 2, 0, 0))
+        expected = self.counters(self.author)
+        profiles.recount_all()
+        self.assertEqual(self.counters(self.author), expected)
+
+    def test_favorites_keyset_pages_cover_all(self):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(user=self.author, title=f'Рецепт {i}', status='published') for i in range(profiles.PAGE_SIZE + 5)
+        ])
+        Favorite.objects.bulk_create([Favorite(user=self.reader, recipe=recipe) for recipe in recipes])
+        self.client.force_login(self.reader)
+        first = self.client.get(reverse('favorite_recipes'))
+        self.assertEqual(len(first.context['recipes']), profiles.PAGE_SIZE)
+        second = self.client.get(reverse('favorite_recipes'), {'after': first.context['next_cursor']})
+        self.assertIsNone(second.context['next_cursor'])
+        ids = [r.pk for r in first.context['recipes']] + [r.pk for r in second.context['recipes']]
+        self.assertEqual(sorted(ids), sorted(r.pk for r in recipes))
+
+    def test_public_profile_pages_published_recipes(self):
+        Recipe.objects.bulk_create([
+            Recipe(user=self.author, title=f'Рецепт {i}', status='published') for i in range(profiles.PAGE_SIZE + 1)
+        ])
+        url = reverse('user_profile', args=[self.author.pk])
+        first = self.client.get(url)
+        self.assertEqual(len(first.context['recipes']), profiles.PAGE_SIZE)
+        second = self.client.get(url, {'after': first.context['next_cursor']})
+        self.assertEqual(len(second.context['recipes']), 1)
+        self.assertNotIn(self.draft, first.context['recipes'] + second.context['recipes'])
+
+
+class WarmupTests(TestCase):
+
+    def test_offline_steps_cover_templates_and_routes(self):
+        results = warmup.run(database=False)
+        self.assertNotIn('caches', results)
+        self.assertEqual(results['templates'][0], len(warmup.template_names()))
+        self.assertIn('recipes/recipe_edit.html', warmup.template_names())
+        named = [p for p in recept_urls.urlpatterns if isinstance(p, URLPattern) and p.name]
+        self.assertEqual(results['urls'][0], len(named))
+
+    def test_caches_step_primes_catalogue_and_home(self):
+        cache.clear()
+        search.results.clear()
+        author = User.objects.create_user(email='author@test.ru')
+        recipe = Recipe.objects.create(user=author, title='Суп', status='published')
+        warmup.warm_caches()
+        self.assertEqual(list(search.results.get((search.catalogue_version(), '', None))), [recipe.pk])
+        self.assertTrue(HomeSection.objects.filter(key='latest').exists())
+
+    def test_command_reports_steps(self):
+        out = StringIO()
+        call_command('warmup', stdout=out)
+        self.assertIn('templates', out.getvalue())
+        self.assertNotIn('caches', out.getvalue())
+
+    def test_gunicorn_worker_hook_primes_worker_caches(self):
+        search.results.clear()
+        config = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        warm_templates = mock.Mock(return_value=0)
+        with self.settings(WARMUP_ON_START=True), mock.patch.dict(warmup.OFFLINE_STEPS, templates=warm_templates):
+            config['post_worker_init'](worker=None)
+        self.assertTrue(search.results.entries)
+        # Шаги без базы воркер не повторяет: они выполнены в мастере до fork
+        warm_templates.assert_not_called()
+
+
+class NutritionTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(email='author@test.ru')
+        self.flour = ListIngredient.objects.create(name='Мука', calories=Decimal('364'), price=Decimal('60'))
+        self.eggs = ListIngredient.objects.create(
+            name='Яйца', calories=Decimal('157'), price=Decimal('200'), piece_weight=Decimal('50'),
+        )
+        # Плотность молока берётся из таблицы portions.DEFAULT_DENSITIES
+        self.milk = ListIngredient.objects.create(name='Молоко', calories=Decimal('52'), price=Decimal('90'))
+        self.recipe = self.make_recipe('Блины', status='published')
+        snapshots.rebuild([self.recipe.pk])
+
+    def make_recipe(self, title, **kwargs):
+        recipe = Recipe.objects.create(user=self.author, title=title, portions=2, calories=1, estimated_cost=Decimal('1'), **kwargs)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=self.flour, quantity=Decimal('0.50'), unit='kg'),
+            RecipeIngredient(recipe=recipe, ingredient=self.eggs, quantity=Decimal('2'), unit='pcs'),
+            RecipeIngredient(recipe=recipe, ingredient=self.milk, quantity=Decimal('1'), unit='cup'),
+        ])
+        return recipe
+
+    def test_recompute_derives_calories_per_portion_and_cost(self):
+        # 500 г муки + 100 г яиц + 257.5 г молока = 2110.9 ккал на 2 порции; 30 + 20 + 23.175 руб.
+        self.assertEqual(nutrition.recompute([self.recipe.pk]), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.calories, self.recipe.estimated_cost), (1055, Decimal('73.18')))
+        data = snapshots.fetch(self.recipe.pk)[0]
+        self.assertEqual((data['calories'], data['estimated_cost']), (1055, '73.18'))
+        # Повторный пересчёт ничего не меняет
+        self.assertEqual(nutrition.recompute([self.recipe.pk]), 0)
+
+    def test_missing_data_keeps_author_value(self):
+        ListIngredient.objects.filter(pk=self.eggs.pk).update(price=None)
+        nutrition.recompute([self.recipe.pk])
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.calories, self.recipe.estimated_cost), (1055, Decimal('1.00')))
+
+    def test_recompute_of_published_recipe_refreshes_catalogue_and_home(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            nutrition.recompute([self.recipe.pk])
+        self.assertTrue(all(pagecache.versions(['catalogue', 'home']).values()))
+        self.assertTrue(Task.objects.filter(name='homefeed.build', status='queued').exists())
+
+    def test_recipe_deleted_during_run_is_skipped(self):
+        gone = self.make_recipe('Удалённый')
+        Recipe.objects.filter(pk=gone.pk).update(deleted_at=timezone.now())
+        self.assertEqual(nutrition.recompute_batch([self.recipe.pk, gone.pk]), 1)
+
+    def test_batch_query_count_does_not_depend_on_recipes(self):
+        for i in range(40):
+            self.make_recipe(f'Рецепт {i}')
+        # id рецептов, текущие значения, ингредиенты, UPDATE рецептов, чтение и UPDATE снимков + точка сохранения
+        with self.assertNumQueries(8):
+            self.assertEqual(nutrition.recompute(), 41)
+
+    def test_import_updates_prices_and_recomputes_recipes(self):
+        nutrition.recompute()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as f:
+            f.write('name,price,calories\nмука,80,\nСоль,10,0\n')
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_ingredients', f.name, '--create', stdout=out)
+        self.assertIn('Обновлено: 1, создано: 1', out.getvalue())
+        self.flour.refresh_from_db()
+        # Пустая ячейка калорийности не стирает значение
+        self.assertEqual((self.flour.price, self.flour.calories), (Decimal('80.00'), Decimal('364.00')))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.estimated_cost, Decimal('83.18'))
+
+    def test_import_rejects_invalid_file_without_changes(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as f:
+            f.write('name,price\nМука,80\nЯйца,дорого\n')
+        self.addCleanup(os.remove, f.name)
+        with self.assertRaisesMessage(CommandError, 'строка 3'):
+            call_command('import_ingredients', f.name, stdout=StringIO())
+        self.flour.refresh_from_db()
+        self.assertEqual(self.flour.price, Decimal('60.00'))
+
+    def test_import_rejects_nan_and_infinity(self):
+        for value in ('NaN', 'sNaN', 'Infinity'):
+            with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as f:
+                f.write(f'name,price\nМука,{value}\n')
+            self.addCleanup(os.remove, f.name)
+            with self.assertRaisesMessage(CommandError, 'не число'):
+                call_command('import_ingredients', f.name, stdout=StringIO())
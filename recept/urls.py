@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, events, feeds, views
 from django.conf import settings
 from django.conf.urls.static import static
 from .views import signup_view, login_view, profile_view, admin_profile_view, logout_view, profile_edit_view, recipe_detail_view,toggle_favorite, user_profile_view
@@ -21,6 +21,7 @@ urlpatterns = [
     path('favorite/toggle/<int:recipe_id>/', views.toggle_favorite, name='toggle_favorite'), 
     path('recipes/', views.recipe_list_view, name='recipe_list'), 
     path('favorites/', views.favorite_recipes_view, name='favorite_recipes'),
+    path('favorites/shopping-list/', views.shopping_list_view, name='shopping_list'),
     # админка
     path('admin-profile/', views.admin_profile_view, name='admin_profile'),
     path('admin-users/', views.admin_users_list_view, name='admin_users_list'),
@@ -31,8 +32,25 @@ urlpatterns = [
     path('admin/users/<int:pk>/edit/', views.admin_user_edit_view, name='admin_user_edit'),
     path('admin/users/<int:pk>/delete/', views.admin_user_delete_view, name='admin_user_delete'),
     path('admin-moderation/', views.admin_moderation_list_view, name='admin_moderation_list'),
+    path('admin-moderation/claim/', views.admin_moderation_claim_view, name='admin_moderation_claim'),
+    path('admin-moderation/bulk/', views.admin_bulk_moderation_view, name='admin_bulk_moderation'),
     path('admin-moderation/<int:pk>/approve/', views.admin_approve_recipe_view, name='admin_approve_recipe'),
     path('admin-moderation/<int:pk>/reject/', views.admin_reject_recipe_view, name='admin_reject_recipe'),
+    path('admin-slow-queries/', views.admin_slow_queries_view, name='admin_slow_queries'),
+    # уведомления (Server-Sent Events)
+    path('events/', events.events_view, name='events'),
+    # карта сайта и лента для поисковых систем
+    path('sitemap.xml', feeds.sitemap_index, name='sitemap_index'),
+    path('sitemap-<int:shard>.xml', feeds.sitemap_shard, name='sitemap_shard'),
+    path('feed.atom', feeds.recipe_feed, name='recipe_feed'),
+    # метрики
+    path('metrics/', views.metrics_view, name='metrics'),
+    # API только для чтения
+    path('api/v1/recipes/', api.recipe_list, name='api_recipe_list'),
+    path('api/v1/recipes/<int:pk>/', api.recipe_detail, name='api_recipe_detail'),
+    path('api/v1/recipes/<int:pk>/reviews/', api.recipe_reviews, name='api_recipe_reviews'),
+    path('api/v1/genres/', api.genre_list, name='api_genre_list'),
+    path('api/v1/users/<int:pk>/', api.user_detail, name='api_user_detail'),
 
 ]
 
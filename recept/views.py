@@ -2,19 +2,28 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required, user_passes_test
 from .forms import UserRegistrationForm, UserLoginForm, UserProfileForm, RecipeForm, RecipeStepFormSet, RecipeIngredientForm, RecipeStepForm, ReviewForm 
+from .forms import RecipeIngredientEditFormSet, RecipeIngredientFormSet, RecipeStepEditFormSet
 from .models import User, RecipeIngredient, RecipeStep, ListIngredient, Recipe, Genre, Favorite,Review 
+from .models import HomeSection, SlowQuery, Task
+from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404
-from django.forms import formset_factory, modelformset_factory
 from django import forms
 from django.contrib import messages
 from django.db.models import Count, Q, Prefetch
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse, HttpResponseForbidden
 from django.views.decorators.http import require_POST
-from .forms import AdminUserEditForm 
+from django.conf import settings
+from .forms import AdminUserEditForm, AdminUserFilterForm
+from . import deletion, metrics, moderation, nutrition, pagecache, portions, profiles, reviews, search, shopping, snapshots, stats, tasks
+from django.utils import timezone
 
+RECIPES_PER_PAGE = 24
 
+
+@pagecache.cache_page('home')
 def index(request):
-    return render(request, 'index.html')
+    # Блоки собраны заранее (см. recept/homefeed.py): один запрос без агрегатов
+    return render(request, 'index.html', {'sections': HomeSection.objects.all()})
 
 
 
@@ -68,10 +77,12 @@ def profile_view(request):
     if request.user.is_superuser:
         return redirect('admin_profile')
     
-    user_recipes = request.user.recipes.all().order_by('-created_at')
+    recipes, next_cursor = profiles.recipes_page(request.user.recipes.all(), request.GET.get('after'))
 
     context = {
-        'recipes': user_recipes
+        'recipes': recipes,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('after'),
     }
     return render(request, 'profile.html', context)
 
@@ -95,11 +106,13 @@ def profile_edit_view(request):
                 user.avatar.delete(save=False)  
                 user.avatar = None
                 user.save()
+                snapshots.rebuild_for_author(user)
             return redirect('profile_edit')
 
         form = UserProfileForm(request.POST, request.FILES, instance=user)
         if form.is_valid():
             form.save()
+            snapshots.rebuild_for_author(user)
             return redirect('profile')
     else:
         form = UserProfileForm(instance=user)
@@ -109,14 +122,6 @@ def profile_edit_view(request):
 
 @login_required
 def recipe_create_view(request):
-    IngredientFormSet = formset_factory(RecipeIngredientForm, extra=1, can_delete=True)
-    RecipeStepFormSet_initial = modelformset_factory(
-        RecipeStep, 
-        form=RecipeStepForm, 
-        extra=1, 
-        can_delete=True
-    )
-
     if request.method == 'POST':
         submit_status = request.POST.get('submit_status', 'draft') 
 
@@ -124,8 +129,8 @@ def recipe_create_view(request):
         form.data = form.data.copy()
         form.data['status_field'] = submit_status
         
-        step_formset = RecipeStepFormSet_initial(request.POST, request.FILES, queryset=RecipeStep.objects.none())
-        ingredient_formset = IngredientFormSet(request.POST, prefix='ingr')
+        step_formset = RecipeStepFormSet(request.POST, request.FILES, queryset=RecipeStep.objects.none())
+        ingredient_formset = RecipeIngredientFormSet(request.POST, prefix='ingr')
 
         is_valid = form.is_valid() and step_formset.is_valid() and ingredient_formset.is_valid()
 
@@ -171,6 +176,9 @@ def recipe_create_view(request):
                         quantity=ingr_form.cleaned_data['quantity'],
                         unit=ingr_form.cleaned_data['unit'],
                     )
+
+            # Калорийность и стоимость по справочнику ингредиентов, если в нём есть данные
+            nutrition.recompute([recipe.pk])
             
             status_display = "отправлен на модерацию" if recipe.status == 'pending' else "сохранен как черновик"
             messages.success(request, f'Рецепт успешно {status_display}!')
@@ -181,8 +189,8 @@ def recipe_create_view(request):
 
     else:
         form = RecipeForm()
-        step_formset = RecipeStepFormSet_initial(queryset=RecipeStep.objects.none()) 
-        ingredient_formset = IngredientFormSet(prefix='ingr')
+        step_formset = RecipeStepFormSet(queryset=RecipeStep.objects.none()) 
+        ingredient_formset = RecipeIngredientFormSet(prefix='ingr')
         
     context = {
         'form': form,
@@ -200,14 +208,6 @@ def recipe_edit_view(request, pk):
         messages.warning(request, 'Рецепт находится на модерации. Дождитесь решения администратора.')
         return redirect('profile')
 
-    IngredientFormSet = formset_factory(RecipeIngredientForm, extra=0, can_delete=True)
-    RecipeStepFormSet_Model = modelformset_factory(
-        RecipeStep, 
-        form=RecipeStepForm, 
-        extra=0, 
-        can_delete=True,
-    )
-
     if request.method == 'POST':
         submit_status = request.POST.get('submit_status', 'draft') 
 
@@ -215,8 +215,8 @@ def recipe_edit_view(request, pk):
         form.data = form.data.copy()
         form.data['status_field'] = submit_status
         
-        step_formset = RecipeStepFormSet_Model(request.POST, request.FILES, queryset=recipe.steps.all())
-        ingredient_formset = IngredientFormSet(request.POST, prefix='ingr')
+        step_formset = RecipeStepEditFormSet(request.POST, request.FILES, queryset=recipe.steps.all())
+        ingredient_formset = RecipeIngredientEditFormSet(request.POST, prefix='ingr')
 
         is_valid = form.is_valid() and step_formset.is_valid() and ingredient_formset.is_valid()
 
@@ -260,6 +260,11 @@ def recipe_edit_view(request, pk):
                         unit=ingr_form.cleaned_data['unit'],
                     )
                      
+            nutrition.recompute([recipe.pk])
+            # Отредактированный рецепт снят с публикации: снимок удаляется
+            snapshots.rebuild([recipe.pk])
+            search.catalogue_changed()
+
             status_display = "отправлен на модерацию" if submit_status == 'pending' else "обновлен как черновик"
             messages.success(request, f'Рецепт успешно {status_display}!')
             return redirect('profile') 
@@ -269,11 +274,11 @@ def recipe_edit_view(request, pk):
 
     else:
         form = RecipeForm(instance=recipe, initial={'status_field': recipe.status}) 
-        step_formset = RecipeStepFormSet_Model(queryset=recipe.steps.all())
+        step_formset = RecipeStepEditFormSet(queryset=recipe.steps.all())
         
         initial_ingredients = [{'ingredient_name': ri.ingredient.name, 'quantity': ri.quantity, 'unit': ri.unit}
-                                for ri in recipe.recipe_ingredients.all()]
-        ingredient_formset = IngredientFormSet(prefix='ingr', initial=initial_ingredients)
+                                for ri in recipe.recipe_ingredients.select_related('ingredient')]
+        ingredient_formset = RecipeIngredientEditFormSet(prefix='ingr', initial=initial_ingredients)
 
     context = {
         'form': form,
@@ -293,7 +298,8 @@ def recipe_edit_view(request, pk):
 def recipe_delete_view(request, pk):
     recipe = get_object_or_404(Recipe, pk=pk, user=request.user)
     recipe_title = recipe.title
-    recipe.delete()
+    # Рецепт сразу скрывается, шаги, отзывы и файлы удаляет фоновая задача
+    deletion.schedule_recipe(recipe)
     messages.success(request, f'Рецепт "{recipe_title}" успешно удален.')
     return redirect('profile')
 
@@ -355,45 +361,46 @@ def recipe_detail_view(request, pk):
     return render(request, 'recipes/recipe_detail.html', context)
 
 
+@pagecache.cache_page('user:{user_id}')
 def user_profile_view(request, user_id):
-    user_to_show = get_object_or_404(User, pk=user_id)
-    user_recipes = user_to_show.recipes.filter(status='published').order_by('-created_at')
+    user_to_show = get_object_or_404(User, pk=user_id, deleted_at__isnull=True)
+    recipes, next_cursor = profiles.recipes_page(user_to_show.recipes.filter(status='published'), request.GET.get('after'))
     context = {
         'profile_user': user_to_show,
-        'recipes': user_recipes,
+        'recipes': recipes,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('after'),
     }
     return render(request, 'users/profile.html', context)
 
 
 
+@pagecache.cache_page('catalogue')
 def recipe_list_view(request):
-    recipes = Recipe.objects.filter(status='published').select_related('user').prefetch_related('genres').order_by('-created_at')
-    all_genres = Genre.objects.annotate(
+    all_genres = list(Genre.objects.annotate(
         published_recipe_count=Count(
             'recipes', 
             filter=Q(recipes__status='published')
         )
-    ).order_by('name')
+    ).order_by('name'))
 
-    selected_genre_id = request.GET.get('genre')
-    selected_genre_name = None
-    
-    if selected_genre_id:
-        try:
-            recipes = recipes.filter(genres__id=selected_genre_id)
-            selected_genre_name = Genre.objects.get(id=selected_genre_id).name
-        except Genre.DoesNotExist:
-            pass 
-            
+    selected_genre_id = search.parse_genre(request.GET.get('genre'))
+    selected_genre_name = next((g.name for g in all_genres if g.pk == selected_genre_id), None)
+    if selected_genre_name is None:
+        selected_genre_id = None
+
+    # Список id берётся из кеша поиска (см. recept/search.py), из базы - только рецепты страницы
     search_query = request.GET.get('q')
-    if search_query:
-        recipes = recipes.filter(
-            Q(title__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        ).distinct()
+    page = Paginator(search.recipe_ids(search_query, selected_genre_id), RECIPES_PER_PAGE).get_page(request.GET.get('page'))
+    # Список id мог устареть: снятые с публикации и удалённые рецепты отсеиваются здесь
+    recipes = search.in_order(Recipe.objects.filter(status='published').select_related('user'), page.object_list)
 
+    query = request.GET.copy()
+    query.pop('page', None)
     context = {
         'recipes': recipes,
+        'page': page,
+        'querystring': query.urlencode(),
         'all_genres': all_genres,
         'selected_genre_id': selected_genre_id,
         'selected_genre_name': selected_genre_name,
@@ -414,12 +421,16 @@ def toggle_favorite(request, recipe_id):
     try:
         favorite = Favorite.objects.get(user=user, recipe=recipe)
         favorite.delete() 
+        profiles.adjust(user.pk, favorite_recipes_count=-1)
         is_favorited = False
+        metrics.favorites_toggled.inc(action='removed')
         message = f'Рецепт "{recipe.title}" удален из избранного.'
         
     except Favorite.DoesNotExist:
         Favorite.objects.create(user=user, recipe=recipe)
+        profiles.adjust(user.pk, favorite_recipes_count=1)
         is_favorited = True
+        metrics.favorites_toggled.inc(action='added')
         message = f'Рецепт "{recipe.title}" добавлен в избранное.'
         
     return JsonResponse({
@@ -429,63 +440,142 @@ def toggle_favorite(request, recipe_id):
         'recipe_id': recipe_id,
     })
 
+@pagecache.cache_page('recipe:{pk}', 'ingredients')
 def recipe_detail_view(request, pk):
-    recipe = get_object_or_404(
-        Recipe.objects.select_related('user').prefetch_related('genres', 'recipe_ingredients__ingredient', 'steps'), 
-        pk=pk
-    )
-    
+    # Опубликованный рецепт читается из снимка одним запросом; черновики и рецепты
+    # на модерации собираются из нормализованных таблиц в тот же формат
+    found = snapshots.fetch(pk)
+    if found:
+        recipe, reviews_count = found
+    else:
+        instance = get_object_or_404(snapshots.source().annotate(reviews_count=snapshots.reviews_count()), pk=pk)
+        recipe, reviews_count = snapshots.document(instance), instance.reviews_count
+    # Имя и аватар автора в документе: страница устаревает и при правке профиля
+    pagecache.add_tags(request, f'user:{recipe["author_id"]}')
+
     is_favorited = False
     if request.user.is_authenticated:
-        is_favorited = Favorite.objects.filter(user=request.user, recipe=recipe).exists()
+        is_favorited = Favorite.objects.filter(user=request.user, recipe_id=pk).exists()
 
-    ingredients = recipe.recipe_ingredients.all()
-    steps = recipe.steps.all().order_by('order')
+    portions_count = portions.parse_portions(request.GET.get('portions'), recipe['portions'] or 1)
+    unit_system = portions.parse_system(request.GET.get('units'))
 
     context = {
         'recipe': recipe,
-        'ingredients': ingredients,
-        'steps': steps,
+        'reviews_count': reviews_count,
+        'ingredients': portions.scaled_ingredients(recipe, portions_count, unit_system),
+        'portions_count': portions_count,
+        'unit_system': unit_system,
+        'unit_systems': portions.SYSTEMS,
+        'steps': recipe['steps'],
         'is_favorited': is_favorited, 
+        'is_owner': request.user.is_authenticated and request.user.pk == recipe['author_id'],
+        'is_admin': request.user.is_superuser,
     }
     return render(request, 'recipes/recipe_detail.html', context)
 
 @login_required
 def favorite_recipes_view(request):
 
-    favorite_list = Favorite.objects.filter(user=request.user).select_related('recipe', 'recipe__user').order_by('-added_at')
-    
-    recipes = [fav.recipe for fav in favorite_list]
+    recipes, next_cursor = profiles.favorites_page(request.user, request.GET.get('after'))
 
     context = {
         'recipes': recipes,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('after'),
         'title': 'Избранные рецепты'
     }
     return render(request, 'recipes/favorite_recipes.html', context)
 
 
+@login_required
+def shopping_list_view(request):
+    # Список покупок по избранным рецептам: ?recipe=<id> (по умолчанию все), ?portions_<id>=N, ?units=metric|mass
+    favorites = [
+        fav.recipe for fav in
+        Favorite.objects.filter(user=request.user, recipe__deleted_at__isnull=True)
+        .select_related('recipe').only('recipe__id', 'recipe__title', 'recipe__portions').order_by('-added_at')
+    ]
+    selected = {int(pk) for pk in request.GET.getlist('recipe') if pk.isdigit()}
+    for recipe in favorites:
+        recipe.wanted = portions.parse_portions(request.GET.get(f'portions_{recipe.pk}'), recipe.portions or 1)
+        recipe.selected = not selected or recipe.pk in selected
+    targets = {r.pk: (r.portions, r.wanted) for r in favorites if r.selected}
+
+    system = shopping.parse_system(request.GET.get('units'))
+    items = shopping.build(targets, system)
+
+    export = request.GET.get('export')
+    if export == 'csv':
+        response = HttpResponse(shopping.to_csv(items), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="shopping-list.csv"'
+        return response
+    if export == 'txt':
+        response = HttpResponse(shopping.to_text(items), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="shopping-list.txt"'
+        return response
+
+    query = request.GET.copy()
+    query.pop('export', None)
+    context = {
+        'favorites': favorites,
+        'items': items,
+        'unit_system': system,
+        'unit_systems': shopping.SYSTEMS,
+        'query': query.urlencode(),
+        'title': 'Список покупок',
+    }
+    return render(request, 'recipes/shopping_list.html', context)
+
+
 # админка:
 
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
 def admin_profile_view(request):
-    total_users = User.objects.count()
-    total_published_recipes = Recipe.objects.filter(status='published').count()
-    total_pending_recipes = Recipe.objects.filter(status='pending').count() 
+    # Итоги и тренды берутся из предрасчитанных корзин StatBucket (задача stats.rollup)
+    totals = stats.latest_totals()
+    if not totals:
+        tasks.enqueue_once('stats.rollup')
 
-    context = {
-        'total_users': total_users,
-        'total_published_recipes': total_published_recipes,
-        'total_pending_recipes': total_pending_recipes, \
+    series = stats.daily_series(days=14)
+    peak = {metric: max([values[metric] for _, values in series] + [1]) for metric in stats.METRIC_LABELS}
+    trend_rows = [
+        (label, [(day, values[metric], int(100 * values[metric] / peak[metric])) for day, values in series])
+        for metric, label in stats.METRIC_LABELS.items()
+    ]
 
+    def total(metric):
+        return totals.get(metric, (0, None))[0]
+
+    context = {
+        'total_users': total('users_total'),
+        'total_published_recipes': total('recipes_published_total'),
+        'total_pending_recipes': total('recipes_pending_total'),
+        'stats_updated_at': max((updated for _, updated in totals.values()), default=None),
+        'trend_days': [day for day, _ in series],
+        'trend_rows': trend_rows,
+        'deletion_tasks': Task.objects.filter(name__startswith='deletion.').order_by('-created_at')[:10],
     }
     return render(request, 'admin/admin_profile.html', context)
 
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
 def admin_users_list_view(request):
-    users = User.objects.all().order_by('email')
-    context = {'users': users}
+    filter_form = AdminUserFilterForm(request.GET)
+    users = filter_form.filter(User.objects.with_activity_counts().filter(deleted_at__isnull=True)).order_by('email')
+
+    paginator = Paginator(users, 50)
+    page = paginator.get_page(request.GET.get('page'))
+
+    query = request.GET.copy()
+    query.pop('page', None)
+    context = {
+        'users': page.object_list,
+        'page': page,
+        'filter_form': filter_form,
+        'querystring': query.urlencode(),
+    }
     return render(request, 'admin/users_list.html', context)
 
 @login_required
@@ -514,6 +604,8 @@ def admin_edit_recipe_genres(request, pk):
         form = RecipeGenreForm(request.POST, instance=recipe)
         if form.is_valid():
             form.save()
+            snapshots.rebuild([recipe.pk])
+            search.catalogue_changed()
             messages.success(request, 'Жанры успешно обновлены.')
             return redirect('admin_recipes_list')
     else:
@@ -552,21 +644,59 @@ def admin_add_genre(request):
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
 def admin_moderation_list_view(request):
-    recipes = Recipe.objects.filter(status='pending').select_related('user').prefetch_related('genres').order_by('-created_at')
-    context = {'recipes': recipes}
+    now = timezone.now()
+    my_batch = (
+        Recipe.objects.filter(status='pending', claimed_by=request.user, claimed_until__gte=now)
+        .select_related('user').prefetch_related('genres').order_by('created_at', 'pk')
+    )
+    recipes, next_cursor = moderation.queue_page(request.GET.get('after'))
+    context = {
+        'my_batch': my_batch,
+        'recipes': recipes,
+        'next_cursor': next_cursor,
+        'pending_total': Recipe.objects.filter(status='pending').count(),
+        'now': now,
+    }
     return render(request, 'admin/moderation_list.html', context) 
 
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
+@require_POST
+def admin_moderation_claim_view(request):
+    if 'release' in request.POST:
+        released = moderation.release_claims(request.user)
+        messages.info(request, f'Возвращено в очередь: {released}.')
+    else:
+        batch = moderation.claim_batch(request.user)
+        messages.success(request, f'Вам выдано рецептов на проверку: {len(batch)}.')
+    return redirect('admin_moderation_list')
+
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
+@require_POST
+def admin_bulk_moderation_view(request):
+    ids = [int(pk) for pk in request.POST.getlist('recipe_ids') if pk.isdigit()]
+    action = request.POST.get('action')
+    if not ids or action not in ('approve', 'reject'):
+        messages.warning(request, 'Выберите рецепты и действие.')
+        return redirect('admin_moderation_list')
+
+    updated = moderation.moderate(ids, request.user, approve=action == 'approve', notes=request.POST.get('moderation_notes'))
+    skipped = len(ids) - len(updated)
+    verb = 'одобрено' if action == 'approve' else 'отклонено'
+    messages.success(request, f'Рецептов {verb}: {len(updated)}.')
+    if skipped:
+        messages.warning(request, f'Пропущено {skipped}: уже проверены или взяты другим модератором.')
+    return redirect('admin_moderation_list')
+
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
 @require_POST
 def admin_approve_recipe_view(request, pk):
-    recipe = get_object_or_404(Recipe, pk=pk)
-    if recipe.status != 'pending':
-        messages.warning(request, f'Рецепт "{recipe.title}" не находится на модерации.')
+    recipe = get_object_or_404(Recipe.objects.only('pk', 'title'), pk=pk)
+    if not moderation.moderate([pk], request.user, approve=True):
+        messages.warning(request, f'Рецепт "{recipe.title}" не находится на модерации или взят другим модератором.')
     else:
-        recipe.status = 'published'
-        recipe.moderation_notes = None 
-        recipe.save()
         messages.success(request, f'Рецепт "{recipe.title}" одобрен и опубликован!')
     return redirect('admin_moderation_list')
 
@@ -575,32 +705,45 @@ def admin_approve_recipe_view(request, pk):
 @user_passes_test(lambda u: u.is_superuser)
 @require_POST
 def admin_reject_recipe_view(request, pk):
-    recipe = get_object_or_404(Recipe, pk=pk)
+    recipe = get_object_or_404(Recipe.objects.only('pk', 'title'), pk=pk)
     
     moderation_notes = request.POST.get('moderation_notes', 'Причина не указана.')
     
-    if recipe.status != 'pending':
-        messages.warning(request, f'Рецепт "{recipe.title}" не находится на модерации.')
+    if not moderation.moderate([pk], request.user, approve=False, notes=moderation_notes):
+        messages.warning(request, f'Рецепт "{recipe.title}" не находится на модерации или взят другим модератором.')
     else:
-        recipe.status = 'rejected' 
-        recipe.moderation_notes = moderation_notes
-        recipe.save()
         messages.info(request, f'Рецепт "{recipe.title}" отклонен и возвращен пользователю как черновик.')
         
     return redirect('admin_moderation_list')
 
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
+def admin_slow_queries_view(request):
+    if request.method == 'POST':
+        SlowQuery.objects.all().delete()
+        messages.success(request, 'Журнал медленных запросов очищен.')
+        return redirect('admin_slow_queries')
+
+    paginator = Paginator(SlowQuery.objects.order_by('-total_ms'), 50)
+    page = paginator.get_page(request.GET.get('page'))
+    context = {
+        'page': page,
+        'queries': page.object_list,
+        'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS,
+    }
+    return render(request, 'admin/slow_queries.html', context)
+
 # пользователи
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
 def admin_user_detail_view(request, pk):
-    user_to_view = get_object_or_404(User, pk=pk)
-    total_recipes = user_to_view.recipes.count()
-    total_favorites = Favorite.objects.filter(user=user_to_view).count()
+    user_to_view = get_object_or_404(User.objects.with_activity_counts(), pk=pk)
     
     context = {
         'profile_user': user_to_view,
-        'total_recipes': total_recipes,
-        'total_favorites': total_favorites,
+        'total_recipes': user_to_view.recipes_count,
+        'total_favorites': user_to_view.favorites_count,
+        'total_reviews': user_to_view.reviews_count,
     }
     return render(request, 'admin/user_detail.html', context)
 
@@ -614,6 +757,7 @@ def admin_user_edit_view(request, pk):
         form = AdminUserEditForm(request.POST, request.FILES, instance=user_to_edit)
         if form.is_valid():
             form.save()
+            snapshots.rebuild_for_author(user_to_edit)
             messages.success(request, f'Данные пользователя "{user_to_edit.email}" успешно обновлены.')
             return redirect('admin_users_list')
         else:
@@ -640,26 +784,23 @@ def admin_user_delete_view(request, pk):
         return redirect('admin_users_list')
         
     email = user_to_delete.email 
-    user_to_delete.delete()
-    messages.success(request, f'Пользователь "{email}" успешно удален.')
+    deletion.schedule_user(user_to_delete)
+    messages.success(request, f'Пользователь "{email}" удален. Его рецепты и файлы удаляются в фоновом режиме.')
     return redirect('admin_users_list')
 
 # отзывы
 
 @login_required
 def recipe_reviews_view(request, pk):
-    recipe = get_object_or_404(Recipe, pk=pk)
-    reviews = Review.objects.filter(recipe=recipe).select_related('user').order_by('-created_at') 
-    is_author = request.user == recipe.user
-    existing_review = None
-    user_has_reviewed = False
-    
-    if request.user.is_authenticated:
-        try:
-            existing_review = Review.objects.get(recipe=recipe, user=request.user)
-            user_has_reviewed = True
-        except Review.DoesNotExist:
-            pass
+    # Ограничение частоты проверяется до любых запросов к рецепту и отзывам
+    if request.method == 'POST' and reviews.throttled(request.user):
+        return HttpResponse('Слишком много отзывов подряд. Попробуйте через минуту.', status=429)
+
+    # Отзыв текущего пользователя приходит вместе с рецептом (см. recept/reviews.py)
+    recipe = get_object_or_404(reviews.with_own_review(Recipe.objects.all(), request.user), pk=pk)
+    is_author = request.user.is_authenticated and recipe.user_id == request.user.pk
+    own_review_id = getattr(recipe, 'own_review_id', None)
+    user_has_reviewed = own_review_id is not None
 
     if request.method == 'POST':
         # Валидация: Автор рецепта не может оставлять отзыв
@@ -667,14 +808,12 @@ def recipe_reviews_view(request, pk):
             messages.error(request, 'Автор рецепта не может оставлять на него отзыв. 🚫')
             return redirect('recipe_reviews', pk=pk) 
         
-        # Валидация: Редактирование или создание
-        form = ReviewForm(request.POST, instance=existing_review)
+        # Создание или редактирование - один атомарный upsert вместе с агрегатами оценок
+        form = ReviewForm(request.POST)
         
         if form.is_valid():
-            review = form.save(commit=False)
-            review.recipe = recipe
-            review.user = request.user
-            review.save()
+            reviews.submit(recipe.pk, request.user, form.cleaned_data['rating'], form.cleaned_data['comment'])
+            metrics.reviews_posted.inc()
             
             messages.success(request, 'Ваш отзыв успешно добавлен/обновлен! 👍')
             return redirect('recipe_reviews', pk=pk)
@@ -682,15 +821,27 @@ def recipe_reviews_view(request, pk):
             messages.error(request, 'Пожалуйста, исправьте ошибки в форме отзыва.')
     else:
         # Для GET-запроса, если отзыв есть, предзаполняем форму
-        initial_data = {'rating': existing_review.rating, 'comment': existing_review.comment} if existing_review else {}
+        initial_data = {'rating': recipe.own_rating, 'comment': recipe.own_comment} if user_has_reviewed else {}
         form = ReviewForm(initial=initial_data)
 
+    page, next_cursor = reviews.page(recipe.pk, request.GET.get('after'))
     context = {
         'recipe': recipe,
-        'reviews': reviews,
+        'reviews': page,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('after'),
+        'rating': reviews.histogram(recipe.pk),
         'form': form,
         'is_author': is_author,
         'user_has_reviewed': user_has_reviewed,
     }
     
-    return render(request, 'recipes/recipe_reviews.html', context)
\ No newline at end of file
+    return render(request, 'recipes/recipe_reviews.html', context)
+
+
+# метрики
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,138 @@
+"""
+Прогрев процесса после запуска.
+
+Первые запросы к свежему воркеру платят за то, что Django делает лениво: разбор и
+компиляцию шаблонов (cached loader хранит их в памяти процесса), заполнение
+URL-резолвера и компиляцию регулярных выражений маршрутов, шаблоны виджетов форм,
+кеши метаданных моделей, подключение к базе. run() делает это заранее.
+
+Шаги без базы (templates, urls, forms, models) выполняются при загрузке
+PrjRecept/wsgi.py или asgi.py, если WARMUP_ON_START = True, - то есть только в
+процессе сервера, а не в migrate или test. С preload_app gunicorn прогрев идёт
+один раз в мастере, и воркеры получают его после fork. Шаг caches - открыть
+соединение, получить версию каталога, заполнить кеш поиска для каталога без
+фильтров и собрать блоки главной, если их ещё нет, - заполняет память
+конкретного воркера, поэтому его выполняет хук post_worker_init из
+gunicorn.conf.py. Команда manage.py warmup прогревает только собственный процесс
+и полезна как проверка, что все шаблоны компилируются.
+"""
+import logging
+import time
+import uuid
+from pathlib import Path
+
+from django.apps import apps
+from django.db import connection
+from django.template import TemplateSyntaxError
+from django.template.loader import get_template
+from django.urls import NoReverseMatch, URLPattern, converters, resolve, reverse
+
+from . import forms, homefeed, search, urls
+from .models import HomeSection, RecipeStep
+
+logger = logging.getLogger('recept.warmup')
+
+SAMPLES = {
+    converters.IntConverter: 1,
+    converters.UUIDConverter: uuid.UUID(int=0),
+}
+
+
+def template_names():
+    root = Path(apps.get_app_config('recept').path) / 'templates'
+    return sorted(path.relative_to(root).as_posix() for path in root.rglob('*.html'))
+
+
+def warm_templates():
+    """Компилирует шаблоны приложения; возвращает их число, ошибки - исключением."""
+    failed = []
+    names = template_names()
+    for name in names:
+        try:
+            get_template(name)
+        except TemplateSyntaxError as e:
+            failed.append(f'{name}: {e}')
+    if failed:
+        raise TemplateSyntaxError('; '.join(failed))
+    return len(names)
+
+
+def sample_path(pattern):
+    kwargs = {
+        name: SAMPLES.get(type(converter), 'x')
+        for name, converter in getattr(pattern.pattern, 'converters', {}).items()
+    }
+    return reverse(pattern.name, kwargs=kwargs)
+
+
+def warm_urls():
+    """Строит и разбирает адрес каждого именованного маршрута recept/urls.py."""
+    count = 0
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        try:
+            resolve(sample_path(pattern))
+        except NoReverseMatch:
+            # Маршрут с собственным конвертером, которому не подошёл образец
+            logger.warning('Маршрут %s не прогрет: нет образца аргументов', pattern.name)
+            continue
+        count += 1
+    return count
+
+
+def warm_forms():
+    """Отрисовывает пустые наборы форм рецепта: загружаются шаблоны виджетов."""
+    formsets = [
+        forms.RecipeStepFormSet(queryset=RecipeStep.objects.none()),
+        forms.RecipeStepEditFormSet(queryset=RecipeStep.objects.none()),
+        forms.RecipeIngredientFormSet(prefix='ingr'),
+        forms.RecipeIngredientEditFormSet(prefix='ingr'),
+    ]
+    for formset in formsets:
+        str(formset)
+        str(formset.empty_form)
+    # Формы с выбором из базы (жанры) только создаются: отрисовка сделала бы запрос
+    for form_class in (forms.RecipeForm, forms.ReviewForm, forms.UserProfileForm, forms.UserLoginForm):
+        form_class()
+    return len(formsets)
+
+
+def warm_models():
+    """Заполняет кеши _meta (поля, обратные связи) всех моделей."""
+    models = apps.get_models()
+    for model in models:
+        model._meta.get_fields()
+        model._meta.related_objects
+    return len(models)
+
+
+def warm_caches():
+    """Соединение с базой, версия каталога, первая страница каталога и блоки главной."""
+    connection.ensure_connection()
+    search.recipe_ids('')
+    if not HomeSection.objects.exists():
+        homefeed.build()
+    return len(search.results.entries)
+
+
+OFFLINE_STEPS = {
+    'templates': warm_templates,
+    'urls': warm_urls,
+    'forms': warm_forms,
+    'models': warm_models,
+}
+DATABASE_STEPS = {'caches': warm_caches}
+STEPS = {**OFFLINE_STEPS, **DATABASE_STEPS}
+
+
+def run(database=True, offline=True):
+    """Выполняет шаги прогрева; возвращает {шаг: (число объектов, секунды)}."""
+    steps = {**(OFFLINE_STEPS if offline else {}), **(DATABASE_STEPS if database else {})}
+    results = {}
+    for name, step in steps.items():
+        started = time.perf_counter()
+        count = step()
+        results[name] = (count, time.perf_counter() - started)
+        logger.info('Прогрев %s: %d за %.1f мс', name, count, results[name][1] * 1000)
+    return results